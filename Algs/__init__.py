@@ -0,0 +1 @@
+"""Training, evaluation and tooling scripts; run them through the `sdwan-marl` command (see cli.py)."""
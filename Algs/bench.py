@@ -0,0 +1,202 @@
+"""
+Simulator throughput benchmarks.
+
+    python bench.py --out bench.json                      # run and save
+    python bench.py --out new.json --compare bench.json   # flag regressions
+
+Every benchmark reports one rate (higher is better): env steps/s for the
+environments and SB3 runs, resets/s for reset, and env steps/s with the
+callback attached for the loggers. Each is the best of --repeat runs, which
+is the least noisy figure on a shared machine. In compare mode any rate
+more than --threshold below the baseline is reported and the exit status
+is 1, so the script can gate a CI job.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import types
+
+import numpy as np
+from stable_baselines3 import DQN, PPO
+from stable_baselines3.common.vec_env import DummyVecEnv, VecMonitor
+
+from sdwan_env import CentralizedLearning, IndependentLearners, VecSDWANEnv
+from callbacks import CallbacksCL, CallbacksIL
+
+ENV_MODULES = {'cl': CentralizedLearning, 'il': IndependentLearners}
+
+
+def best_rate(fn, count, repeat):
+    """Best of `repeat` timings of fn(), as `count` units per second."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def bench_step(env, steps, repeat):
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, env.action_space.n, steps).tolist()
+
+    def run():
+        env.reset()
+        for a in actions:
+            if env.step(a)[2]:
+                env.reset()
+    return best_rate(run, steps, repeat)
+
+
+def bench_reset(env, resets, repeat):
+    def run():
+        for _ in range(resets):
+            env.reset()
+    return best_rate(run, resets, repeat)
+
+
+def bench_vec(venv, steps, repeat):
+    n = venv.num_envs
+    actions = np.random.default_rng(0).integers(0, venv.action_space.n, (steps, n))
+
+    def run():
+        venv.reset()
+        for a in actions:
+            venv.step(a)
+    return best_rate(run, steps * n, repeat)
+
+
+def bench_callback(callback, n_envs, steps, repeat):
+    # drive the callback the way SB3 does after every vec step, without a model
+    venv = VecMonitor(VecSDWANEnv(n_envs, max_steps=100, seed=0))
+    actions = np.random.default_rng(0).integers(0, venv.action_space.n, (steps, n_envs))
+    model = types.SimpleNamespace(num_timesteps=0, get_env=lambda: venv)
+
+    if callback is not None:
+        callback.model = model
+
+    def run():
+        venv.reset()
+        for a in actions:
+            obs, rewards, dones, infos = venv.step(a)
+            model.num_timesteps += n_envs
+            if callback is not None:
+                callback.update_locals({'infos': infos, 'dones': dones})
+                callback.on_step()
+    return best_rate(run, steps * n_envs, repeat)
+
+
+def bench_sb3(algo, n_envs, timesteps, repeat):
+    def run():
+        env = VecMonitor(VecSDWANEnv(n_envs, seed=0))
+        if algo == 'dqn':
+            model = DQN('MlpPolicy', env, seed=0, learning_starts=1000, train_freq=(4, 'step'),
+                        gradient_steps=n_envs, batch_size=128, device='cpu')
+        else:
+            model = PPO('MlpPolicy', env, seed=0, n_steps=2048 // n_envs, batch_size=64, device='cpu')
+        model.learn(timesteps)
+    return best_rate(run, timesteps, repeat)
+
+
+def run_benchmarks(args):
+    scale, repeat = args.scale, args.repeat
+    steps = int(20_000 * scale)
+    results = {}
+
+    def record(name, fn):
+        if args.only and not any(s in name for s in args.only):
+            return
+        results[name] = fn()
+        print(f'{name:<40s} {results[name]:14,.0f}/s', flush=True)
+
+    for mod_name, mod in ENV_MODULES.items():
+        for q_len in args.q_lens:
+            env = mod.SDWANEnv(q_len=q_len)
+            record(f'step/{mod_name}/q{q_len}', lambda: bench_step(env, steps, repeat))
+        record(f'reset/{mod_name}', lambda: bench_reset(mod.SDWANEnv(), steps, repeat))
+
+    base = IndependentLearners.SDWANEnv()
+    for branch in base.topology.branch_names:
+        env = IndependentLearners.IndependentBranchEnv(branch, base_env=base)
+        record(f'step/il_branch_{branch}', lambda: bench_step(env, steps, repeat))
+
+    for width in args.widths:
+        vec_steps = max(20, steps // width)
+        record(f'vec/dummy/n{width}',
+               lambda: bench_vec(DummyVecEnv([CentralizedLearning.SDWANEnv] * width), vec_steps, repeat))
+        record(f'vec/numpy/n{width}', lambda: bench_vec(VecSDWANEnv(width, seed=0), vec_steps, repeat))
+
+    cb_envs = 64
+    cb_steps = max(20, steps // cb_envs)
+    record('callback/none', lambda: bench_callback(None, cb_envs, cb_steps, repeat))
+    for cls in (CallbacksCL.EpisodeReturnLogger, CallbacksCL.CongestionLogger, CallbacksCL.JointActionLogger,
+                CallbacksIL.AgentAndTotalLogger, CallbacksIL.CongestionLogger):
+        name = f'callback/{cls.__module__.split(".")[-1]}.{cls.__name__}'
+        record(name, lambda: bench_callback(cls(), cb_envs, cb_steps, repeat))
+
+    if not args.skip_sb3:
+        sb3_steps = int(20_000 * scale)
+        for algo in ('dqn', 'ppo'):
+            record(f'sb3/{algo}/n16', lambda: bench_sb3(algo, 16, sb3_steps, 1))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Names whose rate dropped more than `threshold` (a fraction) below the baseline."""
+    regressions = []
+    for name, rate in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        change = rate / old - 1
+        flag = change < -threshold
+        print(f'{name:<40s} {old:14,.0f} -> {rate:14,.0f}  {change:+7.1%}{"  REGRESSION" if flag else ""}')
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='slowdown (fraction) that counts as a regression (default 0.10)')
+    parser.add_argument('--q-lens', type=int, nargs='+', default=[50, 500, 3000], help='queue lengths to step at')
+    parser.add_argument('--widths', type=int, nargs='+', default=[16, 64, 256], help='vector widths')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the number of steps per benchmark')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help='run only benchmarks whose name contains one of these')
+    parser.add_argument('--skip-sb3', action='store_true', help='skip the DQN/PPO end-to-end runs')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args)
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'scale': args.scale,
+        },
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print(f'\n=== compared with {args.compare} (threshold {args.threshold:.0%}) ===')
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s): {", ".join(regressions)}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Roll out behavior policies in the simulator and store the transitions as
+a memory-mapped dataset, for behavior cloning, offline RL and filling
+replay buffers without simulating.
+
+Every --policy (a baseline of evaluate.py or a saved model) plays
+--episodes episodes, in shards of --shard-episodes episodes that run in
+parallel worker processes; each shard is one VecSDWANEnv seeded with its
+episodes' seeds, so a dataset is reproducible shard by shard (a single
+episode only as part of its shard: the `episode` column numbers episodes,
+it does not seed them one by one). With
+--epsilon, each decision is replaced by a uniformly random joint action
+with that probability, to widen the data beyond the policy's own choices.
+
+    python build_dataset.py datasets/heuristics --policy shortest_queue --policy max_capacity \
+        --episodes 2000 --epsilon 0.1
+
+Shards already listed in the dataset's meta.json are kept, so rerunning an
+interrupted build with the same arguments only writes the missing ones;
+other policies, episode counts, shard sizes, seeds or topology are refused.
+Read it back with RolloutDataset:
+
+    from sdwan_env.RolloutDataset import RolloutDataset
+    data = RolloutDataset('datasets/heuristics')
+    for batch in data.batches(1024, seed=0): ...
+    data.fill_replay_buffer(model.replay_buffer)
+"""
+import argparse
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from sdwan_env import VecSDWANEnv
+from sdwan_env.Topology import Topology
+from sdwan_env.RolloutDataset import DatasetIndex, dataset_fields, write_shard
+from algs.evaluate import load_policy
+
+
+def rollout_shard(task):
+    """Play one shard's episodes with a behavior policy and write them; returns its index entry."""
+    path, name, policy, seeds, max_steps, epsilon, topology = task
+    act = load_policy(policy)
+    venv = VecSDWANEnv(len(seeds), max_steps, seed=list(seeds), topology=topology)
+    topo = venv.topology
+    rng = np.random.default_rng([seeds[0], len(seeds)])
+    n = len(seeds)
+    fields = dataset_fields(topo)
+    # (step, env) while rolling out; written env-major so every episode is contiguous
+    columns = {f: np.zeros((max_steps, n, width), dtype) for f, (dtype, width) in fields.items()}
+    obs = venv.reset()
+    for t in range(max_steps):
+        actions = np.asarray(act(topo, obs))
+        if epsilon:
+            explore = rng.random(n) < epsilon
+            actions = np.where(explore, rng.integers(0, topo.joint_size, n), actions)
+        columns['obs'][t] = obs
+        obs, rewards, dones, _ = venv.step(actions)
+        columns['action'][t, :, 0] = actions
+        columns['reward'][t, :, 0] = rewards
+        columns['next_obs'][t] = np.where(dones[:, None], venv.buf_terminal_obs, obs)
+        columns['done'][t, :, 0] = dones
+        columns['metrics'][t] = venv.buf_metrics
+    columns['episode'][:] = np.asarray(seeds)[None, :, None]
+    rows = write_shard(path, name, {f: c.swapaxes(0, 1).reshape(n * max_steps, -1) for f, c in columns.items()},
+                       fields)
+    return dict(name=name, rows=rows, policy=policy, seeds=[int(seeds[0]), int(seeds[-1])], episodes=n)
+
+
+def build_dataset(path, policies, episodes=1000, shard_episodes=64, max_steps=300, epsilon=0.0, first_seed=0,
+                  topology=None, processes=None, verbose=1):
+    """Write (or complete) the dataset under `path`; returns its DatasetIndex."""
+    topo = Topology(topology)
+    fields = dataset_fields(topo)
+    index = DatasetIndex(path, fields={f: [dtype.str, width] for f, (dtype, width) in fields.items()},
+                         info_keys=list(topo.info_keys), obs_size=topo.obs_size, max_steps=max_steps,
+                         policies=list(policies), epsilon=epsilon, topology=topo.config, episodes=episodes,
+                         shard_episodes=shard_episodes, first_seed=first_seed)
+    done = index.shards
+    tasks = []
+    for p, policy in enumerate(policies):
+        # policy p plays seeds first_seed + p * episodes onwards, so policies never share traffic seeds
+        base = first_seed + p * episodes
+        for s, start in enumerate(range(0, episodes, shard_episodes)):
+            name = f'{p:02d}-{s:05d}'
+            if name not in done:
+                seeds = range(base + start, base + min(start + shard_episodes, episodes))
+                tasks.append((path, name, policy, seeds, max_steps, epsilon, topology))
+    if verbose:
+        print(f'{len(tasks)} shards to write ({len(done)} already done)')
+    with mp.get_context('fork').Pool(processes or os.cpu_count()) as pool:
+        for shard in pool.imap_unordered(rollout_shard, tasks):
+            index.add(**shard)
+            if verbose:
+                print(f'  shard {shard["name"]}: {shard["rows"]} rows of {shard["policy"]}')
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='dataset directory')
+    parser.add_argument('--policy', action='append', required=True,
+                        help='behavior policy: a baseline name or [dqn:|ppo:]PATH (repeatable)')
+    parser.add_argument('--episodes', type=int, default=1000, help='episodes per policy')
+    parser.add_argument('--shard-episodes', type=int, default=64, help='episodes per shard (and worker task)')
+    parser.add_argument('--max-steps', type=int, default=300)
+    parser.add_argument('--epsilon', type=float, default=0.0, help='probability of a random action instead')
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, help='worker processes (default: all cores)')
+    args = parser.parse_args(argv)
+    index = build_dataset(args.path, args.policy, args.episodes, args.shard_episodes, args.max_steps,
+                          args.epsilon, args.first_seed, processes=args.processes)
+    rows = sum(s['rows'] for s in index.meta['shards'])
+    print(f'{args.path}: {len(index.meta["shards"])} shards, {rows} transitions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Calibration report of the fluid simulation mode against the exact one.
+
+Both modes replay the same traffic trace under the same action sequences
+(a few fixed policies), and the report compares per-step means of the
+reward, per-branch rewards and the per-overlay capacity left, loss, queue
+length and congestion, plus the correlation of the per-step total reward
+and the speed of each mode.
+
+    python calibrate_fluid.py --episodes 20 --out fluid_report.json
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from sdwan_env.CentralizedLearning import SDWANEnv
+from sdwan_env.TrafficTrace import generate_trace
+
+
+def policy_actions(name, env, shape, rng):
+    """(episodes, steps) array `shape` of the policy's joint actions; 'rotate' restarts every episode."""
+    n = env.action_space.n
+    if name == 'random':
+        return rng.integers(0, n, shape)
+    if name == 'rotate':
+        return np.broadcast_to(np.arange(shape[1]) % n, shape)
+    if name.startswith('fixed'):
+        return np.full(shape, int(name[len('fixed'):]))
+    raise ValueError(f'unknown policy {name!r}')
+
+
+def rollout(env, episodes, actions):
+    """Per-step metric columns over `episodes` trace episodes, and the wall time of stepping."""
+    topo = env.topology
+    s = topo.obs_slices
+    rows, elapsed = [], 0.0
+    for e in range(episodes):
+        env.reset(options={'episode': e})
+        start = time.perf_counter()
+        infos = []
+        for t in range(env.max_steps):
+            obs, _, _, _, info = env.step(int(actions[e, t]))
+            infos.append((info, obs[s['loss']], obs[s['queue_len']]))
+        elapsed += time.perf_counter() - start
+        rows.extend(infos)
+    metrics = {'total': np.array([i['total'] for i, _, _ in rows])}
+    for k in topo.reward_keys + topo.bw_keys + topo.congested_keys:
+        metrics[k] = np.array([i[k] for i, _, _ in rows])
+    for o, name in enumerate(topo.overlay_names):
+        metrics[f'loss_{name}'] = np.array([l[o] for _, l, _ in rows])
+        metrics[f'queue_len_{name}'] = np.array([q[o] for _, _, q in rows])
+    return metrics, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--episodes', type=int, default=20)
+    parser.add_argument('--max-steps', type=int, default=300)
+    parser.add_argument('--q-len', type=int, default=50)
+    parser.add_argument('--policies', nargs='+', default=['random', 'rotate', 'fixed0', 'fixed3'])
+    parser.add_argument('--trace', help='trace directory to replay (default: a fresh Poisson trace)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trace = args.trace or generate_trace(tmp, args.episodes, args.max_steps, seed=args.seed)
+        envs = {mode: SDWANEnv(args.max_steps, args.q_len, trace=trace, mode=mode) for mode in ('exact', 'fluid')}
+        report = {}
+        for policy in args.policies:
+            rng = np.random.default_rng(args.seed)
+            actions = policy_actions(policy, envs['exact'], (args.episodes, args.max_steps), rng)
+            results = {mode: rollout(env, args.episodes, actions) for mode, env in envs.items()}
+            (exact, t_exact), (fluid, t_fluid) = results['exact'], results['fluid']
+            steps = args.episodes * args.max_steps
+            entry = {
+                'steps_per_s': {'exact': steps / t_exact, 'fluid': steps / t_fluid},
+                'total_reward_corr': float(np.corrcoef(exact['total'], fluid['total'])[0, 1]),
+                'metrics': {},
+            }
+            print(f'\n=== policy {policy}: fluid {t_exact / t_fluid:.1f}x faster, '
+                  f'per-step total reward corr {entry["total_reward_corr"]:.3f} ===')
+            print(f'{"metric":<24s} {"exact":>10s} {"fluid":>10s} {"rel err":>9s}')
+            for k in exact:
+                a, b = float(exact[k].mean()), float(fluid[k].mean())
+                rel = (b - a) / abs(a) if a else float('nan')
+                entry['metrics'][k] = {'exact': a, 'fluid': b, 'rel_err': rel}
+                print(f'{k:<24s} {a:10.3f} {b:10.3f} {rel:+9.1%}')
+            report[policy] = entry
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
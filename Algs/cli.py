@@ -0,0 +1,49 @@
+"""
+sdwan-marl: one entry point for the simulator, training and tooling.
+
+    sdwan-marl simulate --policy shortest_queue --episodes 20
+    sdwan-marl train --algo dqn --timesteps 200000
+    sdwan-marl evaluate --model dqn_centralized_seeded.zip --seeds 500
+    sdwan-marl bench --out bench.json
+    sdwan-marl <command> --help
+
+Only the chosen command's module is imported, and simulate, trace and
+ingest never import torch or stable-baselines3, so they start in a
+fraction of a second.
+"""
+import argparse
+import importlib
+import sys
+
+# command -> (module with main(argv), summary)
+COMMANDS = {
+    'simulate': ('algs.simulate', 'run heuristic episodes in the simulator (no torch)'),
+    'trace': ('algs.generate_trace', 'draw a synthetic traffic trace'),
+    'ingest': ('algs.ingest_flow_logs', 'convert recorded flow logs into a trace'),
+    'train': ('algs.train_dqn_ppo', 'train centralized DQN / PPO'),
+    'train-il': ('algs.train_il_concurrent', 'train one independent learner per branch'),
+    'evaluate': ('algs.evaluate', 'evaluate models and baselines on held-out seeds'),
+    'bench': ('algs.bench', 'simulator and SB3 throughput benchmarks'),
+    'sweep': ('algs.sweep', 'successive-halving hyperparameter sweeps'),
+    'serve': ('algs.serve', 'serve a policy to live sites'),
+    'loadgen': ('algs.load_generator', 'drive a policy server with simulated sites'),
+    'dataset': ('algs.build_dataset', 'build an offline rollout dataset'),
+    'calibrate': ('algs.calibrate_fluid', 'check the fluid mode against exact mode'),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='sdwan-marl', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='commands:\n' + '\n'.join(f'  {name:<10s} {summary}' for name, (_, summary) in COMMANDS.items()))
+    parser.add_argument('command', choices=COMMANDS, metavar='command')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='arguments of the command')
+    args = parser.parse_args(argv)
+
+    module = importlib.import_module(COMMANDS[args.command][0])
+    sys.argv[0] = f'sdwan-marl {args.command}'  # for the command's usage line
+    return module.main(args.args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Evaluate saved centralized models and baseline heuristics on held-out seeds.
+
+Every policy plays one episode per seed in every traffic scenario. Seeds
+are split into chunks that run in parallel worker processes; each chunk is
+one VecSDWANEnv, so the policy sees the whole chunk's observations at once
+and inference is one batched call per step. Reported per policy and
+scenario: episode reward, congestion rate (share of steps an overlay is
+congested, over all overlays) and loss (requests lost per step, summed over
+overlays), as mean and 95% confidence interval over seeds. A chunk's
+simulator is seeded with all its seeds, so runs with the same --seeds,
+--first-seed and --chunk-size reproduce exactly.
+
+    python evaluate.py --model dqn_centralized_seeded.zip --model ppo_centralized_seeded.zip \
+        --seeds 500 --scenario nominal --scenario heavy --out eval.json
+
+Models are loaded as DQN or PPO from their file name (or an explicit
+dqn:PATH / ppo:PATH). Baselines (always_overlay1, shortest_queue,
+max_capacity) are included unless --no-baselines is given.
+"""
+import argparse
+import copy
+import json
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from sdwan_env.Topology import DEFAULT_TOPOLOGY
+
+# traffic scenarios: every branch's arrival rate scaled by this factor
+SCENARIOS = {'light': 0.5, 'nominal': 1.0, 'heavy': 1.5}
+
+
+def scenario_topology(name):
+    config = copy.deepcopy(DEFAULT_TOPOLOGY)
+    for branch in config['branches'].values():
+        branch['arrival_rate'] *= SCENARIOS[name]
+    return config
+
+
+# ---------------- baselines ----------------
+# Each maps a batch of observations (N, obs_size) to per-branch choices
+# (N, n_branches), looking only at the overlays every branch may use.
+
+def _pick(topo, scores, best):
+    choices = np.zeros((len(scores), topo.n_branches), np.int64)
+    for b in range(topo.n_branches):
+        options = scores[:, topo.choice_table[b, :topo.n_choices[b]]]
+        choices[:, b] = options.argmax(1) if best == 'max' else options.argmin(1)
+    return choices
+
+
+def always_overlay1(topo, obs):
+    # the first overlay wherever a branch can use it, its first choice otherwise
+    return _pick(topo, np.tile(np.arange(topo.n_overlays) == 0, (len(obs), 1)).astype(float), 'max')
+
+
+def shortest_queue(topo, obs):
+    return _pick(topo, obs[:, topo.obs_slices['queue_len']], 'min')
+
+
+def max_capacity(topo, obs):
+    return _pick(topo, obs[:, topo.obs_slices['available_capacity']], 'max')
+
+
+BASELINES = {f.__name__: f for f in (always_overlay1, shortest_queue, max_capacity)}
+
+
+def load_policy(spec):
+    """A callable obs -> flat joint actions for a baseline name or a dqn:/ppo: model path."""
+    if spec in BASELINES:
+        fn = BASELINES[spec]
+        return lambda topo, obs: topo.ravel(fn(topo, obs))
+    import torch
+    from stable_baselines3 import DQN, PPO
+    torch.set_num_threads(1)
+    algo, _, path = spec.partition(':') if spec.split(':', 1)[0] in ('dqn', 'ppo') else ('', '', spec)
+    if not algo:
+        base = os.path.basename(path).lower()
+        algo = 'dqn' if 'dqn' in base else 'ppo' if 'ppo' in base else None
+        if algo is None:
+            raise ValueError(f'cannot tell the algorithm of {path!r}; prefix it with dqn: or ppo:')
+    model = {'dqn': DQN, 'ppo': PPO}[algo].load(path, device='cpu')
+    return lambda topo, obs: model.predict(obs, deterministic=True)[0]
+
+
+# ---------------- evaluation ----------------
+def evaluate_chunk(task):
+    """One episode per seed of `seeds` for one policy and scenario; per-seed metric arrays."""
+    policy, scenario, seeds, max_steps = task
+    from sdwan_env import VecSDWANEnv
+    act = load_policy(policy)
+    venv = VecSDWANEnv(len(seeds), max_steps, seed=list(seeds), topology=scenario_topology(scenario))
+    topo = venv.topology
+    s = topo.obs_slices
+    n = len(seeds)
+    reward, congested, loss = np.zeros(n), np.zeros(n), np.zeros(n)
+    obs = venv.reset()
+    for _ in range(max_steps):
+        obs, rews, dones, _ = venv.step(act(topo, obs))
+        # all envs start together, so all of them finish on the last step
+        seen = np.where(dones[:, None], venv.buf_terminal_obs, obs)
+        reward += rews
+        congested += (seen[:, s['available_capacity']] <= topo.congestion_threshold).mean(1)
+        loss += seen[:, s['loss']].sum(1)
+    return policy, scenario, reward, congested / max_steps, loss / max_steps
+
+
+def summarize(values):
+    """Mean and normal-approximation 95% confidence interval over seeds."""
+    values = np.asarray(values, float)
+    mean = float(values.mean())
+    half = 1.96 * float(values.std(ddof=1)) / np.sqrt(len(values)) if len(values) > 1 else float('nan')
+    return {'mean': mean, 'ci95': [mean - half, mean + half], 'n': len(values)}
+
+
+def evaluate(policies, scenarios=('nominal',), seeds=range(10_000, 10_200), max_steps=300, chunk_size=64,
+             processes=None):
+    """{policy: {scenario: {metric: summarize(...)}}} over `seeds` (one episode each)."""
+    seeds = list(seeds)
+    tasks = [(p, sc, seeds[i:i + chunk_size], max_steps)
+             for p in policies for sc in scenarios for i in range(0, len(seeds), chunk_size)]
+    per_seed = {}
+    with mp.get_context('fork').Pool(processes or os.cpu_count()) as pool:
+        for policy, scenario, *metrics in pool.imap_unordered(evaluate_chunk, tasks):
+            acc = per_seed.setdefault((policy, scenario), [[], [], []])
+            for a, m in zip(acc, metrics):
+                a.append(m)
+    report = {}
+    for (policy, scenario), acc in per_seed.items():
+        values = [np.concatenate(a) for a in acc]
+        report.setdefault(policy, {})[scenario] = {
+            name: summarize(v) for name, v in zip(('reward', 'congestion_rate', 'loss'), values)}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', action='append', default=[], help='saved model, [dqn:|ppo:]PATH (repeatable)')
+    parser.add_argument('--no-baselines', action='store_true')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='traffic scenario (repeatable; default: nominal)')
+    parser.add_argument('--seeds', type=int, default=200, help='number of held-out seeds')
+    parser.add_argument('--first-seed', type=int, default=10_000)
+    parser.add_argument('--max-steps', type=int, default=300)
+    parser.add_argument('--chunk-size', type=int, default=64, help='envs per worker task')
+    parser.add_argument('--processes', type=int, help='worker processes (default: all cores)')
+    parser.add_argument('--out', help='write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    policies = list(args.model) + ([] if args.no_baselines else list(BASELINES))
+    report = evaluate(policies, args.scenario or ['nominal'], range(args.first_seed, args.first_seed + args.seeds),
+                      args.max_steps, args.chunk_size, args.processes)
+    for policy in policies:
+        for scenario, metrics in report[policy].items():
+            cells = '  '.join(f'{name} {m["mean"]:9.2f} [{m["ci95"][0]:9.2f}, {m["ci95"][1]:9.2f}]'
+                              for name, m in metrics.items())
+            print(f'{policy:<32s} {scenario:<8s} {cells}')
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
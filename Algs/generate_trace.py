@@ -0,0 +1,30 @@
+"""
+Draw a synthetic traffic trace for replay (see TrafficTrace.generate_trace).
+
+    sdwan-marl trace traces/default --episodes 1000 --seed 0
+"""
+import argparse
+import json
+
+from sdwan_env.TrafficTrace import generate_trace
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='trace directory to write')
+    parser.add_argument('--episodes', type=int, default=1000)
+    parser.add_argument('--max-steps', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--topology', help='JSON topology config (default: the built-in one)')
+    args = parser.parse_args(argv)
+
+    topology = None
+    if args.topology:
+        with open(args.topology) as f:
+            topology = json.load(f)
+    trace = generate_trace(args.path, args.episodes, args.max_steps, topology, args.seed)
+    print(f'{args.path}: {len(trace)} episodes of {trace.max_steps} steps, {len(trace.sizes)} flows')
+
+
+if __name__ == '__main__':
+    main()
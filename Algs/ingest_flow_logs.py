@@ -0,0 +1,53 @@
+"""
+Convert CSV flow exports into a traffic trace the envs can replay.
+
+    python ingest_flow_logs.py flows-*.csv --out traces/week1 \
+        --branch-column src_site --map hq=A --map store=B --step-seconds 1
+"""
+import argparse
+import json
+
+from sdwan_env.FlowLogs import ingest_flow_logs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='CSV files, read in the order given')
+    parser.add_argument('--out', required=True, help='trace directory to write')
+    parser.add_argument('--topology', help='JSON topology config (default: the built-in one)')
+    parser.add_argument('--map', action='append', default=[], metavar='VALUE=BRANCH',
+                        help='branch column value -> branch name (repeatable; default: values are branch names)')
+    parser.add_argument('--time-column', default='start')
+    parser.add_argument('--branch-column', default='branch')
+    parser.add_argument('--bytes-column', default='bytes')
+    parser.add_argument('--step-seconds', type=float, default=1.0)
+    parser.add_argument('--start-time', type=float, help='epoch seconds of step 0 (default: first row)')
+    parser.add_argument('--max-steps', type=int, default=300, help='steps per episode')
+    parser.add_argument('--lateness-steps', type=int, default=60,
+                        help='how far out of time order rows may arrive before they are dropped')
+    parser.add_argument('--max-gap-steps', type=int,
+                        help='drop rows this many steps past the newest one as corrupt (default: keep all)')
+    parser.add_argument('--chunksize', type=int, default=1_000_000, help='CSV rows per chunk')
+    args = parser.parse_args(argv)
+
+    topology = None
+    if args.topology:
+        with open(args.topology) as f:
+            topology = json.load(f)
+    branch_map = dict(m.split('=', 1) for m in args.map) or None
+    trace = ingest_flow_logs(
+        args.paths, args.out, topology, branch_map, max_steps=args.max_steps, step_seconds=args.step_seconds,
+        time_column=args.time_column, branch_column=args.branch_column, bytes_column=args.bytes_column,
+        start_time=args.start_time, lateness_steps=args.lateness_steps, chunksize=args.chunksize,
+        max_gap_steps=args.max_gap_steps,
+    )
+    m = trace.meta
+    print(f"{m['rows']} rows -> {trace.n_episodes} episodes of {trace.max_steps} steps "
+          f"({m['late_rows']} late, {m['unmapped_rows']} unmapped, {m['invalid_size_rows']} invalid sizes, "
+          f"{m['outlier_rows']} outliers, {m['dropped_tail_steps']} tail steps dropped)")
+    print('arrival_rate per branch:', m['arrival_rate'])
+    print('flow_size_mean per branch:', m['flow_size_mean'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Drive serve.py with simulated sites and measure decision latency.
+
+Every site is its own SDWANEnv and connection: it sends its observation,
+applies the action it gets back, and repeats --rate times a second (with
+a random phase, so sites do not all fire together). Reports round-trip
+latency percentiles as the sites saw them, the decision rate achieved and
+the server's own stats.
+
+    python load_generator.py --port 7070 --sites 300 --rate 10 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from sdwan_env import SDWANEnv
+
+
+async def run_site(i, args, latencies, deadline):
+    env = SDWANEnv(topology=args.topology, info_mode='compact')
+    obs, _ = env.reset(seed=args.seed + i)
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    period = 1 / args.rate
+    rng = np.random.default_rng(args.seed + i)
+    await asyncio.sleep(period * rng.random())
+    next_send = time.perf_counter()
+    n = 0
+    try:
+        while time.perf_counter() < deadline:
+            sent = time.perf_counter()
+            writer.write(json.dumps({'id': n, 'obs': obs.tolist()}).encode() + b'\n')
+            reply = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - sent)
+            if 'error' in reply:
+                raise RuntimeError(f'site {i}: {reply["error"]}')
+            obs, _, terminated, truncated, _ = env.step(reply['action'])
+            if terminated or truncated:
+                obs, _ = env.reset()
+            n += 1
+            next_send += period
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+    finally:
+        writer.close()
+    return n
+
+
+async def server_stats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'{"op": "stats"}\n')
+    stats = json.loads(await reader.readline())
+    writer.close()
+    return stats
+
+
+async def generate(args):
+    latencies = []
+    started = time.perf_counter()
+    counts = await asyncio.gather(*(run_site(i, args, latencies, started + args.duration)
+                                    for i in range(args.sites)))
+    elapsed = time.perf_counter() - started
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    report = {'sites': args.sites, 'decisions': sum(counts), 'decisions_per_s': sum(counts) / elapsed,
+              'p50_ms': float(p50), 'p99_ms': float(p99), 'server': await server_stats(args.host, args.port)}
+    print(json.dumps(report, indent=2))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7070)
+    parser.add_argument('--sites', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=10.0, help='decisions per second per site')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--topology', help='JSON topology config (default: the built-in one)')
+    args = parser.parse_args(argv)
+    if args.topology:
+        with open(args.topology) as f:
+            args.topology = json.load(f)
+    asyncio.run(generate(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""
+Serve a trained centralized policy to live sites over TCP.
+
+Every site sends one observation per decision as a line of JSON and gets
+its action back on the same connection, in whatever order decisions
+finish:
+
+    -> {"id": 17, "obs": [12 floats]}
+    <- {"id": 17, "action": 3, "choices": [1, 1], "overlays": ["Overlay2", "Overlay3"], "version": 1}
+
+`action` is the flat joint action, `choices` each branch's choice index
+and `overlays` the overlay each branch should use. Requests from all
+connections are micro-batched: the first one to arrive opens a batch,
+which runs as one forward pass when it has --max-batch observations or
+--max-delay milliseconds after it opened, whichever comes first. A
+request that is not a JSON object, or whose obs is not a list of that many
+finite numbers, is answered with {"id": ..., "error": ...} on its own and
+never reaches a batch.
+
+The model file is checked every --watch seconds and reloaded in a thread
+when it changes; the new policy takes over between two batches, so no
+request is dropped or answered by a half-loaded model (a file that fails
+to load, e.g. mid-write, is retried on the next check). {"op": "stats"}
+returns the decision latency percentiles (from a request being read to
+its action being sent, over the last --window decisions) and batch sizes,
+{"op": "reload"} forces a reload. Stats are also printed every
+--report seconds.
+
+    python serve.py dqn_centralized_seeded.zip --port 7070 --max-batch 256 --max-delay 2
+    python load_generator.py --port 7070 --sites 300 --rate 10 --duration 30
+
+Any policy evaluate.py accepts works, including the baselines
+(shortest_queue, ...) for testing without a model.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+
+from sdwan_env.Topology import Topology
+from algs.evaluate import BASELINES, load_policy
+
+
+def parse_obs(obs, obs_size):
+    """`obs` from a request as float32[obs_size]; ValueError unless it is a list of that many finite numbers."""
+    if not isinstance(obs, list) or len(obs) != obs_size \
+            or not all(type(x) in (int, float) for x in obs):
+        raise ValueError(f'obs must be a list of {obs_size} numbers')
+    obs = np.array(obs, np.float32)
+    if not np.isfinite(obs).all():
+        raise ValueError(f'obs must be a list of {obs_size} finite numbers')
+    return obs
+
+
+class LatencyWindow:
+    """The last `size` decision latencies (seconds) and batch sizes, in ring buffers."""
+
+    def __init__(self, size=100_000):
+        self.latency = np.zeros(size)
+        self.batches = np.zeros(size, np.int64)
+        self.decisions = self.n_batches = 0
+
+    def add(self, latencies):
+        n = len(self.latency)
+        idx = np.arange(self.decisions, self.decisions + len(latencies)) % n
+        self.latency[idx] = latencies
+        self.batches[self.n_batches % n] = len(latencies)
+        self.decisions += len(latencies)
+        self.n_batches += 1
+
+    def summary(self):
+        latency = self.latency[:min(self.decisions, len(self.latency))]
+        batches = self.batches[:min(self.n_batches, len(self.batches))]
+        if not len(latency):
+            return {'decisions': 0, 'batches': 0}
+        p50, p99 = np.percentile(latency, [50, 99]) * 1000
+        return {'decisions': self.decisions, 'batches': self.n_batches, 'p50_ms': float(p50),
+                'p99_ms': float(p99), 'max_ms': float(latency.max() * 1000), 'mean_batch': float(batches.mean())}
+
+
+class PolicyServer:
+    def __init__(self, spec, topology=None, max_batch=256, max_delay=0.002, watch=1.0, window=100_000):
+        self.spec = spec
+        self.topology = topology if isinstance(topology, Topology) else Topology(topology)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.watch = watch
+        self.stats = LatencyWindow(window)
+        # the model file to watch; None for a baseline
+        self.path = None if spec in BASELINES else spec.split(':', 1)[-1]
+        self._mtime = self._stat()
+        self.policy = load_policy(spec)
+        self.version = 1
+        self._obs, self._futures, self._started = [], [], []
+        self._timer = None
+        self._reloading = None
+
+    def _stat(self):
+        return os.stat(self.path).st_mtime_ns if self.path else None
+
+    # ---------------- batching ----------------
+    def submit(self, obs, started):
+        """A future of the action dict for one parse_obs() observation, decided with the next batch."""
+        future = asyncio.get_running_loop().create_future()
+        self._obs.append(obs)
+        self._futures.append(future)
+        self._started.append(started)
+        if len(self._obs) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        obs, futures, started = self._obs, self._futures, self._started
+        self._obs, self._futures, self._started = [], [], []
+        if not obs:
+            return
+        topo = self.topology
+        try:
+            # every observation was checked by parse_obs(), so only the policy can fail here
+            actions = np.asarray(self.policy(topo, np.stack(obs)))
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        # joint-action models give (N,), factorized ones (N, n_branches)
+        choices = actions if actions.ndim == 2 else topo.unravel(actions)
+        joint = topo.ravel(choices) if actions.ndim == 2 else actions
+        overlays = topo.overlays_of(choices)
+        names = topo.overlay_names
+        for future, j, c, o in zip(futures, joint.tolist(), choices.tolist(), overlays.tolist()):
+            if not future.cancelled():
+                future.set_result({'action': j, 'choices': c, 'overlays': [names[i] for i in o],
+                                   'version': self.version})
+        now = time.perf_counter()
+        self.stats.add(now - np.array(started))
+
+    # ---------------- reloading ----------------
+    async def reload(self):
+        """Load the model file again in a thread and switch to it; the old policy serves meanwhile."""
+        if self.path is None:
+            return False
+        if self._reloading is None:
+            self._reloading = asyncio.ensure_future(self._reload())
+        try:
+            return await asyncio.shield(self._reloading)
+        finally:
+            self._reloading = None
+
+    async def _reload(self):
+        mtime = self._stat()
+        try:
+            policy = await asyncio.get_running_loop().run_in_executor(None, load_policy, self.spec)
+        except Exception as e:
+            print(f'reload of {self.path} failed, keeping version {self.version}: {e!r}')
+            return False
+        # between batches: everything still queued is decided by the new policy
+        self.policy, self._mtime = policy, mtime
+        self.version += 1
+        print(f'loaded {self.path} as version {self.version}')
+        return True
+
+    async def watch_model(self):
+        while True:
+            await asyncio.sleep(self.watch)
+            try:
+                changed = self._stat() != self._mtime
+            except FileNotFoundError:
+                continue  # being replaced
+            if changed:
+                await self.reload()
+
+    async def report(self, every):
+        while True:
+            await asyncio.sleep(every)
+            print(json.dumps(dict(self.stats.summary(), version=self.version)))
+
+    # ---------------- connections ----------------
+    async def handle(self, reader, writer):
+        obs_size = self.topology.obs_size
+
+        def reply(message):
+            writer.write(json.dumps(message).encode() + b'\n')
+
+        def deliver(rid, future):
+            if future.cancelled():
+                return
+            error = future.exception()
+            reply({'id': rid, 'error': repr(error)} if error else dict(id=rid, **future.result()))
+
+        try:
+            while line := await reader.readline():
+                started = time.perf_counter()
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    reply({'error': 'request is not JSON'})
+                    continue
+                if not isinstance(request, dict):
+                    reply({'error': 'request is not a JSON object'})
+                    continue
+                rid = request.get('id')
+                try:
+                    op = request.get('op', 'decide')
+                    if op == 'stats':
+                        reply(dict(id=rid, version=self.version, **self.stats.summary()))
+                    elif op == 'reload':
+                        reply({'id': rid, 'reloaded': await self.reload(), 'version': self.version})
+                    elif op != 'decide':
+                        reply({'id': rid, 'error': f'unknown op {op!r}'})
+                    else:
+                        obs = parse_obs(request.get('obs'), obs_size)
+                        self.submit(obs, started).add_done_callback(lambda f, rid=rid: deliver(rid, f))
+                except (ValueError, TypeError, AttributeError) as e:
+                    # a bad request only fails itself, never the connection or its batch
+                    reply({'id': rid, 'error': str(e)})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=7070, report_every=10.0):
+        server = await asyncio.start_server(self.handle, host, port)
+        tasks = [asyncio.ensure_future(self.watch_model())] if self.path else []
+        if report_every:
+            tasks.append(asyncio.ensure_future(self.report(report_every)))
+        print(f'serving {self.spec} on {host}:{port}')
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('policy', help='saved model, [dqn:|ppo:]PATH, or a baseline name')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7070)
+    parser.add_argument('--topology', help='JSON topology config (default: the built-in one)')
+    parser.add_argument('--max-batch', type=int, default=256, help='observations per forward pass at most')
+    parser.add_argument('--max-delay', type=float, default=2.0,
+                        help='ms a request may wait for its batch to fill (the latency budget)')
+    parser.add_argument('--watch', type=float, default=1.0, help='seconds between model file checks')
+    parser.add_argument('--window', type=int, default=100_000, help='decisions in the latency percentiles')
+    parser.add_argument('--report', type=float, default=10.0, help='seconds between stats lines (0: never)')
+    args = parser.parse_args(argv)
+
+    import torch
+    torch.set_num_threads(1)  # small batches: threading costs more than it gains
+    topology = None
+    if args.topology:
+        with open(args.topology) as f:
+            topology = json.load(f)
+    server = PolicyServer(args.policy, topology, args.max_batch, args.max_delay / 1000, args.watch, args.window)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.report))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Run episodes of the simulator under a heuristic policy, without any ML
+dependency: only numpy and gymnasium are imported, so a run starts in a
+fraction of a second (a saved model as --policy loads SB3 as usual).
+
+    sdwan-marl simulate --policy shortest_queue --episodes 20 --mode fluid --out sim.json
+
+Reports per policy the mean episode reward, congestion rate (share of
+steps an overlay is congested, over all overlays), loss (requests lost per
+step, summed over overlays) and simulated steps per second.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from sdwan_env.CentralizedLearning import MODES, SDWANEnv
+from algs.evaluate import BASELINES, load_policy
+
+
+def random_policy(seed):
+    rng = np.random.default_rng(seed)
+    return lambda topo, obs: rng.integers(0, topo.joint_size, len(obs))
+
+
+def simulate(policy='shortest_queue', episodes=10, max_steps=300, seed=0, mode='exact', topology=None, trace=None):
+    """Per-episode reward, congestion rate and loss of `policy` (a baseline, 'random' or a model)."""
+    act = random_policy(seed) if policy == 'random' else load_policy(policy)
+    env = SDWANEnv(max_steps, topology=topology, trace=trace, mode=mode, info_mode='compact', inplace_obs=True)
+    topo = env.topology
+    s = topo.obs_slices
+    reward, congested, loss = np.zeros(episodes), np.zeros(episodes), np.zeros(episodes)
+    started = time.perf_counter()
+    for e in range(episodes):
+        obs, _ = env.reset(seed=seed + e)
+        done = False
+        while not done:
+            obs, r, done, _, _ = env.step(int(np.asarray(act(topo, obs[None]))[0]))
+            reward[e] += r
+            congested[e] += (obs[s['available_capacity']] <= topo.congestion_threshold).mean()
+            loss[e] += obs[s['loss']].sum()
+    elapsed = time.perf_counter() - started
+    return {'reward': reward, 'congestion_rate': congested / max_steps, 'loss': loss / max_steps,
+            'steps_per_s': episodes * max_steps / elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--policy', action='append',
+                        help=f'{", ".join(BASELINES)}, random or [dqn:|ppo:]PATH (repeatable; default: all baselines)')
+    parser.add_argument('--episodes', type=int, default=10)
+    parser.add_argument('--max-steps', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0, help='episode e is seeded with seed + e')
+    parser.add_argument('--mode', choices=MODES, default='exact')
+    parser.add_argument('--topology', help='JSON topology config (default: the built-in one)')
+    parser.add_argument('--trace', help='replay this traffic trace directory instead of drawing traffic')
+    parser.add_argument('--out', help='write per-episode results to this JSON file')
+    args = parser.parse_args(argv)
+
+    topology = None
+    if args.topology:
+        with open(args.topology) as f:
+            topology = json.load(f)
+    report = {}
+    for policy in args.policy or list(BASELINES):
+        result = simulate(policy, args.episodes, args.max_steps, args.seed, args.mode, topology, args.trace)
+        report[policy] = {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in result.items()}
+        means = '  '.join(f'{k} {np.mean(v):9.2f}' for k, v in result.items() if k != 'steps_per_s')
+        print(f'{policy:<24s} {means}  ({result["steps_per_s"]:,.0f} steps/s)')
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+Hyperparameter, reward-weight and traffic sweeps with successive halving.
+
+The grid is a JSON object of lists; every combination is one trial:
+
+    {
+      "algo": ["dqn", "ppo"],
+      "learning_rate": [1e-4, 3e-4],
+      "dqn.exploration_fraction": [0.1, 0.2],
+      "ppo.n_steps": [64, 128],
+      "reward.comp": [1.0, 2.0],
+      "traffic.arrival_scale": [1.0, 1.5],
+      "seed": [0, 1]
+    }
+
+Plain keys are SB3 constructor arguments for every algorithm, dqn.* and
+ppo.* only for that one (and only multiply that algorithm's trials);
+reward.* are the env's reward weights (bw, loss, comp); traffic.* scale
+every branch's arrival_rate or flow_size_mean (arrival_scale,
+flow_size_scale) or set congestion_threshold. Anything not in the grid
+keeps the train_dqn_ppo.py value.
+
+Trials run in rungs of min_timesteps * eta^k timesteps, up to
+max_timesteps, over a pool of worker processes. After each rung a trial
+is scored by the mean total return of the last `window` episodes its
+EpisodeReturnLogger saw, and only the best 1/eta go on to the next rung,
+continuing from their checkpoint. Returns under different reward weights
+or traffic are not comparable, so trials are only ranked against those
+with the same reward.* and traffic.* values, and each such scenario keeps
+its best trials. Every result is stored in an SQLite file
+in the sweep directory as it comes in, so an interrupted sweep run again
+with the same grid picks up where it stopped.
+
+    python sweep.py grid.json --dir sweeps/lr --min-timesteps 20000 --max-timesteps 180000 --eta 3
+    python sweep.py grid.json --dir sweeps/lr --report
+"""
+import argparse
+import copy
+import itertools
+import json
+import math
+import multiprocessing as mp
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from sdwan_env.Topology import DEFAULT_TOPOLOGY, DEFAULT_REWARD_WEIGHTS
+from algs.train_dqn_ppo import HYPERPARAMS, hyperparams
+
+TRAFFIC = ('arrival_scale', 'flow_size_scale', 'congestion_threshold')
+
+
+# ---------------- grid ----------------
+def expand_grid(grid):
+    """One {key: value} trial config per combination of the grid's values."""
+    grid = dict(grid)
+    algos = grid.pop('algo', ['dqn'])
+    trials = []
+    for algo in algos:
+        if algo not in HYPERPARAMS:
+            raise ValueError(f'unknown algorithm {algo!r}; expected one of {sorted(HYPERPARAMS)}')
+        keys = [k for k in grid if '.' not in k or k.split('.', 1)[0] in ('reward', 'traffic', algo)]
+        for values in itertools.product(*(grid[k] for k in keys)):
+            config = {'algo': algo}
+            for k, v in zip(keys, values):
+                config[k.split('.', 1)[1] if k.startswith(algo + '.') else k] = v
+            check_config(config)
+            trials.append(config)
+    return trials
+
+
+def check_config(config):
+    for key in config:
+        group, _, name = key.partition('.')
+        if group == 'reward' and name not in DEFAULT_REWARD_WEIGHTS:
+            raise ValueError(f'unknown reward weight {key!r}; expected reward.{{{",".join(DEFAULT_REWARD_WEIGHTS)}}}')
+        if group == 'traffic' and name not in TRAFFIC:
+            raise ValueError(f'unknown traffic parameter {key!r}; expected traffic.{{{",".join(TRAFFIC)}}}')
+        if '.' in key and group not in ('reward', 'traffic'):
+            raise ValueError(f'{key!r} is for {group}, not {config["algo"]}')
+
+
+def scenario(config):
+    """The reward and traffic settings of a trial: only trials with the same ones are ranked together."""
+    return tuple(sorted((k, v) for k, v in config.items() if k.partition('.')[0] in ('reward', 'traffic')))
+
+
+def trial_topology(config):
+    topology = copy.deepcopy(DEFAULT_TOPOLOGY)
+    topology['reward_weights'] = dict(DEFAULT_REWARD_WEIGHTS)
+    for key, value in config.items():
+        group, _, name = key.partition('.')
+        if group == 'reward':
+            topology['reward_weights'][name] = value
+        elif name == 'congestion_threshold':
+            topology['congestion_threshold'] = value
+        elif group == 'traffic':
+            field = {'arrival_scale': 'arrival_rate', 'flow_size_scale': 'flow_size_mean'}[name]
+            for branch in topology['branches'].values():
+                branch[field] *= value
+    return topology
+
+
+def trial_hyperparams(config, n_envs):
+    params = {k: v for k, v in config.items() if k not in ('algo', 'seed') and '.' not in k}
+    if isinstance(params.get('train_freq'), list):
+        params['train_freq'] = tuple(params['train_freq'])  # JSON has no tuples
+    return hyperparams(config['algo'], n_envs, **params)
+
+
+def rungs(min_timesteps, max_timesteps, eta):
+    """Cumulative timestep budget of every rung: min_timesteps * eta^k, the last one max_timesteps."""
+    n = int(math.floor(math.log(max_timesteps / min_timesteps, eta) + 1e-9)) + 1
+    budgets = [int(min_timesteps * eta ** k) for k in range(n)]
+    budgets[-1] = max_timesteps
+    return budgets
+
+
+# ---------------- store ----------------
+class SweepStore:
+    """Trials and their per-rung results in `<dir>/sweep.sqlite`; only the parent process writes."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, 'sweep.sqlite'))
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS trials (id INTEGER PRIMARY KEY, config TEXT UNIQUE);
+            CREATE TABLE IF NOT EXISTS results (
+                trial INTEGER, rung INTEGER, timesteps INTEGER, score REAL, episodes INTEGER, seconds REAL,
+                PRIMARY KEY (trial, rung));
+        """)
+
+    def trial_ids(self, configs):
+        """Id of every config, adding the new ones; a config keeps its id across runs."""
+        keys = [json.dumps(c, sort_keys=True) for c in configs]
+        with self.db:
+            self.db.executemany('INSERT OR IGNORE INTO trials (config) VALUES (?)', [(k,) for k in keys])
+        ids = dict(self.db.execute('SELECT config, id FROM trials'))
+        return [ids[k] for k in keys]
+
+    def add_result(self, trial, rung, timesteps, score, episodes, seconds):
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)',
+                            (trial, rung, timesteps, score, episodes, seconds))
+
+    def scores(self, rung):
+        return dict(self.db.execute('SELECT trial, score FROM results WHERE rung = ?', (rung,)))
+
+    def leaderboard(self):
+        """(trial, config, rung, timesteps, score) of every trial at its last rung, best first."""
+        rows = self.db.execute("""
+            SELECT t.id, t.config, r.rung, r.timesteps, r.score FROM trials t JOIN results r ON r.trial = t.id
+            WHERE r.rung = (SELECT MAX(rung) FROM results WHERE trial = t.id)
+            ORDER BY r.rung DESC, r.score DESC""")
+        return [(trial, json.loads(config), rung, timesteps, score) for trial, config, rung, timesteps, score in rows]
+
+
+# ---------------- trials ----------------
+def _checkpoint(directory, trial, rung):
+    return os.path.join(directory, f'trial{trial}', f'rung{rung}')
+
+
+def run_trial(task):
+    """Train one trial from its previous rung's checkpoint up to this rung's budget and score it."""
+    trial, config, rung, budget, previous, directory, n_envs, window = task
+    import torch
+    from stable_baselines3 import DQN, PPO
+    from stable_baselines3.common.vec_env import VecMonitor
+    from sdwan_env import VecSDWANEnv
+    from sdwan_env.CompactReplayBuffer import CompactReplayBuffer
+    from callbacks import EpisodeReturnLogger
+    torch.set_num_threads(1)
+
+    started = time.perf_counter()
+    topology = trial_topology(config)
+    # a fresh traffic stream (and exploration) every rung, the same one every
+    # run: SB3 seeds the env with the model's seed, on creation and on load
+    seed = int(np.random.SeedSequence([config.get('seed', 0), rung]).generate_state(1)[0])
+    env = VecMonitor(VecSDWANEnv(n_envs, topology=topology))
+    algo = {'dqn': DQN, 'ppo': PPO}[config['algo']]
+    checkpoint = _checkpoint(directory, trial, rung)
+    if rung == 0:
+        params = trial_hyperparams(config, n_envs)
+        if config['algo'] == 'dqn':
+            params.update(replay_buffer_class=CompactReplayBuffer, replay_buffer_kwargs=dict(topology=topology))
+        model = algo('MlpPolicy', env, seed=seed, verbose=0, **params)
+    else:
+        last = _checkpoint(directory, trial, rung - 1)
+        model = algo.load(last + '.zip', env=env, device='cpu')
+        model.set_random_seed(seed)
+        if config['algo'] == 'dqn':
+            model.load_replay_buffer(last + '_replay.pkl')
+    logger = EpisodeReturnLogger()
+    model.learn(budget - previous, callback=logger, reset_num_timesteps=rung == 0)
+    os.makedirs(os.path.dirname(checkpoint), exist_ok=True)
+    model.save(checkpoint + '.zip')
+    if config['algo'] == 'dqn':
+        model.save_replay_buffer(checkpoint + '_replay.pkl')
+    returns = logger.tot_returns[-window:]
+    score = float(np.mean(returns)) if returns else -math.inf
+    return trial, rung, model.num_timesteps, score, len(logger.tot_returns), time.perf_counter() - started
+
+
+def _drop_checkpoint(directory, trial, rung):
+    for suffix in ('.zip', '_replay.pkl'):
+        path = _checkpoint(directory, trial, rung) + suffix
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def sweep(grid, directory, min_timesteps=20_000, max_timesteps=180_000, eta=3, n_envs=16, window=20,
+          processes=None, verbose=1):
+    """Run (or resume) a successive-halving sweep over `grid`; returns SweepStore.leaderboard()."""
+    configs = expand_grid(grid)
+    store = SweepStore(directory)
+    ids = store.trial_ids(configs)
+    config_of = dict(zip(ids, configs))
+    budgets = rungs(min_timesteps, max_timesteps, eta)
+    alive = list(ids)
+    with mp.get_context('fork').Pool(processes or os.cpu_count(), maxtasksperchild=1) as pool:
+        for rung, budget in enumerate(budgets):
+            done = store.scores(rung)
+            previous = budgets[rung - 1] if rung else 0
+            tasks = [(t, config_of[t], rung, budget, previous, directory, n_envs, window)
+                     for t in alive if t not in done]
+            if verbose:
+                print(f'rung {rung}: {len(alive)} trials to {budget} timesteps ({len(alive) - len(tasks)} done)')
+            for result in pool.imap_unordered(run_trial, tasks):
+                store.add_result(*result)
+                if rung:
+                    _drop_checkpoint(directory, result[0], rung - 1)
+                if verbose:
+                    print(f'  trial {result[0]:4d} score {result[3]:10.2f} ({result[5]:.0f}s) {config_of[result[0]]}')
+            if rung + 1 < len(budgets):
+                scores = store.scores(rung)
+                groups = {}
+                for t in alive:
+                    groups.setdefault(scenario(config_of[t]), []).append(t)
+                keep = []
+                for group in groups.values():
+                    ranked = sorted(group, key=lambda t: (-scores[t], t))
+                    keep += ranked[:max(1, len(group) // eta)]
+                    for t in ranked[max(1, len(group) // eta):]:
+                        _drop_checkpoint(directory, t, rung)
+                alive = sorted(keep)
+    return store.leaderboard()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('grid', help='JSON file of {key: [values]}')
+    parser.add_argument('--dir', required=True, help='sweep directory: results store and checkpoints')
+    parser.add_argument('--min-timesteps', type=int, default=20_000, help='budget of the first rung')
+    parser.add_argument('--max-timesteps', type=int, default=180_000, help='budget of the last rung')
+    parser.add_argument('--eta', type=int, default=3, help='keep the best 1/eta trials after every rung')
+    parser.add_argument('--n-envs', type=int, default=16)
+    parser.add_argument('--window', type=int, default=20, help='episodes averaged into a score')
+    parser.add_argument('--processes', type=int, help='worker processes (default: all cores)')
+    parser.add_argument('--report', action='store_true', help='only print the stored results')
+    args = parser.parse_args(argv)
+
+    with open(args.grid) as f:
+        grid = json.load(f)
+    if args.report:
+        board = SweepStore(args.dir).leaderboard()
+    else:
+        board = sweep(grid, args.dir, args.min_timesteps, args.max_timesteps, args.eta, args.n_envs, args.window,
+                      args.processes)
+    for trial, config, rung, timesteps, score in board:
+        print(f'trial {trial:4d} rung {rung} {timesteps:9d} steps  score {score:10.2f}  {config}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,68 +1,126 @@
-import numpy as np
+"""
+Train centralized DQN and PPO agents on VecSDWANEnv and save them.
+
+    python train_dqn_ppo.py                          # both, 100k timesteps each
+    python train_dqn_ppo.py --algo ppo --timesteps 500000 --n-envs 64
+
+Saves dqn_centralized_seeded.zip / ppo_centralized_seeded.zip (in --out-dir),
+streams the episode returns, congestion counts and joint actions to Parquet
+under <name>_logs/ next to them, and prints the per-episode congestion of
+every run.
+
+With --checkpoint-dir, the whole run (model, replay buffer, env, RNGs and
+loggers) is checkpointed every --checkpoint-every timesteps, in the
+background and incrementally (see callbacks.Checkpoint). Running the same
+command again with --resume continues each algorithm from its newest
+checkpoint exactly as the interrupted run would have gone on:
+
+    python train_dqn_ppo.py --algo dqn --timesteps 2000000 --checkpoint-dir ckpt --resume
+"""
+import argparse
+import os
 import random
-import torch
-from stable_baselines3 import DQN, PPO
-from stable_baselines3.common.vec_env import DummyVecEnv
-from stable_baselines3.common.monitor import Monitor
-from sdwan_env import SDWANEnv
-from callbacks import EpisodeReturnLogger, CongestionLogger, JointActionLogger
-
-SEED = 42
-total_timesteps = 100_000
-
-random.seed(SEED)
-np.random.seed(SEED)
-torch.manual_seed(SEED)
-
-env = DummyVecEnv([lambda: Monitor(SDWANEnv())])
-
-# DQN Training
-logger_dqn = EpisodeReturnLogger()
-cong_dqn = CongestionLogger()
-jointlog_dqn = JointActionLogger()
-
-model_dqn = DQN(
-    'MlpPolicy', env, seed=SEED,
-    learning_rate=1e-4,
-    buffer_size=500_000,
-    batch_size=128,
-    gamma=0.99,
-    exploration_fraction=0.2,
-    exploration_initial_eps=1.0,
-    exploration_final_eps=0.02,
-    train_freq=(4, 'step'),
-    target_update_interval=1000,
-    verbose=1,
-    tensorboard_log="./dqn_centralized_seeded/"
-)
-
-model_dqn.learn(total_timesteps, callback=[logger_dqn, cong_dqn, jointlog_dqn])
-model_dqn.save('dqn_centralized_seeded')
-
-# PPO Training
-logger_ppo = EpisodeReturnLogger()
-cong_ppo = CongestionLogger()
-jointlog_ppo = JointActionLogger()
-
-model_ppo = PPO(
-    'MlpPolicy', env, seed=SEED,
-    learning_rate=3e-4,
-    n_steps=2048,
-    batch_size=256,
-    gamma=0.99,
-    gae_lambda=0.95,
-    clip_range=0.2,
-    ent_coef=0.0,
-    verbose=1,
-    tensorboard_log="./ppo_centralized_seeded/"
-)
-
-model_ppo.learn(total_timesteps, callback=[logger_ppo, cong_ppo, jointlog_ppo])
-model_ppo.save('ppo_centralized_seeded')
-
-# Print Congestion Summary
-for name, logger in [("DQN", cong_dqn), ("PPO", cong_ppo)]:
-    print(f"=== {name} Congestion per Episode ===")
-    for i, (count, length) in enumerate(zip(logger.congested1, logger.episode_lengths), 1):
-        rate = count / length
-        print(f"[{name}] Episode {i:3d}: congested_steps = {count:4d}/{length:3d}, rate = {rate:.2%}")
+import shutil
+
+import numpy as np
+
+# settings of the saved models; gradient_steps / n_steps None scale with the
+# number of envs (one DQN update per 4 transitions, 2048 PPO steps per rollout,
+# or one step per env with more than 2048 envs)
+HYPERPARAMS = {
+    'dqn': dict(learning_rate=1e-4, buffer_size=500_000, batch_size=128, gamma=0.99, exploration_fraction=0.2,
+                exploration_initial_eps=1.0, exploration_final_eps=0.02, train_freq=(4, 'step'),
+                gradient_steps=None, target_update_interval=1000),
+    'ppo': dict(learning_rate=3e-4, n_steps=None, batch_size=256, gamma=0.99, gae_lambda=0.95, clip_range=0.2,
+                ent_coef=0.0),
+}
+
+
+def hyperparams(algo, n_envs, **overrides):
+    params = dict(HYPERPARAMS[algo], **overrides)
+    if algo == 'dqn' and params['gradient_steps'] is None:
+        params['gradient_steps'] = n_envs
+    if algo == 'ppo' and params['n_steps'] is None:
+        params['n_steps'] = max(1, 2048 // n_envs)
+    return params
+
+
+def train(algo, env, total_timesteps, seed, out_dir='.', checkpoint_dir=None, checkpoint_every=100_000,
+          resume=False):
+    """
+    Train one algorithm on `env`, save it, and return its CongestionLogger.
+    With `checkpoint_dir`, checkpoint the run under checkpoint_dir/<algo>;
+    with `resume` too, continue from the newest checkpoint there, if any.
+    """
+    from stable_baselines3 import DQN, PPO
+    from callbacks import (EpisodeReturnLogger, CongestionLogger, JointActionLogger, IncrementalCheckpoint,
+                           latest_checkpoint, load_checkpoint)
+
+    name = f'{algo}_centralized_seeded'
+    logs = os.path.join(out_dir, f'{name}_logs')
+    callbacks = [EpisodeReturnLogger(path=os.path.join(logs, 'returns')),
+                 CongestionLogger(path=os.path.join(logs, 'congestion')),
+                 JointActionLogger(path=os.path.join(logs, 'joint_actions'))]
+    path = checkpoint_dir and os.path.join(checkpoint_dir, algo)
+    resumed = bool(resume and path and latest_checkpoint(path))
+    if not resumed and os.path.isdir(logs):
+        # a new run's part files would mix with the old run's
+        shutil.rmtree(logs)
+    if resumed:
+        model = load_checkpoint(path, env, callbacks)
+        print(f'resuming {name} at {model.num_timesteps} of {total_timesteps} timesteps')
+    else:
+        model = {'dqn': DQN, 'ppo': PPO}[algo](
+            'MlpPolicy', env, seed=seed, verbose=1, tensorboard_log=os.path.join(out_dir, name),
+            **hyperparams(algo, env.num_envs))
+    checkpoint = [IncrementalCheckpoint(path, checkpoint_every, callbacks)] if path else []
+    if model.num_timesteps < total_timesteps:
+        model.learn(total_timesteps - model.num_timesteps, callback=callbacks + checkpoint,
+                    reset_num_timesteps=not resumed)
+    model.save(os.path.join(out_dir, name))
+    return callbacks[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--algo', choices=['dqn', 'ppo', 'both'], default='both')
+    parser.add_argument('--timesteps', type=int, default=100_000, help='per algorithm')
+    parser.add_argument('--n-envs', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out-dir', default='.', help='where models and tensorboard logs go')
+    parser.add_argument('--checkpoint-dir', help='checkpoint the runs into this directory')
+    parser.add_argument('--checkpoint-every', type=int, default=100_000, help='timesteps between checkpoints')
+    parser.add_argument('--resume', action='store_true', help='continue from the newest checkpoints, if any')
+    args = parser.parse_args(argv)
+    if args.resume and not args.checkpoint_dir:
+        parser.error('--resume needs --checkpoint-dir')
+
+    import torch
+    from stable_baselines3.common.vec_env import VecMonitor
+    from sdwan_env import VecSDWANEnv
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    env = VecMonitor(VecSDWANEnv(args.n_envs, seed=args.seed))
+    # for hundreds of envs on a multi-core box, ShmemVecSDWANEnv(n_envs, seed=seed) is a drop-in
+    # replacement that shards them over worker processes
+    algos = ['dqn', 'ppo'] if args.algo == 'both' else [args.algo]
+    loggers = {algo: train(algo, env, args.timesteps, args.seed, args.out_dir, args.checkpoint_dir,
+                           args.checkpoint_every, args.resume) for algo in algos}
+
+    # Print Congestion Summary
+    for algo, logger in loggers.items():
+        name = algo.upper()
+        print(f"=== {name} Congestion per Episode ===")
+        if logger.log is None:
+            continue
+        columns = logger.log.read()
+        for i, (count, length) in enumerate(zip(columns['congested1'], columns['episode_length']), 1):
+            rate = count / length
+            print(f"[{name}] Episode {i:3d}: congested_steps = {count:4d}/{length:3d}, rate = {rate:.2%}")
+
+
+if __name__ == '__main__':
+    main()
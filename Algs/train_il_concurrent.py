@@ -0,0 +1,420 @@
+"""
+Concurrent training of independent learners on one shared simulator.
+
+One actor loop (this process) steps a single VecSDWANEnv for all
+branches: every step it picks each branch's actions with that branch's
+current policy and steps the simulator once. Each branch's SB3 model
+(DQN or PPO) trains in its own worker process. Experience goes from the
+actor to a learner through a shared-memory ring of fixed-size chunks and
+new weights come back through a shared-memory buffer, both without locks:
+the actor never waits for a learner. If a learner falls behind, the actor
+overwrites the oldest chunks and the learner skips ahead (reported as
+dropped chunks); the actor picks up new weights whenever a learner has
+published them. With a free core per learner, wall-clock time is close to
+that of stepping the simulator alone.
+
+PPO learners train on the actor's values and log-probs, so their data can
+be one policy version stale; the clipped objective tolerates that.
+
+This differs from sdwan_env.train_concurrently(), where every learner runs
+its own model.learn() in a thread on a BranchVecEnvs view and the views
+step the simulator in lockstep: there the slowest learner paces the rest,
+here the actor never waits and learners only see the actor's experience.
+SB3 callbacks (e.g. the CallbacksIL loggers) run in the actor loop after
+every simulator step, as model.learn() would call them. A learner process
+that dies stops the run with its traceback.
+
+    python train_il_concurrent.py --algo A=dqn --algo B=ppo --timesteps 200000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import shutil
+import time
+import traceback
+import types
+
+import gymnasium as gym
+import numpy as np
+import torch as th
+from stable_baselines3 import DQN, PPO
+from stable_baselines3.common.callbacks import CallbackList
+from stable_baselines3.common.logger import Logger
+from stable_baselines3.common.vec_env import DummyVecEnv, VecMonitor
+
+from sdwan_env import VecSDWANEnv
+
+ALGOS = {'dqn': DQN, 'ppo': PPO}
+
+DEFAULT_KWARGS = {
+    'dqn': dict(learning_rate=1e-4, buffer_size=500_000, batch_size=128, gamma=0.99, exploration_fraction=0.2,
+                exploration_final_eps=0.02, train_freq=4, gradient_steps=1, target_update_interval=1000,
+                learning_starts=1000),
+    'ppo': dict(learning_rate=3e-4, n_steps=128, batch_size=64, n_epochs=10, gamma=0.99, gae_lambda=0.95),
+}
+
+
+def _shared(ctx, shape, dtype):
+    dtype = np.dtype(dtype)
+    raw = ctx.RawArray('b', max(1, int(np.prod(shape)) * dtype.itemsize))
+    return np.frombuffer(raw, dtype, int(np.prod(shape))).reshape(shape)
+
+
+class _SpacesEnv(gym.Env):
+    """Placeholder env that only carries the spaces an SB3 model is built with."""
+
+    def __init__(self, observation_space, action_space):
+        self.observation_space = observation_space
+        self.action_space = action_space
+
+    def reset(self, *, seed=None, options=None):
+        return self.observation_space.sample(), {}
+
+    def step(self, action):
+        raise RuntimeError('learner models are fed by the actor, not stepped')
+
+
+class ExperienceRing:
+    """
+    Single-producer single-consumer ring of experience chunks in shared memory.
+
+    A chunk is `steps` vector steps of `n_envs` transitions. The writer
+    fills slot `written % slots` and then bumps `written`; the reader copies
+    a slot out and afterwards checks it was not overwritten meanwhile.
+    """
+    FIELDS = {
+        'obs': np.float32, 'next_obs': np.float32, 'actions': np.int64, 'rewards': np.float32,
+        'dones': np.float32, 'episode_starts': np.float32, 'values': np.float32, 'log_probs': np.float32,
+    }
+
+    def __init__(self, ctx, slots, steps, n_envs, obs_size):
+        self.slots, self.steps, self.n_envs = slots, steps, n_envs
+        self.arrays = {}
+        for name, dtype in self.FIELDS.items():
+            extra = (obs_size,) if name in ('obs', 'next_obs') else ()
+            self.arrays[name] = _shared(ctx, (slots, steps, n_envs) + extra, dtype)
+        self.last_values = _shared(ctx, (slots, n_envs), np.float32)
+        self.last_dones = _shared(ctx, (slots, n_envs), np.float32)
+        self.written = ctx.RawValue('q', 0)
+
+    def staging(self):
+        """Local arrays the actor fills one step at a time before write()."""
+        chunk = {name: np.zeros(a.shape[1:], a.dtype) for name, a in self.arrays.items()}
+        chunk['last_values'] = np.zeros(self.n_envs, np.float32)
+        chunk['last_dones'] = np.zeros(self.n_envs, np.float32)
+        return chunk
+
+    def write(self, chunk):
+        slot = self.written.value % self.slots
+        for name, a in self.arrays.items():
+            a[slot] = chunk[name]
+        self.last_values[slot] = chunk['last_values']
+        self.last_dones[slot] = chunk['last_dones']
+        self.written.value += 1
+
+    def read(self, position):
+        """(chunk or None, next position, chunks skipped because the writer lapped the reader)."""
+        written = self.written.value
+        skipped = max(0, written - position - (self.slots - 1))
+        position += skipped
+        if position >= written:
+            return None, position, skipped
+        slot = position % self.slots
+        chunk = {name: a[slot].copy() for name, a in self.arrays.items()}
+        chunk['last_values'] = self.last_values[slot].copy()
+        chunk['last_dones'] = self.last_dones[slot].copy()
+        if self.written.value - position > self.slots - 1:
+            # overwritten while copying: skip it
+            return None, position + 1, skipped + 1
+        return chunk, position + 1, skipped
+
+
+class SharedWeights:
+    """
+    A policy's parameters in shared memory, published by the learner and
+    fetched by the actor. `version` is odd while a write is in progress, so
+    a reader that sees it change (or odd) just keeps its current weights.
+    """
+
+    def __init__(self, ctx, policy):
+        state = policy.state_dict()
+        self.names = [k for k, v in state.items() if v.is_floating_point()]
+        self.shapes = [state[k].shape for k in self.names]
+        sizes = [state[k].numel() for k in self.names]
+        self.bounds = np.cumsum([0] + sizes)
+        self.flat = _shared(ctx, (int(self.bounds[-1]),), np.float32)
+        self.version = ctx.RawValue('q', 0)
+
+    def publish(self, policy):
+        state = policy.state_dict()
+        self.version.value += 1
+        for name, lo, hi in zip(self.names, self.bounds[:-1], self.bounds[1:]):
+            self.flat[lo:hi] = state[name].detach().cpu().numpy().ravel()
+        self.version.value += 1
+
+    def fetch(self, policy, seen):
+        """Load newer weights into `policy` if there are any; returns the version now held."""
+        version = self.version.value
+        if version == seen or version % 2:
+            return seen
+        flat = self.flat.copy()
+        if self.version.value != version:
+            return seen
+        state = {name: th.from_numpy(flat[lo:hi].reshape(shape))
+                 for name, shape, lo, hi in zip(self.names, self.shapes, self.bounds[:-1], self.bounds[1:])}
+        policy.load_state_dict(state, strict=False)
+        return version
+
+
+def _learner(model, algo, ring, weights, stop, stats, total_timesteps, errors):
+    """Worker process: train `model` on chunks from `ring` until `stop` is set."""
+    try:
+        _learn(model, algo, ring, weights, stop, stats, total_timesteps)
+    except BaseException:
+        # the actor only sees the exit code; send it the traceback too
+        errors.send(traceback.format_exc())
+        raise
+
+
+def _learn(model, algo, ring, weights, stop, stats, total_timesteps):
+    th.set_num_threads(1)
+    model.set_logger(Logger(None, []))
+    n_envs, steps = ring.n_envs, ring.steps
+    position, timesteps = 0, 0
+    while not stop.is_set():
+        chunk, position, skipped = ring.read(position)
+        stats[1] += skipped
+        if chunk is None:
+            time.sleep(0.001)
+            continue
+        timesteps += steps * n_envs
+        model.num_timesteps = timesteps
+        model._update_current_progress_remaining(timesteps, total_timesteps)
+        if algo == 'dqn':
+            no_infos = [{}] * n_envs
+            for t in range(steps):
+                model.replay_buffer.add(chunk['obs'][t], chunk['next_obs'][t], chunk['actions'][t],
+                                        chunk['rewards'][t], chunk['dones'][t], no_infos)
+                model._on_step()
+            if timesteps > model.learning_starts:
+                # gradient_steps per train_freq transitions of every env, so one
+                # update per 4 transitions by default, as train_dqn_ppo.py does
+                updates = max(1, steps // model.train_freq.frequency) * model.gradient_steps * n_envs
+                model.train(gradient_steps=updates, batch_size=model.batch_size)
+        else:
+            buf = model.rollout_buffer
+            buf.reset()
+            buf.observations[:] = chunk['obs']
+            buf.actions[:] = chunk['actions'][..., None]
+            buf.rewards[:] = chunk['rewards']
+            buf.episode_starts[:] = chunk['episode_starts']
+            buf.values[:] = chunk['values']
+            buf.log_probs[:] = chunk['log_probs']
+            buf.pos, buf.full = steps, True
+            buf.compute_returns_and_advantage(th.as_tensor(chunk['last_values']), chunk['last_dones'])
+            model.train()
+        weights.publish(model.policy)
+        stats[0] += 1
+    weights.publish(model.policy)
+
+
+def _learner_died(b, p, errors):
+    try:
+        tb = errors[b].recv() if errors[b].poll() else ''
+    except EOFError:
+        # killed without a word
+        tb = ''
+    return RuntimeError(f'learner of branch {b!r} died with exit code {p.exitcode}' + (f':\n{tb}' if tb else ''))
+
+
+def _check_learners(procs, errors):
+    """Raise RuntimeError, after terminating the rest, if a learner process has died."""
+    for b, p in procs.items():
+        if not p.is_alive():
+            for other in procs.values():
+                other.terminate()
+                other.join()
+            raise _learner_died(b, p, errors)
+
+
+def train_actor_learners(algos, total_timesteps, n_envs=16, seed=0, algo_kwargs=None, ring_slots=8,
+                         sync_every=1, verbose=1, callback=None, **env_kwargs):
+    """
+    Train one model per branch ({branch: 'dqn' | 'ppo'}) on one shared
+    simulator, with one learner process per branch; returns ({branch:
+    model}, per-branch episode returns). Models come back with their
+    learners' final weights. `callback` (an SB3 callback or a list of them)
+    sees the simulator's infos and dones after every step; returning False
+    from it ends training early.
+    """
+    ctx = mp.get_context('fork')
+    venv = VecSDWANEnv(n_envs, seed=seed, factorized_actions=True, **env_kwargs)
+    env = VecMonitor(venv)
+    topo = venv.topology
+    obs_space = venv.observation_space
+    branches = list(algos)
+    # checked before any learner is forked, so a bad argument leaves none behind
+    for b, algo in algos.items():
+        if b not in topo.branch_names:
+            raise ValueError(f'unknown branch {b!r}; the topology has {topo.branch_names}')
+        if algo not in ALGOS:
+            raise ValueError(f'unknown algorithm {algo!r} for branch {b!r}; choose from {list(ALGOS)}')
+    for b in topo.branch_names:
+        if b not in algos:
+            raise ValueError(f'no algorithm given for branch {b!r}')
+    index = {b: topo.branch_names.index(b) for b in branches}
+
+    models, rings, shared, stops, stats, procs, errors = {}, {}, {}, {}, {}, {}, {}
+    for b in branches:
+        algo = algos[b]
+        kwargs = dict(DEFAULT_KWARGS[algo], **(algo_kwargs or {}).get(b, {}))
+        stub = DummyVecEnv([lambda: _SpacesEnv(obs_space, gym.spaces.Discrete(int(topo.n_choices[index[b]])))] * n_envs)
+        models[b] = ALGOS[algo]('MlpPolicy', stub, seed=seed, device='cpu', **kwargs)
+        models[b].set_logger(Logger(None, []))
+        steps = models[b].n_steps if algo == 'ppo' else 32
+        rings[b] = ExperienceRing(ctx, ring_slots, steps, n_envs, topo.obs_size)
+        shared[b] = SharedWeights(ctx, models[b].policy)
+        stops[b] = ctx.Event()
+        stats[b] = ctx.RawArray('q', 2)  # [updates published, chunks skipped]
+    # fork after every model exists, so each learner starts from the actor's copy
+    for b in branches:
+        errors[b], child = ctx.Pipe(duplex=False)
+        procs[b] = ctx.Process(target=_learner, daemon=True,
+                               args=(models[b], algos[b], rings[b], shared[b], stops[b], stats[b], total_timesteps,
+                                     child))
+        procs[b].start()
+        child.close()
+
+    # callbacks see a stand-in for the model: the step count and the env
+    callback = CallbackList(callback if isinstance(callback, list) else [callback] if callback else [])
+    callback.init_callback(types.SimpleNamespace(num_timesteps=0, get_env=lambda: env, logger=Logger(None, [])))
+    callback.on_training_start({}, {})
+
+    staging = {b: rings[b].staging() for b in branches}
+    versions = {b: 0 for b in branches}
+    returns = {b: [] for b in branches}
+    running = np.zeros((n_envs, topo.n_branches))
+    joint = np.zeros((n_envs, topo.n_branches), np.int64)
+    rng = np.random.default_rng(seed)
+    obs = env.reset()
+    episode_starts = np.ones(n_envs, np.float32)
+    start = time.perf_counter()
+    timesteps, step = 0, 0
+    with th.no_grad():
+        while timesteps < total_timesteps:
+            if step % sync_every == 0:
+                for b in branches:
+                    versions[b] = shared[b].fetch(models[b].policy, versions[b])
+            obs_t = th.as_tensor(obs)
+            extra = {}
+            for b in branches:
+                model, i = models[b], index[b]
+                model._update_current_progress_remaining(timesteps, total_timesteps)
+                if algos[b] == 'dqn':
+                    actions = model.q_net(obs_t).argmax(1).numpy()
+                    explore = rng.random(n_envs) < model.exploration_schedule(model._current_progress_remaining)
+                    actions[explore] = rng.integers(0, topo.n_choices[i], int(explore.sum()))
+                else:
+                    actions, values, log_probs = model.policy(obs_t)
+                    actions = actions.numpy()
+                    extra[b] = values.flatten().numpy(), log_probs.numpy()
+                joint[:, i] = actions
+
+            new_obs, _, dones, infos = env.step(joint)
+            rewards = venv.buf_metrics[:, :topo.n_branches]
+            next_obs = new_obs.copy()
+            next_obs[dones] = venv.buf_terminal_obs[dones]
+            running += rewards
+            for env_i in np.flatnonzero(dones):
+                for b in branches:
+                    returns[b].append(float(running[env_i, index[b]]))
+                running[env_i] = 0.0
+
+            for b in branches:
+                chunk, ring, i = staging[b], rings[b], index[b]
+                t = step % ring.steps
+                chunk['obs'][t] = obs
+                chunk['next_obs'][t] = next_obs
+                chunk['actions'][t] = joint[:, i]
+                chunk['rewards'][t] = rewards[:, i]
+                chunk['dones'][t] = dones
+                chunk['episode_starts'][t] = episode_starts
+                if b in extra:
+                    chunk['values'][t], chunk['log_probs'][t] = extra[b]
+                if t == ring.steps - 1:
+                    if algos[b] == 'ppo':
+                        chunk['last_values'] = models[b].policy.predict_values(th.as_tensor(new_obs)).flatten().numpy()
+                    chunk['last_dones'] = dones
+                    ring.write(chunk)
+                    _check_learners(procs, errors)
+
+            obs = new_obs
+            episode_starts = dones.astype(np.float32)
+            timesteps += n_envs
+            step += 1
+            callback.model.num_timesteps = timesteps
+            callback.update_locals({'infos': infos, 'dones': dones})
+            if not callback.on_step():
+                break
+            if verbose and step % 1000 == 0:
+                rate = timesteps / (time.perf_counter() - start)
+                recent = ', '.join(f'{b}: {np.mean(returns[b][-n_envs:]):.1f}' for b in branches if returns[b])
+                print(f'[{timesteps:9d} steps, {rate:8.0f}/s] mean recent return {recent}', flush=True)
+
+    callback.on_training_end()
+    for b in branches:
+        stops[b].set()
+    for b in branches:
+        procs[b].join()
+        if procs[b].exitcode:
+            raise _learner_died(b, procs[b], errors)
+        shared[b].fetch(models[b].policy, versions[b])
+        if verbose:
+            updates, skipped = stats[b]
+            print(f'{b}: {algos[b]} learner published {updates} updates, skipped {skipped} chunks')
+    if verbose:
+        print(f'{timesteps} steps in {time.perf_counter() - start:.1f}s')
+    return models, returns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--algo', action='append', default=[], metavar='BRANCH=ALGO',
+                        help='algorithm per branch, dqn or ppo (default: dqn for every branch)')
+    parser.add_argument('--timesteps', type=int, default=200_000)
+    parser.add_argument('--n-envs', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-prefix', default='il_concurrent',
+                        help='models are saved as <prefix>_<branch>.zip, congestion logs under <prefix>_logs/')
+    args = parser.parse_args(argv)
+    from callbacks import CallbacksIL
+
+    branch_names = VecSDWANEnv(1).topology.branch_names
+    algos = {name: 'dqn' for name in branch_names}
+    for a in args.algo:
+        branch, _, algo = a.partition('=')
+        if branch not in branch_names or algo not in ALGOS:
+            parser.error(f'--algo {a!r}: expected BRANCH=ALGO with BRANCH in {branch_names} '
+                         f'and ALGO in {list(ALGOS)}')
+        algos[branch] = algo
+    logs = f'{args.save_prefix}_logs'
+    if os.path.isdir(logs):
+        # a new run's part files would mix with the old run's
+        shutil.rmtree(logs)
+    totals = CallbacksIL.AgentAndTotalLogger()
+    congestion = CallbacksIL.CongestionLogger(path=os.path.join(logs, 'congestion'))
+    models, _ = train_actor_learners(algos, args.timesteps, args.n_envs, args.seed, callback=[totals, congestion])
+    for b, model in models.items():
+        model.save(f'{args.save_prefix}_{b}')
+
+    if totals.total_rewards:
+        print(f'{len(totals.total_rewards)} episodes, mean total reward {np.mean(totals.total_rewards):.1f}')
+    if congestion.log is not None and len(congestion.log):
+        columns = congestion.log.read()
+        steps = columns['episode_length'].sum()
+        print('congested steps: ' + ', '.join(f'overlay {k[len("congested"):]} {columns[k].sum() / steps:.2%}'
+                                              for k in columns if k.startswith('congested')))
+
+
+if __name__ == '__main__':
+    main()
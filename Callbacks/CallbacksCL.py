@@ -1,61 +1,280 @@
+import numpy as np
 from stable_baselines3.common.callbacks import BaseCallback
+from sdwan_env.Topology import Topology
+from .ColumnLog import ColumnLog
 
 # ---------------- Callback Definitions ----------------
+# All loggers keep one accumulator per env of the (vectorized) training env
+# and close an episode on that env's `dones` flag, so every env is counted.
+# Per-episode / per-step records go to a ColumnLog: in memory by default
+# (the newest `max_rows` or so), or streamed to Parquet part files under
+# `path` every `flush_every` rows.
+
+def info_keys(info):
+    """Keys of an info, either dict-like or compact (see SDWANEnv.step)."""
+    return info['metric_keys'] if 'metrics' in info else list(info)
+
+def info_columns(infos, keys, default=0.0):
+    """
+    (n_envs, len(keys)) array of the values of `keys` in every env's info.
+    Compact and lazy infos carry a `metrics` array; it is read directly.
+    """
+    first = infos[0]
+    if 'metrics' in first and all(k in first['metric_keys'] for k in keys):
+        idx = [first['metric_keys'].index(k) for k in keys]
+        return np.array([info['metrics'] for info in infos])[:, idx]
+    return np.array([[info.get(k, default) for k in keys] for info in infos], float)
+
 class EpisodeReturnLogger(BaseCallback):
-    def __init__(self, verbose=0):
+    """
+    Per-episode return of every branch and the total, over all envs.
+
+    One row per finished episode: timestep, env index, one reward_<branch>
+    column per branch of `topology` (a Topology or config; by default the
+    training env's) and total. Columns are readable as attributes
+    (`reward_a`, `total`, ...; `tot_returns` for the totals).
+    """
+    def __init__(self, verbose=0, topology=None, path=None, flush_every=1 << 20, max_rows=1 << 22):
         super().__init__(verbose)
-        self.a_returns, self.b_returns, self.tot_returns, self.timesteps = [], [], [], []
-        self._ra = self._rb = self._rt = 0.0
+        self.topology = topology
+        self.path = path
+        self.flush_every = flush_every
+        self.max_rows = max_rows
+        self.log = None
+        self._keys = None
+
+    def _setup(self, infos):
+        topology = self.topology
+        if topology is None:
+            topology = self.training_env.get_attr('topology', [0])[0]
+        elif not isinstance(topology, Topology):
+            topology = Topology(topology)
+        self._keys = list(topology.reward_keys) + ['total']
+        self._returns = np.zeros((len(infos), len(self._keys)))
+        columns = dict(timestep=np.int64, env=np.int32)
+        columns.update((k, np.float64) for k in self._keys)
+        self.log = ColumnLog(columns, self.path, self.flush_every, self.max_rows)
+
+    def __getattr__(self, name):
+        log = self.__dict__.get('log')
+        if log is not None and name in log.dtypes:
+            return log[name]
+        raise AttributeError(name)
+
+    @property
+    def tot_returns(self):
+        return self.log['total'] if self.log is not None else np.zeros(0)
 
     def _on_step(self) -> bool:
-        for info in self.locals['infos']:
-            self._ra += info.get('reward_a', 0.0)
-            self._rb += info.get('reward_b', 0.0)
-            self._rt += info.get('total', 0.0)
-            if 'episode' in info:
-                self.a_returns.append(self._ra)
-                self.b_returns.append(self._rb)
-                self.tot_returns.append(self._rt)
-                self.timesteps.append(self.num_timesteps)
-                self._ra = self._rb = self._rt = 0.0
+        infos = self.locals['infos']
+        if self._keys is None:
+            self._setup(infos)
+        self._returns += info_columns(infos, self._keys)
+        done = np.flatnonzero(self.locals['dones'])
+        if done.size:
+            self.log.append(timestep=self.num_timesteps, env=done,
+                            **{k: self._returns[done, j] for j, k in enumerate(self._keys)})
+            self._returns[done] = 0.0
         return True
 
+    def _on_training_end(self) -> None:
+        if self.log is not None:
+            self.log.flush()
+
 class CongestionLogger(BaseCallback):
-    def __init__(self, verbose=0):
+    """
+    Per-episode count of congested steps on every overlay, over all envs.
+
+    One row per finished episode: timestep, env index, episode_length and
+    one congestedN column per overlay. Columns are readable as attributes
+    (`congested1`, ..., `episode_lengths`) once the first step has been seen.
+    """
+    def __init__(self, verbose=0, path=None, flush_every=1 << 20, max_rows=1 << 22):
         super().__init__(verbose)
-        self.congested1 = []
-        self.congested2 = []
-        self.congested3 = []
-        self.congested_counts = []
-        self.episode_lengths = []
-        self._c1 = self._c2 = self._c3 = 0
-        self._count = self._steps = 0
+        self.path = path
+        self.flush_every = flush_every
+        self.max_rows = max_rows
+        self.log = None
+        self._keys = None
+
+    def _setup(self, infos):
+        # congested1..N as the env reports them, in overlay order
+        self._keys = [k for k in info_keys(infos[0]) if k.startswith('congested')]
+        self._counts = np.zeros((len(infos), len(self._keys)), np.int64)
+        self._steps = np.zeros(len(infos), np.int64)
+        columns = dict(timestep=np.int64, env=np.int32, episode_length=np.int64)
+        columns.update((k, np.int64) for k in self._keys)
+        self.log = ColumnLog(columns, self.path, self.flush_every, self.max_rows)
+
+    def __getattr__(self, name):
+        log = self.__dict__.get('log')
+        if log is not None and name in log.dtypes:
+            return log[name]
+        raise AttributeError(name)
+
+    @property
+    def episode_lengths(self):
+        return self.log['episode_length']
+
+    @property
+    def congested_counts(self):
+        return self.log['congested1']
 
     def _on_step(self) -> bool:
-        info = self.locals['infos'][0]
-        self._c1 += int(info.get('congested1', 0))
-        self._c2 += int(info.get('congested2', 0))
-        self._c3 += int(info.get('congested3', 0))
-        self._count += int(info.get('congested1', 0))
+        infos = self.locals['infos']
+        if self._keys is None:
+            self._setup(infos)
+        keys = self._keys
+        self._counts += info_columns(infos, keys).astype(np.int64)
         self._steps += 1
 
-        if 'episode' in info:
-            self.congested1.append(self._c1)
-            self.congested2.append(self._c2)
-            self.congested3.append(self._c3)
-            self.congested_counts.append(self._count)
-            self.episode_lengths.append(self._steps)
-            self._c1 = self._c2 = self._c3 = self._count = self._steps = 0
+        done = np.flatnonzero(self.locals['dones'])
+        if done.size:
+            self.log.append(timestep=self.num_timesteps, env=done, episode_length=self._steps[done],
+                            **{k: self._counts[done, j] for j, k in enumerate(keys)})
+            self._counts[done] = 0
+            self._steps[done] = 0
         return True
 
+    def _on_training_end(self) -> None:
+        if self.log is not None:
+            self.log.flush()
+
 class JointActionLogger(BaseCallback):
-    def __init__(self, verbose=0):
+    """
+    Joint action of every env at every step, as one `joint_action` column.
+
+    Rows are step-major: all envs of a step, in env order, then the next
+    step. Steps whose joint action is too large for an int64 (reported as
+    None) are skipped.
+    """
+    def __init__(self, verbose=0, path=None, flush_every=1 << 20, max_rows=1 << 22):
         super().__init__(verbose)
-        self.joint_actions = []
+        self.log = ColumnLog({'joint_action': np.int64}, path, flush_every, max_rows)
+
+    @property
+    def joint_actions(self):
+        return self.log['joint_action']
 
     def _on_step(self) -> bool:
-        info = self.locals['infos'][0]
-        ja = info.get('joint_action')
-        if ja is not None:
-            self.joint_actions.append(int(ja))
+        ja = [info.get('joint_action') for info in self.locals['infos']]
+        if None in ja:
+            ja = [a for a in ja if a is not None]
+        if ja:
+            self.log.append(joint_action=ja)
         return True
+
+    def _on_training_end(self) -> None:
+        self.log.flush()
+
+class ProfileLogger(BaseCallback):
+    """
+    Turns on SDWANEnv step profiling in every training env and, every
+    `log_every` calls, records the merged statistics with the SB3 logger
+    (so they show up in TensorBoard): mean µs and share of step time per
+    phase, drops and service losses per overlay over the window, mean queue
+    length per overlay, and a queue-length histogram per overlay.
+    Works with VecSDWANEnv, ShmemVecSDWANEnv and vec envs of SDWANEnv /
+    IndependentBranchEnv instances (DummyVecEnv, SubprocVecEnv); the batched
+    envs time their batched phases (see VecStepProfiler).
+    """
+    def __init__(self, log_every=10_000, verbose=0):
+        super().__init__(verbose)
+        self.log_every = log_every
+        self.profile = None  # merged StepProfiler at the last log
+        self._last = None
+
+    def _init_callback(self) -> None:
+        try:
+            self.training_env.env_method('enable_profiling')
+        except AttributeError as e:
+            raise TypeError(f'ProfileLogger needs envs with enable_profiling(), '
+                            f'{type(self.training_env.unwrapped).__name__} has none') from e
+
+    def _merged(self):
+        # several indices can share one profiler (e.g. branch envs over one base env)
+        profilers = list({id(p): p for p in self.training_env.get_attr('profiler')}.values())
+        merged = profilers[0].copy()
+        for p in profilers[1:]:
+            merged.merge(p)
+        return merged
+
+    def _on_step(self) -> bool:
+        if self.n_calls % self.log_every == 0:
+            self._record()
+        return True
+
+    def _record(self):
+        import torch as th
+        self.profile = self._merged()
+        window = self.profile if self._last is None else self.profile.since(self._last)
+        self._last = self.profile
+        if window.steps == 0:
+            return
+        for key, t in window.time.items():
+            if window.calls[key] == 0:
+                continue
+            self.logger.record(f'profile/{key}_us', 1e6 * t / window.calls[key])
+            self.logger.record(f'profile/{key}_share', t / window.step_time)
+        self.logger.record('profile/step_us', 1e6 * window.step_time / window.steps)
+        levels = np.arange(window.queue_len_hist.shape[1])
+        for o, name in enumerate(window.overlay_names):
+            hist = window.queue_len_hist[o]
+            self.logger.record(f'profile/drops/{name}', window.drops[o])
+            self.logger.record(f'profile/service_losses/{name}', window.service_losses[o])
+            self.logger.record(f'profile/queue_len_mean/{name}', float(levels @ hist / hist.sum()))
+            # add_histogram wants samples; cap them so long windows stay cheap
+            scale = min(1.0, 10_000 / hist.sum())
+            samples = np.repeat(levels, np.round(hist * scale).astype(np.int64))
+            if samples.size:
+                self.logger.record(f'profile/queue_len/{name}', th.as_tensor(samples),
+                                   exclude=('stdout', 'log', 'json', 'csv'))
+
+    def _on_training_end(self) -> None:
+        self.profile = self._merged()
+
+class FlowStatsLogger(BaseCallback):
+    """
+    Turns on flow completion time tracking in every training env and,
+    every `log_every` calls and at the end, records the merged quantiles
+    (in seconds) per overlay and per branch with the SB3 logger, as
+    fct/<overlay|branch>/<name>/<p50|p95|...>. The last merged values are
+    kept in `stats`. Works with SDWANEnv / IndependentBranchEnv vec envs
+    (their sketches cover finished episodes) and VecSDWANEnv.
+    """
+    def __init__(self, log_every=10_000, quantiles=(0.5, 0.95, 0.99), verbose=0):
+        super().__init__(verbose)
+        self.log_every = log_every
+        self.quantiles = quantiles
+        self.stats = {}
+
+    def _init_callback(self) -> None:
+        self.training_env.env_method('enable_flow_stats')
+
+    def _merged(self):
+        # one sketch may back several indices (branch envs, VecSDWANEnv)
+        sketches = [s for s in {id(s): s for s in self.training_env.get_attr('flow_stats')}.values() if s is not None]
+        if not sketches:
+            return None
+        merged = sketches[0].copy()
+        for s in sketches[1:]:
+            merged.merge(s)
+        return merged
+
+    def _on_step(self) -> bool:
+        if self.n_calls % self.log_every == 0:
+            self._record()
+        return True
+
+    def _record(self):
+        merged = self._merged()
+        if merged is None:
+            return
+        self.stats = merged.quantiles(self.quantiles)
+        for name, values in self.stats.items():
+            for key, value in values.items():
+                if key != 'count':
+                    self.logger.record(f'fct/{name}/{key}', value)
+
+    def _on_training_end(self) -> None:
+        self._record()
@@ -1,3 +1,7 @@
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+from . import CallbacksCL
+from .CallbacksCL import FlowStatsLogger, JointActionLogger, ProfileLogger, info_columns
 
 # ---------------- Callback Definitions ----------------
 # 1) Define the callback to log completed episodes:
@@ -8,87 +12,44 @@ class AgentAndTotalLogger(BaseCallback):
         self.total_rewards = []  # Total rewards for the episode
         self.timesteps     = []  # Timesteps for each episode
         self.episode_rewards = [] # Rewards for each episode
-        self._running_total = 0.0
+        self._running_total = None  # one running total per env
 
     def _on_step(self) -> bool:
-        for info in self.locals["infos"]:
-            # accumulate the env’s lambda-weighted step reward
-            self._running_total += info.get("total", 0.0)
+        infos = self.locals["infos"]
+        if self._running_total is None:
+            self._running_total = np.zeros(len(infos))
+        # accumulate the env’s lambda-weighted step reward
+        self._running_total += info_columns(infos, ("total",))[:, 0]
+        for i in np.flatnonzero(self.locals["dones"]):
             # when an episode ends, Monitor will add “episode” to info
-            if "episode" in info:
-                self.agent_rewards.append(info["episode"]["r"])
-                self.total_rewards.append(self._running_total)
-                self.timesteps.append(self.num_timesteps)
-                self.episode_rewards.append(info["episode"]["r"])
-                self._running_total = 0.0
+            r = infos[i]["episode"]["r"] if "episode" in infos[i] else None
+            self.agent_rewards.append(r)
+            self.total_rewards.append(float(self._running_total[i]))
+            self.timesteps.append(self.num_timesteps)
+            self.episode_rewards.append(r)
+            self._running_total[i] = 0.0
         return True
 
-class CongestionLogger(BaseCallback):
+class CongestionLogger(CallbacksCL.CongestionLogger):
     """
-    Logs per‐episode congestion counts for Overlay1, Overlay2, Overlay3,
-    and prints final ranking if you keep bw_history.
+    Logs per‐episode congestion counts for every overlay, over all envs
+    (see CallbacksCL.CongestionLogger). With verbose > 0 it also prints the
+    overlays ranked by final bandwidth when an episode ends.
     """
-    def __init__(self, verbose=0):
-        super().__init__(verbose)
-        self.congested1 = []
-        self.congested2 = []
-        self.congested3 = []
-        self.episode_lengths = []
-        self.bw_history = []  # optional, remove if unused
-
-        # running counters
-        self._c1 = self._c2 = self._c3 = 0
-        self._steps = 0
-
     def _on_step(self) -> bool:
-        info = self.locals['infos'][0]
-        # accumulate each step
-        self._c1 += int(info.get('congested1', 0.0))
-        self._c2 += int(info.get('congested2', 0.0))
-        self._c3 += int(info.get('congested3', 0.0))
-        self._steps += 1
-
-        # store last bandwidths if you still want the printout
-        last_bw = (info['bw1'], info['bw2'], info['bw3'])
-        if len(self.bw_history) < len(self.congested1) + 1:
-            self.bw_history.append(last_bw)
-
-        # at episode end
-        if 'episode' in info:
-            self.congested1.append(self._c1)
-            self.congested2.append(self._c2)
-            self.congested3.append(self._c3)
-            self.episode_lengths.append(self._steps)
-
-            # optional: print ranked status
-            stats = [
-                ('Overlay1', last_bw[0], bool(info['congested1'])),
-                ('Overlay2', last_bw[1], bool(info['congested2'])),
-                ('Overlay3', last_bw[2], bool(info['congested3'])),
-            ]
-            stats.sort(key=lambda x: x[1])
-            ep = len(self.congested1)
-            print(f"\n[Episode {ep:3d}] Overlay final status:")
-            for rank, (name, bw, cong) in enumerate(stats, 1):
-                print(f"  {rank}. {name:<8s} | BW: {bw:8.2f} | {'CONGESTED' if cong else 'OK'}")
-            print('-'*40)
-
-            # reset for next episode
-            self._c1 = self._c2 = self._c3 = 0
-            self._steps = 0
-
+        super()._on_step()
+        if self.verbose > 0:
+            infos = self.locals['infos']
+            done = np.flatnonzero(self.locals['dones'])
+            for ep, i in enumerate(done, len(self.log) - done.size + 1):
+                info = infos[i]
+                if 'metrics' in info:
+                    info = dict(zip(info['metric_keys'], info['metrics'].tolist()))
+                stats = [(f'Overlay{k[len("congested"):]}', info[f'bw{k[len("congested"):]}'], bool(info[k]))
+                         for k in self._keys]
+                stats.sort(key=lambda x: x[1])
+                print(f"\n[Episode {ep:3d}, env {i}] Overlay final status:")
+                for rank, (name, bw, cong) in enumerate(stats, 1):
+                    print(f"  {rank}. {name:<8s} | BW: {bw:8.2f} | {'CONGESTED' if cong else 'OK'}")
+                print('-'*40)
         return True
-
-class JointActionLogger(BaseCallback):
-    """Logs the combined joint action code (0–3) each step."""
-    def __init__(self, verbose=0):
-        super().__init__(verbose)
-        self.joint_actions = []
-
-    def _on_step(self) -> bool:
-        # read 'joint_action' from the info dict
-        info = self.locals["infos"][0]
-        ja = info.get("joint_action")
-        if ja is not None:
-            self.joint_actions.append(int(ja))
-        return True
\ No newline at end of file
@@ -0,0 +1,403 @@
+"""
+Incremental checkpoints of a whole SB3 training run, and resuming from them.
+
+A checkpoint holds everything the rest of the run depends on, so a run
+resumed from it continues bit-for-bit like the uninterrupted one would:
+the model (policy, optimizer, schedules, last observation, episode
+buffers), the torch / NumPy / Python / action-space RNG states, the env's
+get_state() snapshot and its wrappers' counters (VecMonitor, VecNormalize),
+the state of the given callbacks and the replay buffer.
+
+Large, slowly changing state is written incrementally: the replay buffer
+as the slots written since the previous checkpoint, and every ColumnLog of
+a callback as the rows appended since then. Each chain of deltas starts at
+a base (the buffer's used rows, the log's buffered rows). The replay chain
+is rebased once its deltas add up to a full buffer, so it takes at most
+twice the buffer's size on disk; a log's chain when the log was flushed or
+dropped rows, or after 32 deltas.
+
+Checkpoints are taken between two rollouts (on_rollout_start), where
+transitions are stored and updates done. The training thread only copies
+the state (the model serialized to memory, the new rows: ~5 ms per
+checkpoint, ~30 ms when a 500k-transition buffer is rebased); a background
+thread writes it and then replaces manifest.json atomically, so a run
+killed at any point leaves the previous checkpoint intact. Layout:
+
+    path/manifest.json           latest id, and per checkpoint its delta chains
+    path/checkpoints/000007/     model.zip, state.pkl
+    path/deltas/000007.npz       replay slots and log rows added by checkpoint 7
+"""
+import copy
+import importlib
+import io
+import json
+import os
+import pickle
+import random
+import shutil
+import threading
+import time
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.running_mean_std import RunningMeanStd
+from stable_baselines3.common.vec_env import VecEnvWrapper
+
+from .ColumnLog import ColumnLog
+
+MANIFEST = 'manifest.json'
+# attributes SB3 points at the running training, not callback state
+_CALLBACK_LINKS = ('model', 'training_env', 'locals', 'globals', 'parent')
+# wrapper attributes of these types are its state (VecMonitor's episode
+# counters, VecNormalize's running statistics, ...)
+_WRAPPER_STATE = (np.ndarray, np.generic, bool, int, float, RunningMeanStd)
+_BUFFER_SKIP = ('observation_space', 'action_space', 'device')
+# a log's rows are written again as a new base after this many deltas, to
+# bound the files a resume reads
+_MAX_LOG_CHAIN = 32
+
+
+def latest_checkpoint(path):
+    """Manifest entry of the newest checkpoint under `path` (timesteps, chains), or None."""
+    manifest = _read_manifest(path)
+    if manifest is None:
+        return None
+    return dict(manifest['checkpoints'][str(manifest['latest'])], id=manifest['latest'])
+
+
+def _read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _buffer_rows(buffer):
+    """The replay buffer's per-slot arrays (first dimension buffer_size), by attribute name."""
+    return {name: array for name, array in vars(buffer).items()
+            if isinstance(array, np.ndarray) and array.shape[:1] == (buffer.buffer_size,)}
+
+
+def _wrappers(env):
+    """The VecEnvWrappers around the innermost env, outermost first, and that env."""
+    wrappers = []
+    while isinstance(env, VecEnvWrapper):
+        wrappers.append(env)
+        env = env.venv
+    return wrappers, env
+
+
+def _env_state(env):
+    wrappers, inner = _wrappers(env)
+    if not hasattr(inner, 'get_state'):
+        raise TypeError(f'{type(inner).__name__} has no get_state(); checkpoints need VecSDWANEnv '
+                        'or ShmemVecSDWANEnv')
+    return {
+        'wrappers': [copy.deepcopy({k: v for k, v in vars(w).items()
+                                    if isinstance(v, _WRAPPER_STATE) and k != 'num_envs'}) for w in wrappers],
+        'state': inner.get_state(),
+        'flow_stats': copy.deepcopy(getattr(inner, 'flow_stats', None)),
+    }
+
+
+def _set_env_state(env, state):
+    wrappers, inner = _wrappers(env)
+    if len(wrappers) != len(state['wrappers']):
+        raise ValueError(f'checkpoint env has {len(state["wrappers"])} wrappers, this one {len(wrappers)}')
+    for w, attrs in zip(wrappers, state['wrappers']):
+        vars(w).update(attrs)
+    inner.set_state(state['state'])
+    if state['flow_stats'] is not None:
+        inner.flow_stats = state['flow_stats']
+    # loading the model seeds the env for a reset that a resumed run never does
+    inner._reset_seeds()
+
+
+def _rng_state(model):
+    import torch
+    return {
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        'numpy': np.random.get_state(),
+        'random': random.getstate(),
+        'action_space': model.action_space.np_random.bit_generator.state,
+    }
+
+
+def _set_rng_state(model, state):
+    import torch
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] is not None:
+        torch.cuda.set_rng_state_all(state['cuda'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['random'])
+    model.action_space.np_random.bit_generator.state = state['action_space']
+
+
+class _LogRef:
+    """Stands in for a callback's ColumnLog in state.pkl; its rows are in the `key` delta chain."""
+
+    def __init__(self, key, log):
+        self.key = key
+        self.meta = copy.deepcopy({k: v for k, v in vars(log).items() if k != '_data'})
+
+    def restore(self, columns):
+        log = ColumnLog.__new__(ColumnLog)
+        vars(log).update(self.meta)
+        log._data = {name: np.empty(log.capacity, dtype) for name, dtype in log.dtypes.items()}
+        for name in log.dtypes:
+            log._data[name][:log.size] = columns[name]
+        return log
+
+
+class IncrementalCheckpoint(BaseCallback):
+    """
+    Checkpoint the run into directory `path` every `every` timesteps (at the
+    first rollout boundary past it) and at the end of training, keeping the
+    newest `keep` checkpoints. `callbacks` are the other callbacks of the
+    run whose state is saved too (loggers); pass the same list, in the same
+    order, to load_checkpoint(). Needs an env with get_state() (VecSDWANEnv,
+    ShmemVecSDWANEnv), optionally wrapped. `stalls` collects the seconds
+    each checkpoint held up training.
+
+    A run started on a model loaded from the newest checkpoint continues
+    its delta chains; any other run starts new ones.
+    """
+
+    def __init__(self, path, every=100_000, callbacks=(), keep=2, verbose=0):
+        super().__init__(verbose)
+        self.path = path
+        self.every = every
+        self.callbacks = list(callbacks)
+        self.keep = keep
+        self.stalls = []
+        self._manifest = None
+        self._chains = {}
+        self._last_timesteps = 0
+        self._writer = None
+        self._error = None
+
+    def _on_training_start(self) -> None:
+        os.makedirs(os.path.join(self.path, 'checkpoints'), exist_ok=True)
+        os.makedirs(os.path.join(self.path, 'deltas'), exist_ok=True)
+        self._manifest = _read_manifest(self.path) or {'latest': 0, 'checkpoints': {}}
+        latest = self._manifest['checkpoints'].get(str(self._manifest['latest']))
+        resumed = latest is not None and latest['timesteps'] == self.model.num_timesteps
+        self._chains = copy.deepcopy(latest['chains']) if resumed else {}
+        self._last_timesteps = self.model.num_timesteps
+
+    def _on_rollout_start(self) -> None:
+        if self.model.num_timesteps - self._last_timesteps >= self.every:
+            self.save()
+
+    def _on_step(self) -> bool:
+        return True
+
+    def _on_training_end(self) -> None:
+        # a run stopped early by a callback ends mid-rollout, which is no
+        # state to resume from
+        if self.model.num_timesteps >= self.model._total_timesteps and \
+                self.model.num_timesteps > self._last_timesteps:
+            self.save()
+        self.wait()
+
+    def wait(self):
+        """Block until the last checkpoint is on disk; raise if writing it failed."""
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(f'writing a checkpoint to {self.path} failed') from error
+
+    def save(self):
+        """Take a checkpoint now; it is written in the background."""
+        started = time.perf_counter()
+        self.wait()
+        model = io.BytesIO()
+        self.model.save(model)
+        timesteps = self.model.num_timesteps
+        ckpt = self._manifest['latest'] + 1
+        deltas, chains = {}, {}
+        state = {
+            'algo': f'{type(self.model).__module__}:{type(self.model).__qualname__}',
+            'timesteps': timesteps,
+            'rng': _rng_state(self.model),
+            'env': _env_state(self.model.get_env()),
+            'callbacks': [self._callback_state(i, cb, deltas, chains) for i, cb in enumerate(self.callbacks)],
+            'replay': None,
+        }
+        buffer = getattr(self.model, 'replay_buffer', None)
+        if buffer is not None:
+            state['replay'] = self._replay_delta(buffer, timesteps, deltas, chains)
+        for chain in chains.values():
+            if chain.pop('new'):
+                chain['ids'].append(ckpt)
+        self._chains = chains
+        entry = {'timesteps': timesteps, 'chains': copy.deepcopy(chains)}
+        self._last_timesteps = timesteps
+        self._writer = threading.Thread(target=self._write, args=(ckpt, model.getvalue(), state, deltas, entry),
+                                        name='checkpoint-writer', daemon=True)
+        self._writer.start()
+        self.stalls.append(time.perf_counter() - started)
+        if self.verbose:
+            print(f'checkpoint {ckpt} at {timesteps} timesteps ({self.stalls[-1] * 1000:.1f} ms)')
+
+    # ---------------- capturing (training thread) ----------------
+    def _chain(self, key, chains, base, mark):
+        """Continue chain `key` (or start it over if `base`) and give it its new mark."""
+        previous = self._chains.get(key)
+        ids = [] if base or previous is None else list(previous['ids'])
+        chains[key] = {'ids': ids, 'mark': mark, 'new': True}
+
+    def _callback_state(self, i, callback, deltas, chains):
+        attrs = {}
+        for name, value in vars(callback).items():
+            if name in _CALLBACK_LINKS:
+                continue
+            if isinstance(value, ColumnLog):
+                key = f'callback{i}.{name}'
+                value = self._log_delta(key, value, deltas, chains)
+            attrs[name] = value
+        return type(callback).__qualname__, copy.deepcopy(attrs)
+
+    def _log_delta(self, key, log, deltas, chains):
+        # logs only grow, until a flush moves their rows out to a part file
+        # or the in-memory cap drops the oldest ones
+        chain = self._chains.get(key)
+        mark = chain and chain['mark']
+        base = (mark is None or mark['parts'] != log.parts or mark.get('dropped') != log.rows_dropped
+                or mark['size'] > log.size or len(chain['ids']) >= _MAX_LOG_CHAIN)
+        start = 0 if base else mark['size']
+        self._chain(key, chains, base, {'parts': log.parts, 'dropped': log.rows_dropped, 'size': log.size})
+        if log.size > start or base:
+            for name in log.dtypes:
+                deltas[f'{key}:{name}'] = log[name][start:].copy()
+        else:
+            chains[key]['new'] = False
+        return _LogRef(key, log)
+
+    def _replay_delta(self, buffer, timesteps, deltas, chains):
+        rows = _buffer_rows(buffer)
+        size = buffer.buffer_size
+        # every env step adds one slot and may rewrite the next one (CompactReplayBuffer)
+        adds = (timesteps - self._last_timesteps) // buffer.n_envs
+        mark = self._chains.get('replay', {}).get('mark')
+        base = mark is None or mark['rows'] + adds + 1 > size or (mark['pos'] + adds) % size != buffer.pos
+        if base:
+            slots = np.arange(size if buffer.full else min(buffer.pos + 1, size))
+        else:
+            slots = (mark['pos'] + np.arange(adds + 1)) % size
+        # rows: slots written by the deltas since the base
+        self._chain('replay', chains, base, {'pos': buffer.pos, 'rows': 0 if base else mark['rows'] + len(slots)})
+        deltas['replay:_slots'] = slots
+        for name, array in rows.items():
+            # copies: training goes on writing the buffer while the thread saves them
+            deltas[f'replay:{name}'] = np.array(array[:len(slots)] if base else array[slots])
+        return copy.deepcopy({k: v for k, v in vars(buffer).items() if k not in rows and k not in _BUFFER_SKIP})
+
+    # ---------------- writing (background thread) ----------------
+    def _write(self, ckpt, model, state, deltas, entry):
+        try:
+            name = f'{ckpt:06d}'
+            if deltas:
+                target = os.path.join(self.path, 'deltas', f'{name}.npz')
+                with open(target + '.tmp', 'wb') as f:
+                    np.savez(f, **deltas)
+                os.replace(target + '.tmp', target)
+            directory = os.path.join(self.path, 'checkpoints', name)
+            for d in (directory + '.tmp', directory):
+                shutil.rmtree(d, ignore_errors=True)
+            os.makedirs(directory + '.tmp')
+            with open(os.path.join(directory + '.tmp', 'model.zip'), 'wb') as f:
+                f.write(model)
+            with open(os.path.join(directory + '.tmp', 'state.pkl'), 'wb') as f:
+                pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(directory + '.tmp', directory)
+
+            manifest = self._manifest
+            manifest['checkpoints'][str(ckpt)] = entry
+            manifest['latest'] = ckpt
+            kept = sorted(manifest['checkpoints'], key=int)[-self.keep:]
+            manifest['checkpoints'] = {k: manifest['checkpoints'][k] for k in kept}
+            with open(os.path.join(self.path, MANIFEST + '.tmp'), 'w') as f:
+                json.dump(manifest, f)
+            os.replace(os.path.join(self.path, MANIFEST + '.tmp'), os.path.join(self.path, MANIFEST))
+            self._prune(manifest)
+        except BaseException as e:
+            self._error = e
+
+    def _prune(self, manifest):
+        """Delete checkpoints no longer in the manifest and deltas none of them needs."""
+        kept = {f'{int(k):06d}' for k in manifest['checkpoints']}
+        needed = {f'{i:06d}.npz' for entry in manifest['checkpoints'].values()
+                  for chain in entry['chains'].values() for i in chain['ids']}
+        for name in os.listdir(os.path.join(self.path, 'checkpoints')):
+            if name not in kept:
+                shutil.rmtree(os.path.join(self.path, 'checkpoints', name), ignore_errors=True)
+        for name in os.listdir(os.path.join(self.path, 'deltas')):
+            if name not in needed:
+                os.remove(os.path.join(self.path, 'deltas', name))
+
+
+def _chain_columns(path, key, ids):
+    """The `key` columns of every delta in a chain, in order, as {column: [array, ...]}."""
+    columns = {}
+    for i in ids:
+        with np.load(os.path.join(path, 'deltas', f'{i:06d}.npz')) as delta:
+            for name in delta.files:
+                chain, _, column = name.partition(':')
+                if chain == key:
+                    columns.setdefault(column, []).append(delta[name])
+    return columns
+
+
+def load_checkpoint(path, env, callbacks=(), **load_kwargs):
+    """
+    Load the newest checkpoint under `path` onto `env` (built as the
+    checkpointed one was) and restore the state of `callbacks` (the list
+    given to IncrementalCheckpoint). Continue with
+
+        model.learn(total_timesteps - model.num_timesteps, callback=...,
+                    reset_num_timesteps=False)
+
+    which resumes the run exactly where the checkpoint was taken.
+    `load_kwargs` go to the algorithm's load() (device, ...).
+    """
+    entry = latest_checkpoint(path)
+    if entry is None:
+        raise FileNotFoundError(f'no checkpoint in {path}')
+    directory = os.path.join(path, 'checkpoints', f'{entry["id"]:06d}')
+    with open(os.path.join(directory, 'state.pkl'), 'rb') as f:
+        state = pickle.load(f)
+    module, name = state['algo'].split(':')
+    # force_reset=False keeps the last observation: the env is restored below, not reset
+    model = getattr(importlib.import_module(module), name).load(os.path.join(directory, 'model.zip'), env=env,
+                                                                force_reset=False, **load_kwargs)
+
+    if state['replay'] is not None:
+        buffer = model.replay_buffer
+        columns = _chain_columns(path, 'replay', entry['chains']['replay']['ids'])
+        rows = _buffer_rows(buffer)
+        for k, slots in enumerate(columns.pop('_slots')):
+            for name, array in rows.items():
+                array[slots] = columns[name][k]
+        vars(buffer).update(state['replay'])
+
+    _set_env_state(model.get_env(), state['env'])
+
+    if [type(cb).__qualname__ for cb in callbacks] != [name for name, _ in state['callbacks']]:
+        raise ValueError(f'checkpoint has callbacks {[name for name, _ in state["callbacks"]]}, '
+                         f'got {[type(cb).__qualname__ for cb in callbacks]}')
+    for callback, (_, attrs) in zip(callbacks, state['callbacks']):
+        for attr, value in attrs.items():
+            if isinstance(value, _LogRef):
+                ids = entry['chains'][value.key]['ids']
+                columns = {k: np.concatenate(v) for k, v in _chain_columns(path, value.key, ids).items()}
+                attrs[attr] = value.restore(columns)
+        vars(callback).update(attrs)
+
+    # last: loading the model reseeded every generator
+    _set_rng_state(model, state['rng'])
+    return model
@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+
+
+class ColumnLog:
+    """
+    Append-only table of numeric columns kept in preallocated NumPy arrays.
+
+    Rows are appended in batches (one row per env that finished an episode,
+    one per env per step, ...). Without a `path` the table stays in memory:
+    the arrays double when full, up to `max_rows` rows, after which the
+    oldest half is dropped (counted in `rows_dropped`) so a long run cannot
+    use up memory. With a `path` (a directory) the table is streamed to
+    Parquet instead: every `flush_every` rows the buffer is written out as
+    the next part file and reused, so memory stays flat however long the run
+    is, and every part is complete on disk as soon as it is written. Columns
+    then only hold the rows not yet flushed; read() returns the full history.
+    pyarrow is only imported when a part is written or read.
+    """
+
+    def __init__(self, columns, path=None, flush_every=1 << 20, max_rows=1 << 22):
+        # columns: {name: dtype}, in output order
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in columns.items()}
+        self.path = path
+        self.max_rows = max_rows
+        self.size = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.parts = 0
+        self.capacity = flush_every if path is not None else 4096
+        self._data = {name: np.empty(self.capacity, dtype) for name, dtype in self.dtypes.items()}
+
+    def __len__(self):
+        return self.rows_written + self.rows_dropped + self.size
+
+    def __getitem__(self, name):
+        return self._data[name][:self.size]
+
+    def append(self, **columns):
+        """Append rows; every column gets an array (or scalar) of the same length."""
+        k = max(np.size(v) for v in columns.values())
+        if self.size + k > self.capacity and self.path is not None:
+            self.flush()
+        elif self.path is None and self.max_rows is not None and self.size + k > self.max_rows:
+            self._drop(min(self.size, self.size + k - self.max_rows // 2))
+        if self.size + k > self.capacity:
+            self._grow(self.size + k)
+        end = self.size + k
+        for name, values in columns.items():
+            self._data[name][self.size:end] = values
+        self.size = end
+
+    def _drop(self, n):
+        """Forget the oldest `n` buffered rows."""
+        for column in self._data.values():
+            column[:self.size - n] = column[n:self.size]
+        self.size -= n
+        self.rows_dropped += n
+
+    def _grow(self, n):
+        capacity = 2 * self.capacity
+        if self.path is None and self.max_rows is not None:
+            capacity = min(capacity, self.max_rows)
+        self.capacity = max(n, capacity)
+        for name, old in self._data.items():
+            self._data[name] = np.empty(self.capacity, old.dtype)
+            self._data[name][:self.size] = old[:self.size]
+
+    def flush(self):
+        """Write buffered rows as the next Parquet part (if there is a path) and empty the buffer."""
+        if self.path is None or self.size == 0:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        os.makedirs(self.path, exist_ok=True)
+        table = pa.table({name: self[name] for name in self.dtypes})
+        pq.write_table(table, os.path.join(self.path, f'part-{self.parts:05d}.parquet'))
+        self.parts += 1
+        self.rows_written += self.size
+        self.size = 0
+
+    def read(self):
+        """
+        Every row still available, as {name: array}: the Parquet parts read
+        back, then the buffered rows (in memory: the rows not dropped).
+        """
+        parts = []
+        if self.path is not None and self.parts:
+            import pyarrow.parquet as pq
+            parts = [pq.read_table(os.path.join(self.path, f'part-{i:05d}.parquet')) for i in range(self.parts)]
+        return {name: np.concatenate([p[name].to_numpy() for p in parts] + [self[name]]).astype(dtype, copy=False)
+                for name, dtype in self.dtypes.items()}
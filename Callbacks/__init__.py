@@ -0,0 +1,31 @@
+"""SB3 training callbacks; like sdwan_env, names are imported on first use."""
+import importlib
+
+_EXPORTS = {
+    'EpisodeReturnLogger': 'CallbacksCL',
+    'CongestionLogger': 'CallbacksCL',
+    'JointActionLogger': 'CallbacksCL',
+    'ProfileLogger': 'CallbacksCL',
+    'FlowStatsLogger': 'CallbacksCL',
+    'info_keys': 'CallbacksCL',
+    'info_columns': 'CallbacksCL',
+    'AgentAndTotalLogger': 'CallbacksIL',
+    'ColumnLog': 'ColumnLog',
+    'IncrementalCheckpoint': 'Checkpoint',
+    'load_checkpoint': 'Checkpoint',
+    'latest_checkpoint': 'Checkpoint',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+from stable_baselines3.common.buffers import BaseBuffer, ReplayBuffer
+from stable_baselines3.common.type_aliases import ReplayBufferSamples
+
+from .Topology import Topology
+
+
+class CompactReplayBuffer(ReplayBuffer):
+    """
+    ReplayBuffer for SDWANEnv observations that takes about a third of the
+    memory, for DQN(..., replay_buffer_class=CompactReplayBuffer).
+
+    - Next observations are not stored: transition i's next observation is
+      the observation stored for i + 1, except after a done, whose terminal
+      observation goes to a small side table. The one transition whose
+      observation the newest next observation overwrote (when the buffer is
+      full) keeps it in a spare row.
+    - The integer-valued fields (`int_fields` of the observation: latency,
+      loss and queue length by default) are stored as `int_dtype`, the rest
+      as float32. add() checks every value survives the round trip and
+      raises ValueError if not (e.g. fluid mode's fractional queues: leave
+      queue_len and loss out of int_fields there).
+    - Actions, dones and timeouts use the smallest dtype that holds them.
+
+    Samples are exactly what SB3's ReplayBuffer would return for the same
+    transitions and the same np.random state. With `path`, the arrays are
+    memory-mapped .npy files in that directory instead of RAM.
+    """
+
+    def __init__(self, buffer_size, observation_space, action_space, device='auto', n_envs=1,
+                 optimize_memory_usage=False, handle_timeout_termination=True, topology=None,
+                 int_fields=('latency', 'loss', 'queue_len'), int_dtype=np.uint16, path=None):
+        BaseBuffer.__init__(self, buffer_size, observation_space, action_space, device, n_envs=n_envs)
+        if optimize_memory_usage:
+            raise ValueError('CompactReplayBuffer always stores next observations implicitly; '
+                             'leave optimize_memory_usage off')
+        self.optimize_memory_usage = False
+        self.handle_timeout_termination = handle_timeout_termination
+        self.buffer_size = max(buffer_size // n_envs, 1)
+        topo = topology if isinstance(topology, Topology) else Topology(topology)
+        if self.obs_shape != (topo.obs_size,):
+            raise ValueError(f'observation shape {self.obs_shape} is not the topology\'s ({topo.obs_size},)')
+
+        is_int = np.zeros(topo.obs_size, bool)
+        for field in int_fields:
+            is_int[topo.obs_slices[field]] = True
+        self.int_cols, self.float_cols = np.flatnonzero(is_int), np.flatnonzero(~is_int)
+        self.int_dtype = np.dtype(int_dtype)
+        self.path = path
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+        size, n = self.buffer_size, n_envs
+        action_dtype = self._maybe_cast_dtype(action_space.dtype)
+        self.action_dtype = action_dtype
+        if np.issubdtype(action_dtype, np.integer):
+            high = int(np.max(getattr(action_space, 'nvec', getattr(action_space, 'n', 0))))
+            stored_action = np.min_scalar_type(high)
+        else:
+            stored_action = action_dtype
+        self.float_obs = self._array('float_obs', (size, n, len(self.float_cols)), np.float32)
+        self.int_obs = self._array('int_obs', (size, n, len(self.int_cols)), self.int_dtype)
+        self.actions = self._array('actions', (size, n, self.action_dim), stored_action)
+        self.rewards = self._array('rewards', (size, n), np.float32)
+        self.dones = self._array('dones', (size, n), bool)
+        self.timeouts = self._array('timeouts', (size, n), bool)
+        # terminal observations of done transitions, by flat index pos * n_envs + env
+        self.has_terminal = np.zeros((size, n), bool)
+        self.terminal = {}
+        self._spare = None  # (float, int) observation rows of transition `pos` once full
+
+    def _array(self, name, shape, dtype):
+        if self.path is None:
+            return np.zeros(shape, dtype)
+        return np.lib.format.open_memmap(os.path.join(self.path, f'{name}.npy'), 'w+', dtype, shape)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the transition arrays (in RAM or on disk)."""
+        arrays = (self.float_obs, self.int_obs, self.actions, self.rewards, self.dones, self.timeouts)
+        return sum(a.nbytes for a in arrays) + self.has_terminal.nbytes
+
+    def _split(self, obs):
+        obs = np.asarray(obs, np.float32).reshape(-1, self.obs_shape[0])
+        ints = obs[:, self.int_cols].astype(self.int_dtype)
+        if not np.array_equal(ints, obs[:, self.int_cols]):
+            raise ValueError(f'observation fields do not fit {self.int_dtype} exactly: {obs[:, self.int_cols]}')
+        return obs[:, self.float_cols], ints
+
+    def add(self, obs, next_obs, action, reward, done, infos):
+        pos, n = self.pos, self.n_envs
+        nxt = (pos + 1) % self.buffer_size
+        # the transition being replaced loses its terminal observations
+        for e in np.flatnonzero(self.has_terminal[pos]):
+            del self.terminal[pos * n + e]
+        self.float_obs[pos], self.int_obs[pos] = self._split(obs)
+        self.actions[pos] = np.asarray(action).reshape(n, self.action_dim)
+        self.rewards[pos] = reward
+        done = np.asarray(done, bool)
+        self.dones[pos] = done
+        if self.handle_timeout_termination:
+            self.timeouts[pos] = [info.get('TimeLimit.truncated', False) for info in infos]
+
+        next_float, next_int = self._split(next_obs)
+        self.has_terminal[pos] = done
+        for e in np.flatnonzero(done):
+            self.terminal[pos * n + e] = next_float[e].copy(), next_int[e].copy()
+        live = ~done
+        if self.full or nxt == 0:
+            # slot nxt still holds the oldest transition's observation
+            self._spare = self.float_obs[nxt].copy(), self.int_obs[nxt].copy()
+        self.float_obs[nxt, live] = next_float[live]
+        self.int_obs[nxt, live] = next_int[live]
+
+        self.pos = nxt
+        if nxt == 0:
+            self.full = True
+
+    def _observations(self, floats, ints):
+        obs = np.empty((len(floats), self.obs_shape[0]), np.float32)
+        obs[:, self.float_cols] = floats
+        obs[:, self.int_cols] = ints
+        return obs
+
+    def _get_samples(self, batch_inds, env=None):
+        env_indices = np.random.randint(0, high=self.n_envs, size=(len(batch_inds),))
+        floats = self.float_obs[batch_inds, env_indices]
+        ints = self.int_obs[batch_inds, env_indices]
+        if self.full:
+            # transition `pos` had its observation overwritten by the newest next observation
+            for k in np.flatnonzero(batch_inds == self.pos):
+                floats[k], ints[k] = self._spare[0][env_indices[k]], self._spare[1][env_indices[k]]
+        next_inds = (batch_inds + 1) % self.buffer_size
+        next_floats = self.float_obs[next_inds, env_indices]
+        next_ints = self.int_obs[next_inds, env_indices]
+        for k in np.flatnonzero(self.has_terminal[batch_inds, env_indices]):
+            next_floats[k], next_ints[k] = self.terminal[batch_inds[k] * self.n_envs + env_indices[k]]
+
+        dones = self.dones[batch_inds, env_indices].astype(np.float32)
+        timeouts = self.timeouts[batch_inds, env_indices].astype(np.float32)
+        data = (
+            self._normalize_obs(self._observations(floats, ints), env),
+            self.actions[batch_inds, env_indices].astype(self.action_dtype),
+            self._normalize_obs(self._observations(next_floats, next_ints), env),
+            (dones * (1 - timeouts)).reshape(-1, 1),
+            self._normalize_reward(self.rewards[batch_inds, env_indices].reshape(-1, 1), env),
+        )
+        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
@@ -0,0 +1,113 @@
+import heapq
+from collections import deque
+
+import numpy as np
+
+ARRIVAL, COMPLETION = 0, 1
+
+
+class EventQueue:
+    """
+    One overlay in the discrete-event engine: a FIFO link that sends one
+    flow at a time at its full service rate, with room for `capacity` flows
+    (including the one being sent).
+
+    `flows` holds (arrival time, size in Mb, branch) in arrival order; the
+    head has been in service since `service_start`. Nothing else is stored,
+    so between decision epochs the queue's state is just these, and the
+    head's completion time is service_start + size / service_rate.
+    """
+    __slots__ = ('flows', 'capacity', 'service_rate', 'latency', 'service_start')
+
+    def __init__(self, capacity, service_rate, latency):
+        self.capacity = capacity
+        self.service_rate = service_rate
+        self.latency = latency  # seconds, added to every flow's completion time
+        self.flows = deque()
+        self.service_start = 0.0
+
+    @property
+    def size(self):
+        return len(self.flows)
+
+    def __len__(self):
+        return len(self.flows)
+
+    def clear(self):
+        self.flows.clear()
+        self.service_start = 0.0
+
+    def get_state(self):
+        """The queue as flat words: its size, then the float64 bits of service_start and each flow."""
+        words = np.array([self.service_start] + [x for flow in self.flows for x in flow]).view(np.uint64)
+        return np.concatenate((np.array([len(self.flows)], np.uint64), words))
+
+    def set_state(self, words):
+        """Restore from words starting with a get_state() result; returns how many words it used."""
+        n = int(words[0])
+        values = words[1:2 + 3 * n].view(np.float64).tolist()
+        self.service_start = values[0]
+        self.flows = deque((a, bits, int(b)) for a, bits, b in zip(values[1::3], values[2::3], values[3::3]))
+        return 2 + 3 * n
+
+
+def run_epoch(queues, arrivals, overlays, start, end, rng):
+    """
+    Simulate the overlays from `start` to `end` (seconds) with a heap of
+    arrival and completion events.
+
+    `arrivals[b]` are branch b's flow sizes (MB) arriving during the epoch,
+    at uniformly random times (a Poisson process, given their count), and
+    go to overlay `overlays[b]`. A flow that finds its queue full, or an
+    overlay with no capacity, is dropped. Only the head of every queue has
+    a completion event, so the work is per event, not per queued flow, and
+    a queue that sits idle or busy on one long flow costs nothing.
+
+    Returns per-overlay (completions, drops, busy seconds) and the
+    completed flows as (overlay, branch, completion time) tuples, the
+    completion time being queueing plus sending time plus the overlay's
+    latency.
+    """
+    n = len(queues)
+    comps, drops, busy = [0] * n, [0] * n, [0.0] * n
+    completed = []
+    events = []
+    seq = 0
+    for b, sizes in enumerate(arrivals):
+        if len(sizes):
+            o = int(overlays[b])
+            for t, size in zip((start + (end - start) * rng.random(len(sizes))).tolist(), sizes.tolist()):
+                events.append((t, seq, ARRIVAL, o, 8 * size, b))
+                seq += 1
+    for o, q in enumerate(queues):
+        if q.flows:
+            events.append((q.service_start + q.flows[0][1] / q.service_rate, seq, COMPLETION, o, 0.0, 0))
+            seq += 1
+    heapq.heapify(events)
+
+    while events and events[0][0] < end:
+        t, _, kind, o, bits, b = heapq.heappop(events)
+        q = queues[o]
+        if kind == ARRIVAL:
+            if q.service_rate <= 0 or len(q.flows) >= q.capacity:
+                drops[o] += 1
+                continue
+            q.flows.append((t, bits, b))
+            if len(q.flows) == 1:
+                q.service_start = t
+                heapq.heappush(events, (t + bits / q.service_rate, seq, COMPLETION, o, 0.0, 0))
+                seq += 1
+        else:
+            arrived, _, branch = q.flows.popleft()
+            comps[o] += 1
+            completed.append((o, branch, t - arrived + q.latency))
+            busy[o] += t - max(q.service_start, start)
+            q.service_start = t
+            if q.flows:
+                heapq.heappush(events, (t + q.flows[0][1] / q.service_rate, seq, COMPLETION, o, 0.0, 0))
+                seq += 1
+
+    for o, q in enumerate(queues):
+        if q.flows:
+            busy[o] += end - max(q.service_start, start)
+    return comps, drops, busy, completed
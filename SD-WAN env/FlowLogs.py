@@ -0,0 +1,145 @@
+import warnings
+
+import numpy as np
+
+from .Topology import Topology
+from .TrafficTrace import TraceWriter
+
+# steps written per TraceWriter.write() call, bounding memory over long gaps
+_BLOCK_STEPS = 1 << 16
+
+
+def ingest_flow_logs(paths, out_path, topology=None, branch_map=None, max_steps=300, step_seconds=1.0,
+                     time_column='start', branch_column='branch', bytes_column='bytes', start_time=None,
+                     lateness_steps=60, size_divisor=10, chunksize=1_000_000, read_csv_kwargs=None,
+                     max_gap_steps=None):
+    """
+    Convert NetFlow/IPFIX-style CSV flow exports into a TrafficTrace that
+    SDWANEnv / VecSDWANEnv can replay, reading `chunksize` rows at a time.
+
+    Every row is one flow: it arrives at the step its `time_column` falls in
+    (epoch seconds or anything pandas.to_datetime parses; steps are
+    `step_seconds` long from `start_time`, by default the first row's time),
+    at the branch `branch_map[row[branch_column]]` (without a map the column
+    must hold branch names) and with size `bytes_column` bytes, stored in
+    units of 1 / size_divisor MB like the synthetic traffic.
+
+    Exports are only roughly time-ordered, so steps are held back until a
+    row `lateness_steps` later has been seen; rows for steps already written
+    are dropped and counted as `late_rows`, rows whose branch is not in the
+    map as `unmapped_rows` and rows whose byte count is missing, negative
+    or not finite as `invalid_size_rows` (with a warning). Memory therefore depends on the chunk size and
+    the lateness window, not on the size of the logs or the time they span.
+    Steps between flows are written as empty steps, so a corrupt timestamp
+    far in the future would pad the trace up to it: with `max_gap_steps`,
+    rows past a jump of more than that many steps beyond the newest step so
+    far (or the chunk's median step) are dropped as `outlier_rows` with a
+    warning. Set it above the longest real pause in the logs.
+
+    The result is cut into `max_steps`-step episodes; the counters, the time
+    range and empirical per-step arrival rates and mean flow sizes per branch
+    (to set a matching topology) go to meta.json.
+    """
+    import pandas as pd
+
+    topo = topology if isinstance(topology, Topology) else Topology(topology)
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    branch_index = {name: b for b, name in enumerate(topo.branch_names)}
+    if branch_map is not None:
+        branch_index = {key: branch_index[name] for key, name in branch_map.items()}
+    n_branches = topo.n_branches
+
+    writer = TraceWriter(out_path, topo.branch_names, max_steps, np.uint32, np.uint32, size_divisor)
+    stats = dict(rows=0, late_rows=0, unmapped_rows=0, invalid_size_rows=0, outlier_rows=0)
+    flows_per_branch = np.zeros(n_branches, np.int64)
+    size_per_branch = np.zeros(n_branches)
+    pending = []     # (step, branch, raw size) arrays not written yet
+    written = 0      # steps [0, written) are on disk
+    newest = 0       # newest step kept so far, for max_gap_steps
+    start = None
+
+    def flush(until):
+        """Write steps [written, until) from the pending rows."""
+        nonlocal written, pending
+        if until <= written:
+            return
+        step, branch, size = (np.concatenate(c) for c in zip(*pending)) if pending else (np.zeros(0, np.int64),) * 3
+        due = step < until
+        # stable sort keeps the log order of flows within a (step, branch)
+        order = np.lexsort((branch[due], step[due]))
+        s, b, z = step[due][order], branch[due][order], size[due][order]
+        # counts of the steps that have flows only, then written out in
+        # blocks with the empty steps between them
+        steps, row = np.unique(s, return_inverse=True)
+        counts = np.bincount(row * n_branches + b, minlength=len(steps) * n_branches).reshape(-1, n_branches)
+        flows = np.concatenate(([0], np.cumsum(counts.sum(1))))
+        for lo in range(written, until, _BLOCK_STEPS):
+            hi = min(lo + _BLOCK_STEPS, until)
+            i, j = np.searchsorted(steps, [lo, hi])
+            block = np.zeros((hi - lo, n_branches), np.int64)
+            block[steps[i:j] - lo] = counts[i:j]
+            writer.write(block, z[flows[i]:flows[j]])
+        pending = [(step[~due], branch[~due], size[~due])]
+        written = until
+
+    kwargs = dict(read_csv_kwargs or {}, usecols=[time_column, branch_column, bytes_column], chunksize=chunksize)
+    for path in paths:
+        for chunk in pd.read_csv(path, **kwargs):
+            stats['rows'] += len(chunk)
+            t = chunk[time_column]
+            if not pd.api.types.is_numeric_dtype(t):
+                t = pd.to_datetime(t, utc=True).astype('int64') / 1e9
+            t = t.to_numpy(float)
+            if start is None:
+                start = float(t.min()) if start_time is None else float(start_time)
+            step = np.floor((t - start) / step_seconds).astype(np.int64)
+            branch = chunk[branch_column].map(branch_index).to_numpy(float)
+            size = chunk[bytes_column].to_numpy(float)
+
+            known = ~np.isnan(branch)
+            stats['unmapped_rows'] += int(np.count_nonzero(~known))
+            # NaN or negative sizes would wrap in the trace's unsigned dtype
+            invalid = known & ~(np.isfinite(size) & (size >= 0))
+            if invalid.any():
+                stats['invalid_size_rows'] += int(np.count_nonzero(invalid))
+                warnings.warn(f'{path}: dropping {np.count_nonzero(invalid)} rows whose {bytes_column!r} is '
+                              f'missing, negative or not finite')
+                known &= ~invalid
+            size = np.rint(np.where(known, size, 0) / 1e6 * size_divisor).astype(np.int64)
+            on_time = known & (step >= written)
+            stats['late_rows'] += int(np.count_nonzero(known & ~on_time))
+            step, branch, size = step[on_time], branch[on_time].astype(np.int64), size[on_time]
+            if max_gap_steps is not None and len(step):
+                # from the newest step so far (or the chunk's median, which a
+                # few corrupt rows do not move), every step after the first
+                # jump of more than max_gap_steps
+                ref = max(newest, int(np.median(step)))
+                ahead = np.unique(step[step > ref])
+                jumps = np.flatnonzero(np.diff(ahead, prepend=ref) > max_gap_steps)
+                if len(jumps):
+                    kept = step < ahead[jumps[0]]
+                    stats['outlier_rows'] += int(np.count_nonzero(~kept))
+                    warnings.warn(f'{path}: dropping {np.count_nonzero(~kept)} rows more than {max_gap_steps} '
+                                  f'steps after the previous one (first at step {ahead[jumps[0]]})')
+                    step, branch, size = step[kept], branch[kept], size[kept]
+                if len(step):
+                    newest = max(newest, int(step.max()))
+            flows_per_branch += np.bincount(branch, minlength=n_branches)
+            size_per_branch += np.bincount(branch, size / size_divisor, minlength=n_branches)
+            pending.append((step, branch, size))
+            if len(step):
+                flush(int(step.max()) - lateness_steps)
+    if pending:
+        flush(max((int(p[0].max()) + 1 for p in pending if len(p[0])), default=written))
+
+    steps = max(written, 1)
+    return writer.close(
+        source='flow_logs',
+        files=paths,
+        step_seconds=step_seconds,
+        start_time=start,
+        **stats,
+        arrival_rate=(flows_per_branch / steps).tolist(),
+        # in the topology's units: Poisson mean of the size in 0.1 MB
+        flow_size_mean=(10 * size_per_branch / np.maximum(flows_per_branch, 1)).tolist(),
+    )
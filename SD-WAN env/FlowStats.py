@@ -0,0 +1,98 @@
+import math
+
+import numpy as np
+
+
+class FlowStats:
+    """
+    Streaming flow completion time quantiles per overlay and per branch.
+
+    Every row (overlays first, then branches, in topology order) is a
+    log-bucketed histogram in the style of DDSketch: bucket i holds values
+    in (min_value * g^(i-1), min_value * g^i] with g = (1 + alpha) / (1 - alpha),
+    so any quantile comes back within relative error `alpha` of a value
+    actually seen, from a fixed number of buckets whatever the flow count.
+    Values below min_value or above max_value land in the first or last
+    bucket. Sketches of several envs merge by adding counts. add() only
+    queues values; they are bucketed in batches of `batch` flows, or when
+    read.
+    """
+
+    def __init__(self, topology, alpha=0.01, min_value=1e-3, max_value=1e6, batch=4096):
+        self.alpha = alpha
+        self.min_value = min_value
+        self.names = [f'overlay/{o}' for o in topology.overlay_names] + [f'branch/{b}' for b in topology.branch_names]
+        self.n_overlays = topology.n_overlays
+        self._log_gamma = math.log((1 + alpha) / (1 - alpha))
+        self.n_buckets = int(math.ceil(math.log(max_value / min_value) / self._log_gamma)) + 1
+        self.counts = np.zeros((len(self.names), self.n_buckets), np.int64)
+        self.sums = np.zeros(len(self.names))
+        self.batch = batch
+        self._pending = []
+        self._n_pending = 0
+
+    def clear(self):
+        self.counts[:] = 0
+        self.sums[:] = 0
+        self._pending.clear()
+        self._n_pending = 0
+
+    def add(self, overlays, branches, times):
+        """
+        Record completed flows: their overlay and branch indices (arrays, or
+        one index for all) and completion times in seconds.
+        """
+        times = np.asarray(times, float)
+        self._pending.append((overlays, branches, times))
+        self._n_pending += times.size
+        if self._n_pending >= self.batch:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        overlays, branches, times = (np.concatenate([np.broadcast_to(x, p[2].shape) for x, p in zip(col, self._pending)])
+                                     for col in zip(*self._pending))
+        self._pending.clear()
+        self._n_pending = 0
+        if times.size == 0:
+            return
+        bucket = np.ceil(np.log(np.maximum(times, self.min_value) / self.min_value) / self._log_gamma)
+        bucket = np.minimum(bucket.astype(np.int64), self.n_buckets - 1)
+        rows = np.concatenate((np.asarray(overlays, np.int64), self.n_overlays + np.asarray(branches, np.int64)))
+        flat = rows * self.n_buckets + np.tile(bucket, 2)
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+        np.add.at(self.sums, rows, np.tile(times, 2))
+
+    def merge(self, other):
+        self._flush()
+        other._flush()
+        self.counts += other.counts
+        self.sums += other.sums
+        return self
+
+    def copy(self):
+        self._flush()
+        other = object.__new__(FlowStats)
+        other.__dict__.update(self.__dict__)
+        other.counts, other.sums = self.counts.copy(), self.sums.copy()
+        other._pending = []
+        return other
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)):
+        """{row name: {'count', 'mean', 'p50', ...}} for every row with flows."""
+        self._flush()
+        gamma = math.exp(self._log_gamma)
+        # a bucket's midpoint in relative terms: within alpha of both edges
+        centers = self.min_value * gamma ** np.arange(self.n_buckets) * 2 / (1 + gamma)
+        out = {}
+        for name, counts, total in zip(self.names, self.counts, self.sums.tolist()):
+            n = int(counts.sum())
+            if n == 0:
+                continue
+            ranks = np.cumsum(counts)
+            stats = {'count': n, 'mean': total / n}
+            for q in qs:
+                stats[f'p{100 * q:g}'] = float(centers[np.searchsorted(ranks, q * (n - 1), side='right')])
+            out[name] = stats
+        return out
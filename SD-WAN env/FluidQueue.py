@@ -0,0 +1,75 @@
+import numpy as np
+
+
+class FluidQueue:
+    """
+    Fluid approximation of an OverlayQueue: the queue is three aggregates,
+    updated in closed form, instead of one entry per request.
+
+      size    number of queued requests (fractional)
+      demand  sum of their per-step demands (Mbps)
+      work    sum of their remaining work (Mb), i.e. demand x remaining steps
+
+    A step of service then costs O(1) whatever the load. Requests are
+    treated as interchangeable: with capacity c and demand D, min(D, c) is
+    used, a fraction min(1, c / D) of the requests is served and the rest
+    count as losses, and a served request finishes with probability
+    demand / work (one over its mean remaining steps). Per-request demands
+    are taken as min(mean size in Mb, service rate), the exact model's
+    demand for a request of mean size.
+
+    The queue itself is cheap, but an SDWANEnv step also does the work both
+    modes share, so fluid mode steps only about 2.5x faster than exact mode
+    at the default load (see SDWANEnv's `mode`).
+    """
+    __slots__ = ('size', 'demand', 'work', 'capacity', 'service_rate')
+
+    def __init__(self, capacity, service_rate):
+        self.capacity = capacity
+        self.service_rate = service_rate
+        self.clear()
+
+    def __len__(self):
+        return int(round(self.size))
+
+    def clear(self):
+        self.size = self.demand = self.work = 0.0
+
+    def get_state(self):
+        """The queue as flat words: the float64 bits of size, demand and work."""
+        return np.array([self.size, self.demand, self.work]).view(np.uint64)
+
+    def set_state(self, words):
+        """Restore from words starting with a get_state() result; returns how many words it used."""
+        self.size, self.demand, self.work = words[:3].view(np.float64).tolist()
+        return 3
+
+    def push(self, count, volume):
+        """Admit `count` requests of `volume` MB in total while there is room; returns how many fit."""
+        accepted = min(count, max(0.0, self.capacity - self.size))
+        if accepted <= 0:
+            return 0.0
+        bits = 8 * volume / count
+        self.size += accepted
+        self.work += accepted * bits
+        self.demand += accepted * min(bits, self.service_rate)
+        return accepted
+
+    def serve(self, capacity):
+        """One step of service with `capacity` Mbps; returns (completions, losses, capacity left)."""
+        n, demand = self.size, self.demand
+        if n <= 0 or demand <= 0:
+            return 0.0, 0.0, capacity
+        used = demand
+        if demand > capacity:
+            # whole requests only: after floor(capacity / mean demand) mean
+            # requests the rest is too small for the mean request; greedy
+            # FIFO still fits smaller ones into it, about half on average
+            mean = demand / n
+            used = capacity - 0.5 * (capacity % mean)
+        served = n * used / demand
+        comps = served * min(1.0, demand / self.work) if self.work > 0 else served
+        self.work = max(0.0, self.work - used)
+        self.demand = max(0.0, demand - comps * demand / n)
+        self.size = max(0.0, n - comps)
+        return comps, n - served, capacity - used
@@ -0,0 +1,120 @@
+import numpy as np
+
+
+class OverlayQueue:
+    """
+    FIFO queue of requests on one overlay, stored as parallel arrays.
+
+    Each request needs `demand` Mbps on each of its `remaining` steps (its size
+    in bits spread evenly over the steps it was given when it arrived), so
+    serving a request never has to touch its size. Slots [0, size) hold the
+    queued requests in arrival order, with the step each arrived in and the
+    branch it came from; with `track` set, serve() leaves those of the
+    requests it completed in `finished_arrived` / `finished_branch`.
+    """
+    __slots__ = ('demand', 'remaining', 'arrived', 'branch', 'size', 'track', 'finished_arrived',
+                 'finished_branch', '_left')
+
+    def __init__(self, capacity):
+        self.demand = np.zeros(capacity)
+        self.remaining = np.zeros(capacity, np.int64)
+        self.arrived = np.zeros(capacity, np.int64)
+        self.branch = np.zeros(capacity, np.int64)
+        self.size = 0
+        self.track = False
+        self.finished_arrived = self.finished_branch = self.arrived[:0]
+        self._left = np.zeros(capacity + 1)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self.demand)
+
+    def clear(self):
+        self.size = 0
+
+    def get_state(self):
+        """The queue as flat words: its size, then its demands' float64 bits, remaining steps, arrival steps, branches."""
+        n = self.size
+        return np.concatenate((np.array([n], np.uint64), self.demand[:n].view(np.uint64),
+                               self.remaining[:n].view(np.uint64), self.arrived[:n].view(np.uint64),
+                               self.branch[:n].view(np.uint64)))
+
+    def set_state(self, words):
+        """Restore from words starting with a get_state() result; returns how many words it used."""
+        n = int(words[0])
+        if n > self.capacity:
+            raise ValueError(f'state holds {n} requests, the queue only fits {self.capacity}')
+        self.demand[:n] = words[1:1 + n].view(np.float64)
+        self.remaining[:n] = words[1 + n:1 + 2 * n].view(np.int64)
+        self.arrived[:n] = words[1 + 2 * n:1 + 3 * n].view(np.int64)
+        self.branch[:n] = words[1 + 3 * n:1 + 4 * n].view(np.int64)
+        self.size = n
+        return 1 + 4 * n
+
+    def push(self, demand, steps, arrived=0, branch=0):
+        """Append requests in order until the queue is full; returns how many fit."""
+        n = min(len(demand), self.capacity - self.size)
+        end = self.size + n
+        self.demand[self.size:end] = demand[:n]
+        self.remaining[self.size:end] = steps[:n]
+        self.arrived[self.size:end] = arrived
+        self.branch[self.size:end] = branch
+        self.size = end
+        return n
+
+    def serve(self, capacity):
+        """
+        Give one step of service with `capacity` Mbps available.
+
+        Requests are visited in FIFO order; one is served if its demand still
+        fits in what is left of the capacity, otherwise it counts as a loss.
+        Rather than visiting requests one at a time, each round serves the
+        longest run that fits (capacity is subtracted request by request with
+        a ufunc accumulate, so results match a plain loop exactly) and then
+        jumps past the request that did not fit to the next one that does.
+        The number of rounds is the number of served runs; finished requests
+        are removed in one compaction.
+
+        Returns (completions, losses, capacity left).
+        """
+        n = self.size
+        if n == 0:
+            return 0, 0, capacity
+        demand, remaining, left = self.demand[:n], self.remaining[:n], self._left
+        n_served = start = 0
+        while True:
+            m = n - start
+            run = left[:m + 1]
+            run[0] = capacity
+            run[1:] = demand[start:]
+            np.subtract.accumulate(run, out=run)
+            k = m - int(run[:0:-1].searchsorted(0))  # leading entries still >= 0
+            remaining[start:start + k] -= 1
+            n_served += k
+            capacity = run[k]
+            start += k + 1
+            if start >= n:
+                break
+            fits = demand[start:] <= capacity
+            j = int(fits.argmax())
+            if not fits[j]:
+                break
+            start += j
+
+        if n_served:
+            keep = remaining > 0
+            size = int(np.count_nonzero(keep))
+            if size < n:
+                arrived, branch = self.arrived[:n], self.branch[:n]
+                if self.track:
+                    done = ~keep
+                    self.finished_arrived, self.finished_branch = arrived[done], branch[done]
+                self.demand[:size] = demand[keep]
+                self.remaining[:size] = remaining[keep]
+                self.arrived[:size] = arrived[keep]
+                self.branch[:size] = branch[keep]
+                self.size = size
+        return n - self.size, n - n_served, capacity
@@ -0,0 +1,196 @@
+import json
+import os
+
+import numpy as np
+
+from .Topology import Topology
+from .TrafficTrace import _uint_dtype
+
+
+def dataset_fields(topology):
+    """{field: (dtype, width)} of every row of a rollout dataset for `topology`."""
+    topo = topology if isinstance(topology, Topology) else Topology(topology)
+    return {
+        'obs': (np.dtype(np.float32), topo.obs_size),
+        'action': (_uint_dtype(topo.joint_size - 1), 1),
+        'reward': (np.dtype(np.float32), 1),
+        'next_obs': (np.dtype(np.float32), topo.obs_size),
+        'done': (np.dtype(bool), 1),
+        'metrics': (np.dtype(np.float32), len(topo.info_keys)),  # info values, in topology.info_keys order
+        # the episode's number (first_seed-based, unique in the dataset); not
+        # a seed: a shard's episodes share one RNG, so only replaying the
+        # whole shard (same policy, epsilon and seed range) reproduces it
+        'episode': (np.dtype(np.int64), 1),
+    }
+
+
+def write_shard(path, name, columns, fields):
+    """Write one shard's `columns` ({field: (rows, width) array}) as fixed-width files under path/name."""
+    directory = os.path.join(path, 'shards', name)
+    os.makedirs(directory, exist_ok=True)
+    rows = len(columns['obs'])
+    for field, (dtype, width) in fields.items():
+        np.ascontiguousarray(columns[field], dtype).reshape(rows, width).tofile(os.path.join(directory, f'{field}.bin'))
+    return rows
+
+
+class DatasetIndex:
+    """
+    meta.json of a rollout dataset: its fields and the shards written so
+    far. Shards are only listed once all their files are written, so a
+    dataset whose build was interrupted is still readable, and the build can
+    skip what is already there. Opening an existing dataset with `meta` that
+    differs from what it was built with raises ValueError, rather than
+    mixing incompatible shards.
+    """
+
+    def __init__(self, path, **meta):
+        self.path = path
+        self.file = os.path.join(path, 'meta.json')
+        if os.path.exists(self.file):
+            with open(self.file) as f:
+                self.meta = json.load(f)
+            # compare as stored: through JSON, tuples are lists
+            given = json.loads(json.dumps(meta))
+            changed = sorted(k for k, v in given.items() if self.meta.get(k) != v)
+            if changed:
+                raise ValueError(f'{path} was built with other settings ({", ".join(changed)}); '
+                                 'use a new directory or the original arguments')
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.meta = dict(version=1, shards=[], **meta)
+
+    @property
+    def shards(self):
+        return {s['name']: s for s in self.meta['shards']}
+
+    def add(self, **shard):
+        self.meta['shards'].append(shard)
+        self.meta['shards'].sort(key=lambda s: s['name'])
+        tmp = self.file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp, self.file)
+
+
+class RolloutDataset:
+    """
+    Read-only, memory-mapped rollout dataset written by Algs/build_dataset.py.
+
+    Each shard holds whole episodes, one row per step in episode order,
+    with a fixed-width file per field (see dataset_fields()): obs, joint
+    action, total reward, next_obs (the terminal observation on the last
+    step), done, the step's info metrics and the episode's number. Shards are
+    opened lazily, so datasets larger than memory stream from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.fields = {name: (np.dtype(dtype), width) for name, (dtype, width) in self.meta['fields'].items()}
+        self.info_keys = self.meta['info_keys']
+        self.shards = self.meta['shards']
+        self.offsets = np.concatenate(([0], np.cumsum([s['rows'] for s in self.shards]))).astype(np.int64)
+        self._maps = {}
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def column(self, shard, field):
+        """Memory map of one field of shard number `shard`, (rows, width)."""
+        key = shard, field
+        if key not in self._maps:
+            dtype, width = self.fields[field]
+            name = os.path.join(self.path, 'shards', self.shards[shard]['name'], f'{field}.bin')
+            self._maps[key] = np.memmap(name, dtype, 'r', shape=(self.shards[shard]['rows'], width))
+        return self._maps[key]
+
+    def shard(self, i, fields=None):
+        """All rows of shard `i`, loaded: {field: (rows, width) array}."""
+        return {f: np.array(self.column(i, f)) for f in fields or self.fields}
+
+    def __getitem__(self, rows):
+        """{field: array} of the given global row indices (an int, slice or index array)."""
+        rows = np.arange(len(self))[rows] if isinstance(rows, slice) else np.asarray(rows, np.int64)
+        flat = np.atleast_1d(rows)
+        shard = np.searchsorted(self.offsets, flat, side='right') - 1
+        out = {}
+        for field, (dtype, width) in self.fields.items():
+            column = np.empty((len(flat), width), dtype)
+            for s in np.unique(shard).tolist():
+                sel = shard == s
+                column[sel] = self.column(s, field)[flat[sel] - self.offsets[s]]
+            out[field] = column if rows.ndim else column[0]
+        return out
+
+    def batches(self, batch_size, shuffle=True, seed=None, fields=None, window=4, drop_last=False):
+        """
+        Iterate over the dataset once in batches of `batch_size` rows.
+
+        With `shuffle`, shards come in random order, `window` of them at a
+        time are read (sequentially) into memory and their rows shuffled
+        together; rows not filling a batch carry over to the next window. So
+        memory stays at about `window` shards and every read is a whole file.
+        """
+        rng = np.random.default_rng(seed)
+        fields = list(fields or self.fields)
+        order = rng.permutation(len(self.shards)) if shuffle else np.arange(len(self.shards))
+        carry = None
+        for start in range(0, len(order), window):
+            parts = [self.shard(i, fields) for i in order[start:start + window].tolist()]
+            if carry is not None:
+                parts.insert(0, carry)
+            block = {f: np.concatenate([p[f] for p in parts]) for f in fields}
+            n = len(block[fields[0]])
+            if shuffle:
+                perm = rng.permutation(n)
+                block = {f: v[perm] for f, v in block.items()}
+            full = n - n % batch_size
+            for i in range(0, full, batch_size):
+                yield {f: v[i:i + batch_size] for f, v in block.items()}
+            carry = {f: v[full:] for f, v in block.items()}
+        if carry is not None and len(carry[fields[0]]) and not drop_last:
+            yield carry
+
+    def fill_replay_buffer(self, buffer, limit=None):
+        """
+        Add up to `limit` transitions (all by default) to an SB3 ReplayBuffer
+        with n_envs=1, in dataset order, so episodes stay contiguous. A plain
+        ReplayBuffer is written a shard at a time; other buffer classes go
+        through add(). Returns the number of transitions added.
+        """
+        if buffer.n_envs != 1:
+            raise ValueError('fill_replay_buffer needs a buffer with n_envs=1')
+        from stable_baselines3.common.buffers import ReplayBuffer
+        fast = type(buffer) is ReplayBuffer and not buffer.optimize_memory_usage
+        limit = len(self) if limit is None else min(limit, len(self))
+        added = 0
+        for i in range(len(self.shards)):
+            if added >= limit:
+                break
+            data = self.shard(i, ('obs', 'action', 'reward', 'next_obs', 'done'))
+            n = min(len(data['obs']), limit - added)
+            if fast:
+                k = 0
+                while k < n:
+                    # contiguous rows up to the end of the buffer, then wrap around
+                    m = min(buffer.buffer_size - buffer.pos, n - k)
+                    src, dst = slice(k, k + m), slice(buffer.pos, buffer.pos + m)
+                    buffer.observations[dst, 0] = data['obs'][src]
+                    buffer.next_observations[dst, 0] = data['next_obs'][src]
+                    buffer.actions[dst, 0] = data['action'][src]
+                    buffer.rewards[dst, 0] = data['reward'][src, 0]
+                    buffer.dones[dst, 0] = data['done'][src, 0]
+                    buffer.timeouts[dst, 0] = False
+                    buffer.pos += m
+                    k += m
+                    if buffer.pos == buffer.buffer_size:
+                        buffer.full, buffer.pos = True, 0
+            else:
+                no_info = [{}]
+                for r in range(n):
+                    buffer.add(data['obs'][r:r + 1], data['next_obs'][r:r + 1], data['action'][r:r + 1],
+                               data['reward'][r], data['done'][r], no_info)
+            added += n
+        return added
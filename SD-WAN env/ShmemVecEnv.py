@@ -0,0 +1,271 @@
+import multiprocessing as mp
+import os
+import pickle
+import traceback
+
+import numpy as np
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+from .Topology import Topology
+from .TrafficTrace import open_trace
+from .VecCentralizedLearning import VecSDWANEnv, VecInfos, check_actions
+
+# commands posted to the workers through the shared command slot
+_STEP, _RESET, _CALL, _CLOSE = range(4)
+# how often the parent checks that workers are alive while it waits on them
+_POLL_SECONDS = 1.0
+
+
+def _shared(ctx, shape, dtype):
+    """Zero-filled array backed by memory that forked workers share."""
+    dtype = np.dtype(dtype)
+    raw = ctx.RawArray('b', max(1, int(np.prod(shape)) * dtype.itemsize))
+    return np.frombuffer(raw, dtype, int(np.prod(shape))).reshape(shape)
+
+
+class _RemoteTraceback(Exception):
+    """The cause attached to an exception re-raised from a worker (as concurrent.futures does)."""
+
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def _remote_error(e):
+    """`e` and the current traceback, to send to the parent (`e` itself if it pickles)."""
+    try:
+        pickle.dumps(e)
+    except Exception:
+        e = RuntimeError(repr(e))
+    return e, traceback.format_exc()
+
+
+def _raise_remote(w, error):
+    e, tb = error
+    e.__cause__ = _RemoteTraceback(f'\n"""\nin ShmemVecSDWANEnv worker {w}:\n{tb}"""')
+    raise e
+
+
+def _worker(env, w, start, end, command, go, done, failed, pipe, buffers):
+    # point the block's output buffers at its rows of the shared arrays, so
+    # stepping writes results straight into memory the parent reads
+    actions, env.buf_obs, env.buf_rews, env.buf_dones, env.buf_metrics, env.buf_joint, env.buf_terminal_obs = \
+        (b[start:end] for b in buffers)
+    while True:
+        go.acquire()
+        cmd = command.value
+        if cmd == _CLOSE:
+            done.release()
+            return
+        try:
+            if cmd == _STEP:
+                env.step_async(actions)
+                env._advance()
+            elif cmd == _RESET:
+                env._seeds = pipe.recv()
+                env.reset()
+            elif cmd == _CALL:
+                name, args, kwargs = pipe.recv()
+                pipe.send((True, getattr(env, name)(*args, **kwargs)))
+        except Exception as e:
+            # report the error instead of dying with `done` unreleased; a
+            # call's reply is read right away, steps and resets set `failed`
+            # so the parent knows to read it
+            failed[w] = cmd != _CALL
+            pipe.send((False, _remote_error(e)))
+        done.release()
+
+
+class ShmemVecSDWANEnv(VecEnv):
+    """
+    VecSDWANEnv sharded over worker processes.
+
+    Each worker process runs a VecSDWANEnv over a contiguous block of the
+    `num_envs` simulations. Actions, observations, rewards, dones and the
+    per-step info fields live in shared memory; a step is one semaphore
+    release per worker and one acquire back, with nothing pickled. Info dicts
+    are rebuilt in the parent from the shared arrays. Rare calls (get_attr,
+    env_method, reset seeds) go through a pipe. Workers are forked, so this
+    needs a platform with the 'fork' start method (Linux).
+
+    An exception in a worker is re-raised in the parent with the worker's
+    traceback as its cause. A worker that dies outright (e.g. killed) is
+    noticed within _POLL_SECONDS: the others are terminated and the call
+    raises RuntimeError.
+    """
+
+    def __init__(self, num_envs=256, n_workers=None, max_steps=300, q_len=50, seed=None,
+                 topology=None, factorized_actions=False, trace=None, info_mode='full'):
+        self.topology = topology if isinstance(topology, Topology) else Topology(topology)
+        self.render_mode = None
+        n_workers = min(n_workers or os.cpu_count(), num_envs)
+        ctx = mp.get_context('fork')
+        topo = self.topology
+        action_space = topo.action_space(factorized_actions)
+
+        self._buffers = (
+            _shared(ctx, (num_envs,) + action_space.shape, np.int64),
+            _shared(ctx, (num_envs, topo.obs_size), np.float32),
+            _shared(ctx, (num_envs,), np.float32),
+            _shared(ctx, (num_envs,), bool),
+            _shared(ctx, (num_envs, len(topo.info_keys)), np.float64),
+            _shared(ctx, (num_envs,), np.int64),
+            _shared(ctx, (num_envs, topo.obs_size), np.float32),
+        )
+        self._actions, self._obs, self._rews, self._dones, self._metrics, self._joint, self._terminal_obs = \
+            self._buffers
+        self.info_mode = info_mode
+        self._infos = VecInfos(topo, self._metrics, self._joint, info_mode)
+        self._command = ctx.RawValue('i', _STEP)
+        self._done = ctx.Semaphore(0)
+        self._failed = _shared(ctx, (n_workers,), bool)
+        self._go, self._pipes, self._processes = [], [], []
+        self._blocks = np.array_split(np.arange(num_envs), n_workers)
+        trace = open_trace(trace)
+        seeds = np.random.SeedSequence(seed).spawn(n_workers)
+        for w, (block, ss) in enumerate(zip(self._blocks, seeds)):
+            env = VecSDWANEnv(len(block), max_steps, q_len, ss, topo, factorized_actions, trace)
+            # replay the same trace episodes as one VecSDWANEnv of num_envs would
+            env.trace_index, env.trace_stride = block, num_envs
+            go = ctx.Semaphore(0)
+            parent, child = ctx.Pipe()
+            p = ctx.Process(target=_worker, daemon=True,
+                            args=(env, w, block[0], block[-1] + 1, self._command, go, self._done, self._failed, child,
+                                  self._buffers))
+            p.start()
+            child.close()
+            self._go.append(go)
+            self._pipes.append(parent)
+            self._processes.append(p)
+        self.closed = False
+        self.num_envs = num_envs  # _call() needs it while VecEnv.__init__ queries render_mode
+        super().__init__(num_envs, topo.observation_space(), action_space)
+
+    def _broadcast(self, command, messages=None):
+        self._command.value = command
+        for i, go in enumerate(self._go):
+            if messages is not None:
+                self._pipes[i].send(messages[i])
+            go.release()
+        self._wait(len(self._go))
+        if self._failed.any():
+            # read every failed worker's error to keep the pipes in step
+            errors = [(w, self._recv(w)[1]) for w in np.flatnonzero(self._failed)]
+            self._failed[:] = False
+            _raise_remote(*errors[0])
+
+    def _wait(self, count):
+        """Acquire `done` once for each of `count` workers, checking they are still alive."""
+        for _ in range(count):
+            while not self._done.acquire(timeout=_POLL_SECONDS):
+                self._check_workers()
+
+    def _recv(self, w):
+        """The next message from worker `w`, checking it is still alive."""
+        pipe = self._pipes[w]
+        while not pipe.poll(_POLL_SECONDS):
+            self._check_workers()
+        try:
+            return pipe.recv()
+        except EOFError:
+            self._processes[w].join(_POLL_SECONDS)
+            self._check_workers()
+            raise
+
+    def _check_workers(self):
+        """Raise RuntimeError, after terminating the rest, if a worker process has died."""
+        for w, p in enumerate(self._processes):
+            if not p.is_alive():
+                for other in self._processes:
+                    other.terminate()
+                    other.join()
+                self.closed = True
+                block = self._blocks[w]
+                raise RuntimeError(f'ShmemVecSDWANEnv worker {w} (envs {block[0]}-{block[-1]}) died '
+                                   f'with exit code {p.exitcode}')
+
+    def reset(self):
+        if all(s is None for s in self._seeds):
+            seeds = [[None] * len(block) for block in self._blocks]
+        else:
+            seeds = [[self._seeds[i] for i in block] for block in self._blocks]
+        self._broadcast(_RESET, seeds)
+        self._reset_seeds()
+        self._reset_options()
+        return self._obs.copy()
+
+    def step_async(self, actions):
+        actions = np.asarray(actions).reshape(self._actions.shape)
+        check_actions(self.action_space, actions)
+        self._actions[:] = actions
+
+    def step_wait(self):
+        self._broadcast(_STEP)
+        infos = self._infos(self._dones, self._terminal_obs)
+        return self._obs.copy(), self._rews.copy(), self._dones.copy(), infos
+
+    def close(self):
+        if self.closed:
+            return
+        self._command.value = _CLOSE
+        for go in self._go:
+            go.release()
+        for p in self._processes:
+            p.join()
+        self.closed = True
+
+    def _call_worker(self, w, method_name, *args, **kwargs):
+        """Call a method of worker `w`'s VecSDWANEnv and return its result."""
+        self._command.value = _CALL
+        self._pipes[w].send((method_name, args, kwargs))
+        self._go[w].release()
+        ok, value = self._recv(w)
+        self._wait(1)
+        if not ok:
+            _raise_remote(w, value)
+        return value
+
+    def _call(self, indices, method_name, *args, **kwargs):
+        """Call a VecSDWANEnv method in each worker owning one of `indices`; one result per index."""
+        indices = self._get_indices(indices)
+        results = {}
+        for w, block in enumerate(self._blocks):
+            local = [i - block[0] for i in indices if block[0] <= i <= block[-1]]
+            if not local:
+                continue
+            value = self._call_worker(w, method_name, *args, indices=local, **kwargs)
+            if value is not None:
+                results.update(zip((block[0] + i for i in local), value))
+        return [results.get(i) for i in indices]
+
+    def get_state(self):
+        """Every worker's VecSDWANEnv.get_state(), as a list of bytes."""
+        return [self._call_worker(w, 'get_state') for w in range(len(self._blocks))]
+
+    def set_state(self, state):
+        """Restore a get_state() snapshot (from an env with the same envs and workers)."""
+        if len(state) != len(self._blocks):
+            raise ValueError(f'snapshot is of {len(state)} workers, this env has {len(self._blocks)}')
+        for w, worker_state in enumerate(state):
+            self._call_worker(w, 'set_state', worker_state)
+
+    def get_attr(self, attr_name, indices=None):
+        return self._call(indices, 'get_attr', attr_name)
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._call(indices, 'set_attr', attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._call(indices, 'env_method', method_name, *method_args, **method_kwargs)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+    def _get_indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
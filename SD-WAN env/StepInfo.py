@@ -0,0 +1,99 @@
+from collections.abc import MutableMapping
+from copy import deepcopy
+
+INFO_MODES = ('full', 'compact', 'lazy')
+_BUFFER_KEYS = ('joint_action', 'metrics', 'metric_keys')
+
+
+def check_info_mode(info_mode):
+    if info_mode not in INFO_MODES:
+        raise ValueError(f"info_mode must be one of {INFO_MODES}, not {info_mode!r}")
+    return info_mode
+
+
+class StepInfo(MutableMapping):
+    """
+    Info dict of one env that reads the env's metric buffers on access.
+
+    `metrics` is the env's array of per-step values in `keys` order (a row
+    of VecSDWANEnv.buf_metrics, or SDWANEnv.metrics), so stepping fills it
+    without building anything, and the same StepInfo is handed out every
+    step: read (or copy) it before the next step. Keys wrappers set, like
+    'episode' or 'terminal_observation', are kept in a plain dict that the
+    env empties at the start of each step; a value set for a metric key is
+    kept there too and read instead of the buffer until then. `joint_action`
+    is a callable returning the step's joint action, or None when it does not
+    fit an int64.
+
+    copy.copy(), copy.deepcopy() (as DummyVecEnv applies to every step's
+    infos) and pickling all give a plain dict snapshot, never the env the
+    buffers and `joint_action` belong to.
+    """
+    __slots__ = ('keys_', 'index', 'metrics', 'joint_action', 'extra')
+
+    def __init__(self, keys, index, metrics, joint_action):
+        self.keys_ = keys
+        self.index = index
+        self.metrics = metrics
+        self.joint_action = joint_action
+        self.extra = {}
+
+    def __getitem__(self, key):
+        extra = self.extra
+        if extra and key in extra:
+            return extra[key]
+        i = self.index.get(key)
+        if i is not None:
+            return float(self.metrics[i])
+        if key == 'joint_action':
+            return self.joint_action()
+        if key == 'metrics':
+            return self.metrics
+        if key == 'metric_keys':
+            return self.keys_
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        self.extra[key] = value
+
+    def __delitem__(self, key):
+        del self.extra[key]
+
+    def __iter__(self):
+        yield from self.keys_
+        yield from _BUFFER_KEYS
+        for key in self.extra:
+            if key not in self.index and key not in _BUFFER_KEYS:
+                yield key
+
+    def __len__(self):
+        shadowing = sum(key in self.index or key in _BUFFER_KEYS for key in self.extra) if self.extra else 0
+        return len(self.keys_) + len(_BUFFER_KEYS) + len(self.extra) - shadowing
+
+    def __contains__(self, key):
+        return key in self.index or key in _BUFFER_KEYS or key in self.extra
+
+    def copy(self):
+        """A plain dict snapshot, safe to keep across steps."""
+        info = dict(zip(self.keys_, self.metrics.tolist()))
+        info['joint_action'] = self.joint_action()
+        info['metrics'] = self.metrics.copy()
+        info['metric_keys'] = self.keys_
+        if self.extra:
+            info.update(self.extra)
+        return info
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        info = self.copy()
+        info['metric_keys'] = list(self.keys_)
+        info.update((key, deepcopy(value, memo)) for key, value in self.extra.items())
+        return info
+
+    def __reduce__(self):
+        return dict, (self.copy(),)
+
+    def __repr__(self):
+        return f'StepInfo({dict(self)!r})'
@@ -0,0 +1,202 @@
+from time import perf_counter
+
+import numpy as np
+
+# SDWANEnv methods timed as one phase each; _generate_requests and
+# _process_requests are timed per overlay instead (event mode runs neither,
+# its whole epoch is the 'events' phase)
+PHASES = {
+    '_draw_arrivals': 'arrivals',
+    '_run_events': 'events',
+    'calculate_individual_reward': 'reward',
+    '_get_observation': 'observation',
+}
+
+
+class StepProfiler:
+    """
+    Cumulative per-phase timings and queue statistics of an SDWANEnv.
+
+    attach() shadows the env's phase methods (and step) with timed wrappers
+    on the instance and detach() removes them again, so an env that is not
+    being profiled runs its plain methods. Besides time and call counts per
+    phase it keeps, per overlay, a histogram of the queue length after every
+    step, the requests dropped because the queue was full and the queued
+    requests that could not be served in a step.
+    """
+
+    def __init__(self, topology, q_len):
+        self.overlay_names = list(topology.overlay_names)
+        n = len(self.overlay_names)
+        self.steps = 0
+        self.step_time = 0.0
+        self.time = {}
+        self.calls = {}
+        self.queue_len_hist = np.zeros((n, q_len + 1), np.int64)
+        self.drops = np.zeros(n)
+        self.service_losses = np.zeros(n)
+
+    def _add(self, key, elapsed):
+        self.time[key] = self.time.get(key, 0.0) + elapsed
+        self.calls[key] = self.calls.get(key, 0) + 1
+
+    def attach(self, env):
+        names = self.overlay_names
+
+        def timed(name, fn):
+            def wrapper(*args):
+                start = perf_counter()
+                result = fn(*args)
+                self._add(name, perf_counter() - start)
+                return result
+            return wrapper
+
+        def generate(overlay, request_size, branch=0, fn=env._generate_requests):
+            before = env.loss[overlay]
+            start = perf_counter()
+            fn(overlay, request_size, branch)
+            self._add(f'generate_requests/{names[overlay]}', perf_counter() - start)
+            self.drops[overlay] += env.loss[overlay] - before
+
+        def process(overlay, fn=env._process_requests):
+            before = env.loss[overlay]
+            start = perf_counter()
+            comps = fn(overlay)
+            self._add(f'process_requests/{names[overlay]}', perf_counter() - start)
+            self.service_losses[overlay] += env.loss[overlay] - before
+            return comps
+
+        def step(action, fn=env.step):
+            start = perf_counter()
+            result = fn(action)
+            self.step_time += perf_counter() - start
+            self.steps += 1
+            for o, q in enumerate(env.overlay_queues):
+                self.queue_len_hist[o, len(q)] += 1
+            return result
+
+        for method, name in PHASES.items():
+            setattr(env, method, timed(name, getattr(env, method)))
+        env._generate_requests = generate
+        env._process_requests = process
+        env.step = step
+
+    @staticmethod
+    def detach(env):
+        for method in list(PHASES) + ['_generate_requests', '_process_requests', 'step']:
+            env.__dict__.pop(method, None)
+
+    def merge(self, other):
+        """Add another profiler's statistics (same topology and q_len) into this one."""
+        self.steps += other.steps
+        self.step_time += other.step_time
+        for key, t in other.time.items():
+            self.time[key] = self.time.get(key, 0.0) + t
+            self.calls[key] = self.calls.get(key, 0) + other.calls[key]
+        self.queue_len_hist += other.queue_len_hist
+        self.drops += other.drops
+        self.service_losses += other.service_losses
+        return self
+
+    def since(self, earlier):
+        """Statistics gathered after `earlier`, a copy() of this profiler taken before."""
+        window = self.copy()
+        window.steps -= earlier.steps
+        window.step_time -= earlier.step_time
+        for key, t in earlier.time.items():
+            window.time[key] -= t
+            window.calls[key] -= earlier.calls[key]
+        window.queue_len_hist -= earlier.queue_len_hist
+        window.drops -= earlier.drops
+        window.service_losses -= earlier.service_losses
+        return window
+
+    def copy(self):
+        profiler = type(self).__new__(type(self))
+        profiler.__dict__.update(self.__dict__)
+        profiler.time, profiler.calls = dict(self.time), dict(self.calls)
+        for name in ('queue_len_hist', 'drops', 'service_losses'):
+            setattr(profiler, name, getattr(self, name).copy())
+        return profiler
+
+    def summary(self):
+        """Plain-Python summary: per-phase time, calls, mean µs per call and share of step time."""
+        phases = {
+            key: {
+                'time_s': t,
+                'calls': self.calls[key],
+                'mean_us': 1e6 * t / self.calls[key],
+                'share': t / self.step_time if self.step_time else 0.0,
+            }
+            for key, t in sorted(self.time.items())
+        }
+        return {
+            'steps': self.steps,
+            'step_time_s': self.step_time,
+            'mean_step_us': 1e6 * self.step_time / self.steps if self.steps else 0.0,
+            'phases': phases,
+            'queue_len_hist': dict(zip(self.overlay_names, self.queue_len_hist.tolist())),
+            'drops': dict(zip(self.overlay_names, self.drops.tolist())),
+            'service_losses': dict(zip(self.overlay_names, self.service_losses.tolist())),
+        }
+
+
+# VecSDWANEnv methods timed as one phase each; its _advance() is the step
+VEC_PHASES = {
+    '_generate_requests': 'generate_requests',
+    '_compact': 'compact',
+    '_process_requests': 'process_requests',
+    '_get_observation': 'observation',
+}
+
+
+class VecStepProfiler(StepProfiler):
+    """
+    StepProfiler of a VecSDWANEnv. Phases are its batched methods, timed
+    per call over all envs; steps count env steps (so step_us stays per
+    env step), and drops, service losses and the queue-length histogram add
+    up over all envs.
+    """
+
+    def attach(self, env):
+        def timed(name, fn):
+            def wrapper(*args):
+                start = perf_counter()
+                result = fn(*args)
+                self._add(name, perf_counter() - start)
+                return result
+            return wrapper
+
+        loss = env.loss.sum(0)
+        generate, process = env._generate_requests, env._process_requests
+
+        def generate_requests(overlay):
+            # _advance() zeroes loss before drawing arrivals
+            generate(overlay)
+            loss[:] = env.loss.sum(0)
+            self.drops += loss
+
+        def process_requests():
+            comps = process()
+            self.service_losses += env.loss.sum(0) - loss
+            return comps
+
+        def advance(fn=env._advance):
+            start = perf_counter()
+            fn()
+            self.step_time += perf_counter() - start
+            self.steps += env.num_envs
+            n = self.queue_len_hist.shape[1]
+            cells = np.arange(len(self.overlay_names)) * n + env.queue_len.reshape(env.num_envs, -1)
+            self.queue_len_hist += np.bincount(cells.ravel(), minlength=self.queue_len_hist.size).reshape(-1, n)
+
+        env._generate_requests = generate_requests
+        env._process_requests = process_requests
+        for method, name in VEC_PHASES.items():
+            setattr(env, method, timed(name, getattr(env, method)))
+        env._advance = advance
+
+    @staticmethod
+    def detach(env):
+        for method in list(VEC_PHASES) + ['_advance']:
+            env.__dict__.pop(method, None)
@@ -0,0 +1,128 @@
+import math
+import numpy as np
+import gymnasium as gym
+
+# The two-branch / three-overlay site the environments were written for.
+# Overlays: per-step service rate (Mbps) and static latency (ms).
+# Branches: Poisson arrivals per step, mean of the Poisson flow size (in
+# 0.1 MB units), the overlays the branch may route to (its action choices,
+# in order) and its weight in the total reward. A branch's reward on its
+# overlay is bw * available capacity - loss * requests lost + comp *
+# requests completed, with the weights in 'reward_weights' (missing ones
+# default to DEFAULT_REWARD_WEIGHTS).
+DEFAULT_REWARD_WEIGHTS = {'bw': 1.0, 'loss': 1.0, 'comp': 2.0}
+
+DEFAULT_TOPOLOGY = {
+    'overlays': {
+        'Overlay1': {'service_rate': 100, 'latency': 10},
+        'Overlay2': {'service_rate': 20, 'latency': 30},
+        'Overlay3': {'service_rate': 50, 'latency': 20},
+    },
+    'branches': {
+        'A': {'arrival_rate': 9, 'flow_size_mean': 20, 'overlays': ['Overlay1', 'Overlay2'], 'weight': 0.8},
+        'B': {'arrival_rate': 6, 'flow_size_mean': 10, 'overlays': ['Overlay1', 'Overlay3'], 'weight': 0.2},
+    },
+    'congestion_threshold': 10,
+    'reward_weights': DEFAULT_REWARD_WEIGHTS,
+}
+
+
+class Topology:
+    """
+    Array view of a topology config, built once per environment.
+
+    Overlays and branches are numbered in config order. The observation is
+    [capacity, latency, loss] for every overlay followed by every overlay's
+    queue length; `obs_slices` gives where each field lives. A joint action
+    is either one choice index per branch (`MultiDiscrete`) or their
+    mixed-radix flattening with branch 0 most significant (`Discrete`), which
+    for the default topology is the original 0-3 joint action table.
+    """
+
+    def __init__(self, config=None):
+        config = DEFAULT_TOPOLOGY if config is None else config
+        self.config = config
+        overlays, branches = config['overlays'], config['branches']
+        self.overlay_names = list(overlays)
+        self.branch_names = list(branches)
+        index = {name: i for i, name in enumerate(self.overlay_names)}
+
+        self.service_rate = np.array([overlays[o]['service_rate'] for o in self.overlay_names], float)
+        self.latency = np.array([overlays[o]['latency'] for o in self.overlay_names], float)
+        self.arrival_rate = np.array([branches[b]['arrival_rate'] for b in self.branch_names], float)
+        self.flow_size_mean = np.array([branches[b]['flow_size_mean'] for b in self.branch_names], float)
+        self.weight = np.array([branches[b].get('weight', 1.0) for b in self.branch_names], float)
+        self.congestion_threshold = config.get('congestion_threshold', 10)
+        weights = config.get('reward_weights', {})
+        unknown = set(weights) - set(DEFAULT_REWARD_WEIGHTS)
+        if unknown:
+            raise ValueError(f"unknown reward weights {sorted(unknown)}; expected {sorted(DEFAULT_REWARD_WEIGHTS)}")
+        self.reward_weights = {**DEFAULT_REWARD_WEIGHTS, **weights}
+
+        self.n_choices = np.array([len(branches[b]['overlays']) for b in self.branch_names])
+        # choice_table[b, c] -> overlay index of branch b's c-th choice
+        self.choice_table = np.zeros((len(self.branch_names), self.n_choices.max()), np.int64)
+        for b, name in enumerate(self.branch_names):
+            self.choice_table[b, :self.n_choices[b]] = [index[o] for o in branches[name]['overlays']]
+        self.joint_size = math.prod(self.n_choices.tolist())
+        self._radix = self.n_choices.tolist()
+        self._branch_rows = np.arange(len(self.branch_names))
+        # joint_overlays[j] -> overlay per branch for flat joint action j,
+        # tabulated when the joint action space is small
+        self.joint_overlays = None
+        if self.joint_size <= 1 << 16:
+            self.joint_overlays = self.overlays_of(self.unravel(np.arange(self.joint_size)))
+
+        n = len(self.overlay_names)
+        self.obs_size = 4 * n
+        self.obs_slices = {
+            'available_capacity': slice(0, 3 * n, 3),
+            'latency': slice(1, 3 * n, 3),
+            'loss': slice(2, 3 * n, 3),
+            'queue_len': slice(3 * n, 4 * n),
+        }
+        self.reward_keys = tuple(f'reward_{b.lower()}' for b in self.branch_names)
+        self.bw_keys = tuple(f'bw{i}' for i in range(1, n + 1))
+        self.congested_keys = tuple(f'congested{i}' for i in range(1, n + 1))
+        self.info_keys = self.reward_keys + ('total',) + self.bw_keys + self.congested_keys
+
+    @property
+    def n_overlays(self):
+        return len(self.overlay_names)
+
+    @property
+    def n_branches(self):
+        return len(self.branch_names)
+
+    def observation_space(self):
+        return gym.spaces.Box(0, np.inf, (self.obs_size,), np.float32)
+
+    def action_space(self, factorized=False):
+        if factorized:
+            return gym.spaces.MultiDiscrete(self.n_choices)
+        if self.joint_size > np.iinfo(np.int64).max:
+            raise ValueError(f"{self.joint_size} joint actions do not fit a Discrete space; use factorized actions")
+        return gym.spaces.Discrete(self.joint_size)
+
+    def unravel(self, joint):
+        """Per-branch choices of a flat joint action (or an array of them)."""
+        if np.ndim(joint) == 0:
+            joint, choice = int(joint), [0] * self.n_branches
+            for b in range(self.n_branches - 1, -1, -1):
+                joint, choice[b] = divmod(joint, self._radix[b])
+            return choice
+        joint = np.asarray(joint, np.int64)
+        choice = np.empty(joint.shape + (self.n_branches,), np.int64)
+        for b in range(self.n_branches - 1, -1, -1):
+            joint, choice[..., b] = np.divmod(joint, self.n_choices[b])
+        return choice
+
+    def ravel(self, choice):
+        """Flat joint action of per-branch choices, or None if it would not fit in an int64."""
+        if self.joint_size > np.iinfo(np.int64).max:
+            return None
+        return np.ravel_multi_index(np.moveaxis(np.asarray(choice), -1, 0), self.n_choices)
+
+    def overlays_of(self, choice):
+        """Overlay index picked by each branch for per-branch choices (..., n_branches)."""
+        return self.choice_table[self._branch_rows, choice]
@@ -0,0 +1,183 @@
+import json
+import os
+
+import numpy as np
+
+from .Topology import Topology
+
+
+def _uint_dtype(max_value):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+class TraceWriter:
+    """
+    Appends steps of traffic to a trace directory, for generate_trace() and
+    for converting recorded traffic (FlowLogs.ingest_flow_logs).
+
+    Steps are written straight to disk as they come, so memory use does not
+    depend on the length of the trace. close() keeps only whole episodes of
+    `max_steps` steps (a trailing partial episode is cut off and reported in
+    meta.json as `dropped_tail_steps`), writes meta.json and returns the
+    opened TrafficTrace.
+
+    Files:
+      meta.json    shapes, dtypes and where the traffic came from
+      counts.bin   arrivals per (episode, step, branch)
+      sizes.bin    raw flow sizes of all arrivals, in (episode, step,
+                   branch) order; flow size = raw / size_divisor
+      offsets.bin  int64 index into sizes.bin of each (episode, step)'s first
+                   flow, plus the total at the end
+    """
+
+    def __init__(self, path, branch_names, max_steps, counts_dtype=np.uint16, sizes_dtype=np.uint32,
+                 size_divisor=10):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.branch_names = list(branch_names)
+        self.max_steps = max_steps
+        self.counts_dtype = np.dtype(counts_dtype)
+        self.sizes_dtype = np.dtype(sizes_dtype)
+        self.size_divisor = size_divisor
+        self.steps = 0
+        self.flows = 0
+        self._episode_end = (0, 0)  # (steps, flows) at the last whole episode
+        self._files = {name: open(os.path.join(path, f'{name}.bin'), 'wb') for name in ('counts', 'sizes', 'offsets')}
+        np.zeros(1, np.int64).tofile(self._files['offsets'])
+
+    def write(self, counts, sizes):
+        """
+        Append steps: `counts` (steps, branches) arrivals and `sizes` the raw
+        sizes of all of them in (step, branch) order.
+        """
+        counts = np.asarray(counts)
+        sizes = np.asarray(sizes)
+        # the unsigned casts below would wrap these silently
+        if not (np.isfinite(counts).all() and np.isfinite(sizes).all()) \
+                or counts.size and counts.min() < 0 or sizes.size and sizes.min() < 0:
+            raise ValueError('traffic has negative or non-finite counts or sizes')
+        if counts.size and counts.max() > np.iinfo(self.counts_dtype).max \
+                or sizes.size and sizes.max() > np.iinfo(self.sizes_dtype).max:
+            raise OverflowError('traffic does not fit the trace dtypes')
+        counts.astype(self.counts_dtype).tofile(self._files['counts'])
+        sizes.astype(self.sizes_dtype).tofile(self._files['sizes'])
+        # flows written by the end of each step
+        flows = self.flows + np.cumsum(counts.sum(1), dtype=np.int64)
+        flows.tofile(self._files['offsets'])
+        start = self.steps
+        self.steps += len(counts)
+        self.flows = int(flows[-1]) if len(flows) else self.flows
+        whole = self.steps - self.steps % self.max_steps
+        if whole > start:
+            self._episode_end = (whole, int(flows[whole - start - 1]))
+
+    def close(self, **meta):
+        """Cut the files to whole episodes, write meta.json (with `meta` added) and open the trace."""
+        steps, flows = self._episode_end
+        for f in self._files.values():
+            f.close()
+        b = len(self.branch_names)
+        for name, length in (('counts', steps * b * self.counts_dtype.itemsize),
+                             ('sizes', flows * self.sizes_dtype.itemsize),
+                             ('offsets', (steps + 1) * 8)):
+            os.truncate(os.path.join(self.path, f'{name}.bin'), length)
+        info = {
+            'version': 1,
+            'n_episodes': steps // self.max_steps,
+            'max_steps': self.max_steps,
+            'branches': self.branch_names,
+            'size_divisor': self.size_divisor,
+            'counts_dtype': self.counts_dtype.str,
+            'sizes_dtype': self.sizes_dtype.str,
+            'dropped_tail_steps': self.steps - steps,
+        }
+        info.update(meta)
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(info, f, indent=2)
+        return TrafficTrace(self.path)
+
+
+def generate_trace(path, n_episodes, max_steps=300, topology=None, seed=None):
+    """
+    Draw `n_episodes` episodes of traffic for `topology` and store them under
+    `path` (a directory, see TraceWriter), returning the opened TrafficTrace.
+
+    Episode e is drawn from its own Generator, spawned from
+    SeedSequence(seed), so any episode can be regenerated on its own and
+    the trace does not depend on how many episodes were drawn. Arrival
+    counts and flow sizes follow the same Poisson model SDWANEnv draws from
+    live, but a whole episode is drawn in two calls.
+    """
+    topo = topology if isinstance(topology, Topology) else Topology(topology)
+    rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(n_episodes)]
+    means = np.tile(topo.flow_size_mean, max_steps)
+
+    # Poisson draws this far above the mean do not happen (and the writer
+    # checks anyway rather than wrap around silently)
+    bound = lambda mean: int(mean + 20 * np.sqrt(mean) + 50)
+    writer = TraceWriter(path, topo.branch_names, max_steps, _uint_dtype(bound(topo.arrival_rate.max())),
+                         _uint_dtype(bound(topo.flow_size_mean.max())), size_divisor=10)
+    for rng in rngs:
+        counts = rng.poisson(topo.arrival_rate, (max_steps, topo.n_branches))
+        writer.write(counts, rng.poisson(np.repeat(means, counts.ravel())))
+    return writer.close(
+        source='poisson',
+        arrival_rate=topo.arrival_rate.tolist(),
+        flow_size_mean=topo.flow_size_mean.tolist(),
+        seed=seed if seed is None or isinstance(seed, int) else None,
+    )
+
+
+class TrafficTrace:
+    """
+    Read-only, memory-mapped traffic trace written by generate_trace().
+
+    `counts[e, t]` are the arrivals of each branch at step t of episode e and
+    `sizes[offsets[e * max_steps + t]:]` their flow sizes (raw, divide by
+    size_divisor), branch after branch. Nothing is loaded up front, so one
+    trace file can back any number of envs and worker processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        m = self.meta
+        self.n_episodes = m['n_episodes']
+        self.max_steps = m['max_steps']
+        self.branch_names = m['branches']
+        self.size_divisor = m['size_divisor']
+        shape = (self.n_episodes, self.max_steps, len(self.branch_names))
+        self.counts = np.memmap(os.path.join(path, 'counts.bin'), np.dtype(m['counts_dtype']), 'r', shape=shape)
+        self.offsets = np.memmap(os.path.join(path, 'offsets.bin'), np.int64, 'r')
+        self.sizes = np.memmap(os.path.join(path, 'sizes.bin'), np.dtype(m['sizes_dtype']), 'r')
+
+    def __len__(self):
+        return self.n_episodes
+
+    def check(self, topology, max_steps):
+        """Raise ValueError if this trace cannot drive `topology` for `max_steps`-step episodes."""
+        if self.branch_names != topology.branch_names:
+            raise ValueError(f"trace branches {self.branch_names} do not match the topology's "
+                             f"{topology.branch_names}")
+        if self.max_steps < max_steps:
+            raise ValueError(f"trace episodes have {self.max_steps} steps, the env needs {max_steps}")
+
+    def episode(self, e):
+        """
+        One episode loaded into memory: arrivals per (step, branch), the index
+        of each step's first flow (plus the total at the end) and the flow
+        sizes, already divided by size_divisor.
+        """
+        first = e * self.max_steps
+        offsets = np.array(self.offsets[first:first + self.max_steps + 1])
+        sizes = self.sizes[offsets[0]:offsets[-1]] / self.size_divisor
+        return np.array(self.counts[e], np.int64), offsets - offsets[0], sizes
+
+
+def open_trace(trace):
+    """TrafficTrace for a path, or the trace itself (None stays None)."""
+    return TrafficTrace(trace) if isinstance(trace, (str, os.PathLike)) else trace
@@ -0,0 +1,426 @@
+import numpy as np
+import gymnasium as gym
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+from .Topology import Topology
+from .TrafficTrace import open_trace
+from .StepInfo import StepInfo, check_info_mode
+from .FlowStats import FlowStats
+from .StepProfiler import VecStepProfiler
+from .CentralizedLearning import pcg64_words, set_pcg64_words
+
+# get_state() snapshot layout, as uint64 words: version, env count, overlay
+# count, queue length, trace stride, PCG64 state (6 words); then the raw
+# 8-byte elements of each _STATE_ARRAYS array in turn
+_STATE_VERSION = 1
+_STATE_ARRAYS = ('episode', '_episodes', 'step_count', 'trace_index', 'available_capacity', 'loss',
+                 'queue_len', 'tail', 'demand', 'remaining', 'arrived', 'origin')
+
+
+def build_infos(topology, metrics, joint_action, dones, terminal_obs):
+    """SB3 info dicts for one step, from the arrays VecSDWANEnv._advance fills."""
+    if topology.joint_size <= np.iinfo(np.int64).max:
+        joint = joint_action.tolist()
+    else:
+        joint = [None] * len(metrics)
+    infos = [dict(zip(topology.info_keys, m), joint_action=a) for m, a in zip(metrics.tolist(), joint)]
+    for i in np.flatnonzero(dones):
+        infos[i]['terminal_observation'] = terminal_obs[i].copy()
+        infos[i]['TimeLimit.truncated'] = False
+    return infos
+
+
+def check_actions(action_space, actions):
+    """
+    Raise IndexError for actions outside a Discrete / MultiDiscrete space,
+    as SDWANEnv.step does; the batched unravel arithmetic would otherwise
+    wrap them silently into other joint actions.
+    """
+    high = action_space.nvec if isinstance(action_space, gym.spaces.MultiDiscrete) else action_space.n
+    bad = (actions < 0) | (actions >= high)
+    if bad.any():
+        i = int(np.flatnonzero(bad.reshape(len(actions), -1).any(1))[0])
+        raise IndexError(f'action {actions[i].tolist()} of env {i} is out of range for {action_space}')
+
+
+class VecInfos:
+    """
+    Per-step SB3 info lists in any of SDWANEnv's info modes, from the
+    `metrics` and `joint_action` buffers a batched env overwrites every
+    step. 'full' builds new dicts with build_infos(); 'compact' and 'lazy'
+    hand out the same list of per-env infos every step, viewing rows of
+    `metrics` (see SDWANEnv.step), and only reset the keys wrappers added.
+    """
+
+    def __init__(self, topology, metrics, joint_action, mode='full'):
+        self.topology = topology
+        self.metrics = metrics
+        self.joint_action = joint_action
+        self.mode = check_info_mode(mode)
+        keys = topology.info_keys
+        if mode == 'compact':
+            self.infos = [{'metrics': m, 'metric_keys': keys, 'joint_action': None} for m in metrics]
+        elif mode == 'lazy':
+            index = {k: i for i, k in enumerate(keys)}
+            self.infos = [StepInfo(keys, index, m, lambda i=i: self._joint(i)) for i, m in enumerate(metrics)]
+
+    def _joint(self, i):
+        joint = int(self.joint_action[i])
+        return None if joint < 0 else joint
+
+    def __call__(self, dones, terminal_obs):
+        if self.mode == 'full':
+            return build_infos(self.topology, self.metrics, self.joint_action, dones, terminal_obs)
+        infos = self.infos
+        if self.mode == 'lazy':
+            for info in infos:
+                if info.extra:
+                    info.extra.clear()
+        else:
+            keys = self.topology.info_keys
+            for i, joint in enumerate(self.joint_action.tolist()):
+                info = infos[i]
+                if len(info) > 3:
+                    info.clear()
+                    info.update(metrics=self.metrics[i], metric_keys=keys)
+                info['joint_action'] = None if joint < 0 else joint
+        for i in np.flatnonzero(dones):
+            infos[i]['terminal_observation'] = terminal_obs[i].copy()
+            infos[i]['TimeLimit.truncated'] = False
+        return infos
+
+
+class VecSDWANEnv(VecEnv):
+    """
+    Batched version of CentralizedLearning.SDWANEnv.
+
+    Capacity, loss, queue contents and step counters for all `num_envs`
+    simulations live in arrays, so one step_wait() advances every env with a
+    handful of vectorized NumPy calls instead of N Python step loops.
+    Topology, dynamics, observation layout, rewards and info keys follow the
+    scalar env.
+    `info_mode` picks the info form as for SDWANEnv.step ('full' dicts,
+    or per-env 'compact' / 'lazy' infos reused every step).
+
+    Against DummyVecEnv(SDWANEnv) this is ~9-10x the steps/s at 64 envs and
+    ~13-14x at 256-1024: the per-queue-slot serving loop is a fixed cost per
+    step that small batches do not amortize.
+    """
+
+    def __init__(self, num_envs=64, max_steps=300, q_len=50, seed=None, topology=None,
+                 factorized_actions=False, trace=None, info_mode='full'):
+        self.max_steps = max_steps
+        self.q_len = q_len
+        self.topology = topology if isinstance(topology, Topology) else Topology(topology)
+        self.factorized_actions = factorized_actions
+        self.render_mode = None
+        topo = self.topology
+        super().__init__(
+            num_envs,
+            topo.observation_space(),
+            topo.action_space(factorized_actions),
+        )
+        self._rng = np.random.default_rng(seed)
+        n, o = num_envs, topo.n_overlays
+        self._rows = np.arange(n)
+        # per (env, branch) pair, in the order _generate_requests flattens them
+        self._pair_branch = np.tile(np.arange(topo.n_branches), n)
+        self._pair_size_mean = np.tile(topo.flow_size_mean, n)
+        # with a trace, env i plays episode trace_index[i] + k * trace_stride
+        # (mod its length) on its k-th reset, so every env gets its own
+        # workload (ShmemVecSDWANEnv sets these to the global env indices)
+        self.trace = open_trace(trace)
+        if self.trace is not None:
+            self.trace.check(topo, max_steps)
+        self.trace_index = np.arange(n)
+        self.trace_stride = n
+        self.episode = np.zeros(n, np.int64)
+        self._episodes = np.zeros(n, np.int64)
+        self.step_count = np.zeros(n, np.int64)
+        self.available_capacity = np.zeros((n, o))
+        self.loss = np.zeros((n, o))
+        # queue slot x (env, overlay) column; empty slots hold infinite demand
+        self.queue_len = np.zeros(n * o, np.int64)
+        self.tail = np.zeros(n * o, np.int64)
+        self.demand = np.full((2 * q_len, n * o), np.inf)
+        self.remaining = np.zeros((2 * q_len, n * o), np.int64)
+        # arrival step and branch of every queued request, for flow_stats
+        self.arrived = np.zeros((2 * q_len, n * o), np.int64)
+        self.origin = np.zeros((2 * q_len, n * o), np.int64)
+        self.flow_stats = None
+        self.profiler = None
+        # per-step outputs, written in place (ShmemVecSDWANEnv workers point
+        # them at shared memory)
+        self.buf_obs = np.zeros((n, topo.obs_size), np.float32)
+        self.buf_rews = np.zeros(n, np.float32)
+        self.buf_dones = np.zeros(n, bool)
+        self.buf_metrics = np.zeros((n, len(topo.info_keys)))
+        self.buf_joint = np.zeros(n, np.int64)
+        self.buf_terminal_obs = np.zeros((n, topo.obs_size), np.float32)
+        self._actions = np.zeros((n,) + self.action_space.shape, np.int64)
+        self.info_mode = info_mode
+        self._infos = VecInfos(topo, self.buf_metrics, self.buf_joint, info_mode)
+
+    # ---------------- simulation ----------------
+    def _reset_envs(self, mask):
+        if self.trace is not None:
+            self.episode[mask] = (self.trace_index[mask] + self._episodes[mask] * self.trace_stride) % len(self.trace)
+            self._episodes[mask] += 1
+        self.step_count[mask] = 0
+        self.available_capacity[mask] = self.topology.service_rate
+        self.loss[mask] = 0
+        cols = np.repeat(mask, self.topology.n_overlays)
+        self.queue_len[cols] = 0
+        self.tail[cols] = 0
+        self.demand[:, cols] = np.inf
+
+    def _compact(self):
+        """Close the holes left by completed requests, keeping FIFO order."""
+        width = int(self.tail.max())
+        demand = self.demand[:width]
+        keep = demand < np.inf
+        new_pos = np.cumsum(keep, 0) - 1
+        p, r = np.nonzero(keep)
+        moved = demand[p, r], self.remaining[p, r], self.arrived[p, r], self.origin[p, r]
+        demand[:] = np.inf
+        q = new_pos[p, r]
+        self.demand[q, r], self.remaining[q, r], self.arrived[q, r], self.origin[q, r] = moved
+        self.tail[:] = self.queue_len
+
+    def _generate_requests(self, overlay):
+        """
+        Draw (or replay from the trace) this step's arrivals for every
+        (env, branch) and append the accepted ones to the chosen overlay
+        queues; branches fill queues in order, and arrivals that find a full
+        queue are dropped as loss.
+        """
+        n, n_branches = overlay.shape
+        topo = self.topology
+        if self.trace is None:
+            counts = self._rng.poisson(topo.arrival_rate, (n, n_branches))
+        else:
+            t = self.step_count - 1
+            counts = self.trace.counts[self.episode, t].astype(np.int64)
+            # index of each (env, branch)'s first flow in the trace
+            first = self.trace.offsets[self.episode * self.trace.max_steps + t][:, None] + np.cumsum(counts, 1) - counts
+        row = self._rows[:, None] * topo.n_overlays + overlay
+        accepted = np.empty_like(counts)
+        queue_len = self.queue_len.copy()
+        loss = self.loss.reshape(-1)
+        for b in range(n_branches):
+            accepted[:, b] = np.minimum(counts[:, b], self.q_len - queue_len[row[:, b]])
+            queue_len[row[:, b]] += accepted[:, b]
+            loss[row[:, b]] += counts[:, b] - accepted[:, b]
+        total = int(accepted.sum())
+        if total == 0:
+            return
+        if (self.tail + queue_len - self.queue_len > len(self.demand)).any():
+            self._compact()
+        self.queue_len[:] = queue_len
+
+        # k-th accepted arrival of (env, branch) goes to slot start + k
+        start = np.empty_like(accepted)
+        for b in range(n_branches):
+            start[:, b] = self.tail[row[:, b]]
+            self.tail[row[:, b]] += accepted[:, b]
+        accepted, start, row = accepted.ravel(), start.ravel(), row.ravel()
+        k = np.arange(total) - np.repeat(np.cumsum(accepted) - accepted, accepted)
+        slot = np.repeat(start, accepted) + k
+        col = np.repeat(row, accepted)
+        if self.trace is None:
+            size = self._rng.poisson(np.repeat(self._pair_size_mean, accepted)) / 10
+        else:
+            size = self.trace.sizes[np.repeat(first.ravel(), accepted) + k] / self.trace.size_divisor
+        steps = np.maximum(1, np.ceil(size * 8 / topo.service_rate[col % topo.n_overlays])).astype(np.int64)
+        self.demand[slot, col] = size * 8 / steps
+        self.remaining[slot, col] = steps
+        self.arrived[slot, col] = self.step_count[col // topo.n_overlays]
+        self.origin[slot, col] = np.repeat(self._pair_branch, accepted)
+
+    def _process_requests(self):
+        """
+        Serve every queue in FIFO order: a request takes its per-step demand
+        if it still fits in the overlay's remaining capacity, otherwise it
+        counts as a loss. Queues are stored position-major, so each pass of
+        the loop serves one queue slot across all envs and overlays at once.
+        Completed requests leave an infinite-demand hole that is never served
+        and is only squeezed out by _compact() when a queue runs out of slots.
+        """
+        width = int(self.tail.max())
+        if width == 0:
+            return np.zeros((self.num_envs, self.topology.n_overlays), np.int64)
+        cap = self.available_capacity.reshape(-1)
+        demand = self.demand[:width]
+        served = np.empty(demand.shape, bool)
+        # two ufunc calls per slot dominate small batches; iterating the row
+        # views and putmask() are the cheapest pair
+        for d, s in zip(demand, served):
+            np.less_equal(d, cap, out=s)
+            np.putmask(cap, s, cap - d)
+
+        remaining = self.remaining[:width]
+        remaining -= served
+        done = served & (remaining <= 0)
+        demand[done] = np.inf
+        if self.flow_stats is not None:
+            p, r = np.nonzero(done)
+            o = r % self.topology.n_overlays
+            times = self.step_count[r // self.topology.n_overlays] - self.arrived[p, r] + 1 + self.topology.latency[o] / 1000
+            self.flow_stats.add(o, self.origin[p, r], times)
+        comps = np.count_nonzero(done, 0)
+        self.loss += (self.queue_len - np.count_nonzero(served, 0)).reshape(self.num_envs, -1)
+        self.queue_len -= comps
+        self.tail[self.queue_len == 0] = 0
+        return comps.reshape(self.num_envs, -1)
+
+    def _get_observation(self):
+        s = self.topology.obs_slices
+        self.buf_obs[:, s['available_capacity']] = self.available_capacity
+        self.buf_obs[:, s['latency']] = self.topology.latency
+        self.buf_obs[:, s['loss']] = self.loss
+        self.buf_obs[:, s['queue_len']] = self.queue_len.reshape(self.num_envs, -1)
+        return self.buf_obs
+
+    def enable_flow_stats(self, enabled=True):
+        """
+        Start (or stop) accumulating flow completion times over all envs in
+        `flow_stats`, as SDWANEnv.enable_flow_stats (no per-episode info).
+        """
+        if enabled and self.flow_stats is None:
+            self.flow_stats = FlowStats(self.topology)
+        elif not enabled:
+            self.flow_stats = None
+
+    def enable_profiling(self, enabled=True):
+        """
+        Start (or stop) collecting per-phase step timings and queue statistics
+        over all envs in `profiler`, a VecStepProfiler, as
+        SDWANEnv.enable_profiling.
+        """
+        if enabled and self.profiler is None:
+            self.profiler = VecStepProfiler(self.topology, self.q_len)
+            self.profiler.attach(self)
+        elif not enabled and self.profiler is not None:
+            self.profiler.detach(self)
+            self.profiler = None
+
+    def get_profile(self):
+        """Summary of the VecStepProfiler statistics, or None if profiling is off."""
+        return None if self.profiler is None else self.profiler.summary()
+
+    # ---------------- snapshots ----------------
+    def get_state(self):
+        """
+        The state of every simulation as flat bytes, as SDWANEnv.get_state:
+        step counters, trace positions, capacities, losses, all queues and
+        the RNG. set_state() on an env built with the same settings continues
+        exactly as this one would. The per-step buf_* outputs and flow_stats
+        are not part of it. 16 envs of the default topology take ~160 kB.
+        """
+        o = self.topology.n_overlays
+        header = np.array([_STATE_VERSION, self.num_envs, o, self.q_len, self.trace_stride,
+                           *pcg64_words(self._rng.bit_generator)], np.uint64)
+        parts = [header] + [getattr(self, name).view(np.uint64).ravel() for name in _STATE_ARRAYS]
+        return np.concatenate(parts).tobytes()
+
+    def set_state(self, state):
+        """Restore a get_state() snapshot."""
+        words = np.frombuffer(state, np.uint64)
+        version, num_envs, n_overlays, q_len, stride = words[:5].tolist()
+        if (version, num_envs, n_overlays, q_len) != (_STATE_VERSION, self.num_envs, self.topology.n_overlays,
+                                                      self.q_len):
+            raise ValueError('snapshot is from an env with other settings (or another version)')
+        self.trace_stride = stride
+        set_pcg64_words(self._rng.bit_generator, words[5:11])
+        pos = 11
+        for name in _STATE_ARRAYS:
+            array = getattr(self, name)
+            array[...] = words[pos:pos + array.size].view(array.dtype).reshape(array.shape)
+            pos += array.size
+        if pos != len(words):
+            raise ValueError(f'snapshot has {len(words) - pos} trailing words')
+
+    # ---------------- VecEnv API ----------------
+    def reset(self):
+        if any(s is not None for s in self._seeds):
+            self._rng = np.random.default_rng([s for s in self._seeds if s is not None])
+        self._reset_seeds()
+        self._reset_options()
+        self._reset_envs(np.ones(self.num_envs, bool))
+        return self._get_observation().copy()
+
+    def step_async(self, actions):
+        actions = np.asarray(actions).reshape(self._actions.shape)
+        check_actions(self.action_space, actions)
+        self._actions[:] = actions
+
+    def _advance(self):
+        """
+        Step every env with the stored actions and write the results into the
+        buf_* arrays. Finished envs are reset right away; their last
+        observation goes to buf_terminal_obs and buf_obs holds the new one.
+        """
+        topo = self.topology
+        self.step_count += 1
+        self.available_capacity[:] = topo.service_rate
+        self.loss[:] = 0
+
+        choice = self._actions if self.factorized_actions else topo.unravel(self._actions)
+        ov = topo.overlays_of(choice)
+        self._generate_requests(ov)
+        comps = self._process_requests()
+
+        rows = self._rows[:, None]
+        bw = self.available_capacity
+        w = topo.reward_weights
+        α_bw, α_loss, α_comp = w['bw'], w['loss'], w['comp']
+        rewards = α_bw * bw[rows, ov] - α_loss * self.loss[rows, ov] + α_comp * comps[rows, ov]
+        tot = rewards @ topo.weight
+
+        nb, no = topo.n_branches, topo.n_overlays
+        self.buf_metrics[:, :nb] = rewards
+        self.buf_metrics[:, nb] = tot
+        self.buf_metrics[:, nb + 1:nb + 1 + no] = bw
+        self.buf_metrics[:, nb + 1 + no:] = bw <= topo.congestion_threshold
+        joint = self._actions if not self.factorized_actions else topo.ravel(choice)
+        self.buf_joint[:] = -1 if joint is None else joint
+        self.buf_rews[:] = tot
+        self._get_observation()
+        np.greater_equal(self.step_count, self.max_steps, out=self.buf_dones)
+        if self.buf_dones.any():
+            dones = self.buf_dones
+            self.buf_terminal_obs[dones] = self.buf_obs[dones]
+            self._reset_envs(dones)
+            self._get_observation()
+
+    def step_wait(self):
+        self._advance()
+        infos = self._infos(self.buf_dones, self.buf_terminal_obs)
+        return self.buf_obs.copy(), self.buf_rews.copy(), self.buf_dones.copy(), infos
+
+    def close(self):
+        pass
+
+    def _indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+    # all envs are one simulator object: attributes and methods are shared,
+    # so a method runs once and its result is repeated for every index
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        if indices is not None and sorted(self._indices(indices)) != list(range(self.num_envs)):
+            raise ValueError(f'VecSDWANEnv attributes are shared by all envs; cannot set {attr_name!r} '
+                             f'for envs {list(self._indices(indices))} only')
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        return [result for _ in self._indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._indices(indices)]
@@ -0,0 +1,155 @@
+import threading
+
+import gymnasium as gym
+import numpy as np
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+from .IndependentLearners import PARTNER_WEIGHTS
+from .VecCentralizedLearning import VecSDWANEnv
+
+
+class BranchVecEnvs:
+    """
+    One shared VecSDWANEnv stepped jointly by one learner per branch.
+
+    `envs[branch]` is an SB3 VecEnv for that branch's learner: its actions
+    are the branch's choices, its rewards the branch's own rewards, its
+    observations the shared ones. Views run in lockstep: the simulator
+    steps once all attached views have submitted actions (step_wait blocks
+    until then), so N learners cost one simulation step per joint step and
+    learn against each other instead of against random partners. Each
+    learner therefore has to run in its own thread; train_concurrently()
+    does that. A detached view (its learner finished) is played by
+    `partner_weights` like IndependentBranchEnv's random partners, so the
+    remaining learners keep going.
+    """
+
+    def __init__(self, num_envs=16, venv=None, partner_weights=None, seed=None, **vec_kwargs):
+        self.venv = venv or VecSDWANEnv(num_envs, seed=seed, factorized_actions=True, **vec_kwargs)
+        topo = self.venv.topology
+        self.branch_names = list(topo.branch_names)
+        self.partner_weights = PARTNER_WEIGHTS if partner_weights is None else partner_weights
+        self._rng = np.random.default_rng(seed)
+        n = self.venv.num_envs
+        self._joint = np.zeros((n, topo.n_branches), np.int64)
+        self._submitted = set()
+        self._attached = set(self.branch_names)
+        self._generation = 0
+        self._cond = threading.Condition()
+        self._obs = self.venv.reset()
+        self._result = None
+        self.envs = {b: BranchVecEnv(self, i) for i, b in enumerate(self.branch_names)}
+
+    def detach(self, branch):
+        """Stop waiting for `branch`; its choices are drawn from partner_weights from now on."""
+        with self._cond:
+            self._attached.discard(branch)
+            self._submitted.discard(branch)
+            self._maybe_step()
+
+    def _partner_choices(self, b):
+        topo = self.venv.topology
+        w = self.partner_weights.get(self.branch_names[b])
+        p = None if w is None else np.divide(w, np.sum(w))
+        return self._rng.choice(int(topo.n_choices[b]), self.venv.num_envs, p=p)
+
+    def _maybe_step(self):
+        # called with the lock held: step once every attached view has submitted
+        if not self._attached or self._submitted != self._attached:
+            return
+        for b, name in enumerate(self.branch_names):
+            if name not in self._attached:
+                self._joint[:, b] = self._partner_choices(b)
+        obs, _, dones, infos = self.venv.step(self._joint)
+        nb = len(self.branch_names)
+        self._obs = obs
+        self._result = (obs, self.venv.buf_metrics[:, :nb].astype(np.float32), dones, infos)
+        self._submitted.clear()
+        self._generation += 1
+        self._cond.notify_all()
+
+    def _submit(self, b, actions):
+        with self._cond:
+            self._joint[:, b] = actions
+            self._submitted.add(self.branch_names[b])
+            generation = self._generation
+            self._maybe_step()
+            while self._generation == generation:
+                self._cond.wait()
+            return self._result
+
+    def close(self):
+        self.venv.close()
+
+
+class BranchVecEnv(VecEnv):
+    """One branch's view of a BranchVecEnvs (see there)."""
+
+    def __init__(self, core, branch_index):
+        self.core = core
+        self.branch_index = branch_index
+        self.branch = core.branch_names[branch_index]
+        self.render_mode = None
+        venv = core.venv
+        super().__init__(venv.num_envs, venv.observation_space,
+                         gym.spaces.Discrete(int(venv.topology.n_choices[branch_index])))
+        self._actions = None
+
+    def reset(self):
+        # the shared simulator auto-resets; a learner (re)starting joins the current state
+        self._reset_seeds()
+        self._reset_options()
+        return self.core._obs.copy()
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions).reshape(self.num_envs)
+
+    def step_wait(self):
+        obs, rewards, dones, infos = self.core._submit(self.branch_index, self._actions)
+        # own info dicts, since wrappers like VecMonitor write into them
+        return obs.copy(), rewards[:, self.branch_index].copy(), dones.copy(), [dict(i) for i in infos]
+
+    def close(self):
+        self.core.detach(self.branch)
+
+    def get_attr(self, attr_name, indices=None):
+        return self.core.venv.get_attr(attr_name, indices)
+
+    def set_attr(self, attr_name, value, indices=None):
+        self.core.venv.set_attr(attr_name, value, indices)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self.core.venv.env_method(method_name, *method_args, indices=indices, **method_kwargs)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return self.core.venv.env_is_wrapped(wrapper_class, indices)
+
+
+def train_concurrently(models, total_timesteps, callbacks=None, **learn_kwargs):
+    """
+    Run model.learn() for every {branch: model} in its own thread on the
+    BranchVecEnvs views the models were built with, detaching each branch
+    when its learner finishes. Exceptions from any learner are re-raised.
+    """
+    callbacks = callbacks or {}
+    errors = []
+
+    def run(branch, model):
+        try:
+            model.learn(total_timesteps, callback=callbacks.get(branch), **learn_kwargs)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            view = model.get_env()
+            while not isinstance(view, BranchVecEnv):
+                view = view.venv
+            view.core.detach(view.branch)
+
+    threads = [threading.Thread(target=run, args=item, daemon=True) for item in models.items()]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return models
@@ -0,0 +1,45 @@
+"""
+SD-WAN overlay selection environments.
+
+Names are imported from their module on first use, so `import sdwan_env`
+costs nothing and the plain simulator (SDWANEnv, traces, topologies) never
+loads stable-baselines3 or torch; only the SB3 VecEnvs and the replay
+buffer do. Modules import as usual: `from sdwan_env import IndependentLearners`.
+"""
+import importlib
+
+_EXPORTS = {
+    'SDWANEnv': 'CentralizedLearning',
+    'MODES': 'CentralizedLearning',
+    'Topology': 'Topology',
+    'DEFAULT_TOPOLOGY': 'Topology',
+    'DEFAULT_REWARD_WEIGHTS': 'Topology',
+    'TrafficTrace': 'TrafficTrace',
+    'generate_trace': 'TrafficTrace',
+    'open_trace': 'TrafficTrace',
+    'ingest_flow_logs': 'FlowLogs',
+    'FlowStats': 'FlowStats',
+    'StepInfo': 'StepInfo',
+    'RolloutDataset': 'RolloutDataset',
+    'IndependentBranchEnv': 'IndependentLearners',
+    'SDWANParallelEnv': 'IndependentLearners',
+    'VecSDWANEnv': 'VecCentralizedLearning',
+    'ShmemVecSDWANEnv': 'ShmemVecEnv',
+    'BranchVecEnvs': 'VecIndependentLearners',
+    'train_concurrently': 'VecIndependentLearners',
+    'CompactReplayBuffer': 'CompactReplayBuffer',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
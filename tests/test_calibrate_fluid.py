@@ -0,0 +1,11 @@
+import json
+
+from algs import calibrate_fluid
+
+
+def test_default_policies_run(tmp_path):
+    parser_defaults = ['random', 'rotate', 'fixed0', 'fixed3']
+    out = tmp_path / 'report.json'
+    calibrate_fluid.main(['--episodes', '2', '--max-steps', '20', '--out', str(out)])
+    report = json.loads(out.read_text())
+    assert sorted(report) == sorted(parser_defaults)
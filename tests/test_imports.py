@@ -0,0 +1,33 @@
+import ast
+import importlib
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+PACKAGES = {'sdwan_env': 'SD-WAN env', 'callbacks': 'Callbacks', 'algs': 'Algs'}
+# modules of the packages, which must not be imported by plain module name
+MODULES = {p.stem for d in PACKAGES.values() for p in (ROOT / d).glob('*.py')} - {'__init__'}
+
+
+def absolute_imports(path):
+    """(module, name or None) of every absolute import in `path`, function-level ones included."""
+    for node in ast.walk(ast.parse(path.read_text())):
+        if isinstance(node, ast.ImportFrom) and not node.level:
+            yield from ((node.module, a.name) for a in node.names)
+        elif isinstance(node, ast.Import):
+            yield from ((a.name, None) for a in node.names)
+
+
+@pytest.mark.parametrize('script', sorted(p.name for p in (ROOT / 'Algs').glob('*.py')))
+def test_script_imports_resolve(script):
+    for module, name in absolute_imports(ROOT / 'Algs' / script):
+        top = module.split('.')[0]
+        assert top not in MODULES, f'{script} imports {module} by plain module name'
+        if top not in PACKAGES:
+            continue
+        imported = importlib.import_module(module)
+        if name is not None:
+            assert hasattr(imported, name) or importlib.util.find_spec(f'{module}.{name}'), \
+                f'{script}: from {module} import {name}'